@@ -0,0 +1,349 @@
+"""
+Docstring
+---------
+Benchmarks of the hot paths of the test framework, on synthetic workloads of a chosen size:
+    ir_metrics              batch IR metrics (with @k cutoffs) over generated ranking data.
+    query_results_parsing   loading Discovery shaped responses and reading their top 3 titles and confidences.
+    title_regex             the per title regex normalization (custom_preprocess).
+    title_match_index       resolving titles through the precomputed FAQMatchIndex.
+    csv_io                  appending a discovery output to csv and reading it back.
+    parquet_io              writing a discovery output as parquet parts and reading it back.
+    embedding_cache         create_embedding for a batch of documents that are all in the embedding cache.
+    embedding_encode        encoding a batch of documents with the sentence transformer (skipped if not installed).
+
+Results are compared with benchmarks/baseline.json, which holds the timings of every benchmark per workload size, so
+that regressions in the hot paths are caught. The best time of the timed runs is compared, as it is the least affected
+by other load on the machine:
+    python -m benchmarks.run_benchmarks --size small                     run and compare with the baseline.
+    python -m benchmarks.run_benchmarks --size small --save_baseline     run and record the results as the baseline.
+The comparison exits with status 1 if a benchmark is slower than the baseline by more than the tolerance.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+BASELINE_PATH = 'benchmarks/baseline.json'
+
+# the size of each workload, by benchmark input.
+WORKLOADS = {
+    'tiny': {'queries': 1000, 'docs_per_query': 10, 'responses': 200, 'titles': 1000, 'catalog': 100,
+             'output_rows': 1000, 'documents': 200, 'repeat': 3},
+    'small': {'queries': 50000, 'docs_per_query': 20, 'responses': 5000, 'titles': 50000, 'catalog': 500,
+              'output_rows': 20000, 'documents': 5000, 'repeat': 5},
+    'medium': {'queries': 250000, 'docs_per_query': 20, 'responses': 20000, 'titles': 250000, 'catalog': 2000,
+               'output_rows': 100000, 'documents': 20000, 'repeat': 5},
+    'large': {'queries': 1000000, 'docs_per_query': 20, 'responses': 100000, 'titles': 1000000, 'catalog': 5000,
+              'output_rows': 500000, 'documents': 100000, 'repeat': 3},
+}
+
+
+def make_titles(n_titles, seed=0):
+    rng = np.random.default_rng(seed)
+    words = np.array(['How', 'do', 'I', 'set', 'up', 'my', 'Dual', 'SIM', 'phone', 'top', 'roaming', 'charges',
+                      'eSIM', 'bill', 'contract', 'upgrade', 'data', 'plan', 'cancel', 'pay'])
+    lengths = rng.integers(3, 10, size=n_titles)
+    return [' '.join(words[rng.integers(0, len(words), size=length)]) + '?' for length in lengths]
+
+
+def make_responses(n_responses, titles, seed=0):
+    rng = np.random.default_rng(seed)
+    responses = []
+    for _ in range(0, n_responses):
+        picks = rng.integers(0, len(titles), size=10)
+        confidences = np.sort(rng.random(10))[::-1]
+        responses.append({
+            'matching_results': 10,
+            'results': [{
+                'document_id': f"doc{i}",
+                'result_metadata': {'collection_id': 'benchmark', 'confidence': float(confidence)},
+                'title': titles[i] + ' | Vodafone UK',
+                'document_passages': [{'passage_text': titles[i], 'field': 'text'}]
+            } for i, confidence in zip(picks.tolist(), confidences.tolist())]
+        })
+    return responses
+
+
+def make_output_df(n_rows, seed=0):
+    titles = make_titles(200, seed)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(titles), size=(n_rows, 4))
+    return pd.DataFrame({
+        'User Input': [titles[i].lower() for i in picks[:, 0].tolist()],
+        'Correct FAQ': [titles[i] for i in picks[:, 1].tolist()],
+        'Actual FAQ returned (Top result)': [titles[i] for i in picks[:, 2].tolist()],
+        'Correct FAQ in top 3': np.where(rng.random(n_rows) < 0.8, 'Y', 'N'),
+        'Top 3 returned FAQ with Confidence Scores': [
+            {titles[a]: 0.9, titles[b]: 0.5, titles[c]: 0.1} for a, b, c in picks[:, 1:].tolist()
+        ],
+        'Associated URL': [f"https://support.vodafone.co.uk/{i}.htm" for i in picks[:, 1].tolist()]
+    })
+
+
+# each benchmark sets up its inputs and returns the function to time and the number of items it processes.
+
+def bench_ir_metrics(workload, folder):
+    from modules.information_retrieval_metrics import BatchInformationRetrievalMetrics
+    from scripts.generate_data import iter_ranking_chunks
+    df = pd.concat(iter_ranking_chunks(workload['queries'], workload['docs_per_query']), ignore_index=True)
+
+    def run():
+        metrics, _ = BatchInformationRetrievalMetrics.from_dataframe(df)
+        metrics.all_metrics()
+    return run, len(df)
+
+
+def bench_query_results_parsing(workload, folder):
+    from connectors.base_connector import SearchConnector
+
+    class GeneratedResponsesConnector(SearchConnector):
+        # answers from the generated responses, so only the parsing and the getters are timed.
+        def fetch_response(self, query, collection_ids):
+            return responses[int(query)]
+
+    responses = make_responses(workload['responses'], make_titles(workload['catalog']))
+    connector = GeneratedResponsesConnector()
+
+    def run():
+        for response in responses:
+            connector.load_response(response)
+            connector.get_title(top_k=3)
+            connector.get_result_confidence(top_k=3)
+    return run, len(responses)
+
+
+def bench_title_regex(workload, folder):
+    from scripts.run_vodafone_discovery_test import custom_preprocess
+    catalog = make_titles(workload['catalog'])
+    titles = [catalog[i] + ' | Vodafone UK' for i in np.arange(workload['titles']) % len(catalog)]
+    catalog_keys = [custom_preprocess(title) for title in catalog]
+
+    def run():
+        for title, correct in zip(titles, catalog_keys * (len(titles) // len(catalog_keys) + 1)):
+            custom_preprocess(title) == correct
+    return run, len(titles)
+
+
+def bench_title_match_index(workload, folder):
+    from modules.faq_match_index import FAQMatchIndex
+    catalog = make_titles(workload['catalog'])
+    titles = [catalog[i] + ' | Vodafone UK' for i in np.arange(workload['titles']) % len(catalog)]
+
+    def run():
+        # the index is built once per run, as in run_vodafone_test.
+        match_index = FAQMatchIndex(catalog)
+        for title, correct in zip(titles, catalog * (len(titles) // len(catalog) + 1)):
+            match_index.get_id(title) == match_index.get_id(correct)
+    return run, len(titles)
+
+
+def bench_csv_io(workload, folder):
+    from utils.files_handler import FileHandler
+    df = make_output_df(workload['output_rows'])
+    path = os.path.join(folder, 'output.csv')
+    chunk_size = 1000
+
+    def run():
+        if os.path.exists(path):
+            os.remove(path)
+        for start in range(0, len(df), chunk_size):
+            FileHandler.append_df_to_csv(df.iloc[start:start + chunk_size], path)
+        pd.read_csv(path, encoding='UTF-8')
+    return run, len(df)
+
+
+def bench_parquet_io(workload, folder):
+    from utils.files_handler import FileHandler
+    from utils.run_history import discovery_output_to_table, read_parquet_output
+    df = make_output_df(workload['output_rows'])
+    path = os.path.join(folder, 'output.parquet')
+    chunk_size = 1000
+
+    def run():
+        FileHandler.remove_parquet_parts(path, from_index=0)
+        for part, start in enumerate(range(0, len(df), chunk_size)):
+            FileHandler.write_parquet_part(discovery_output_to_table(df.iloc[start:start + chunk_size]), path, part)
+        read_parquet_output(path)
+    return run, len(df)
+
+
+def bench_embedding_cache(workload, folder):
+    from utils.embedding_funcs import EmbeddingFunctions, get_content_hash
+    documents = [f"{title} {i}" for i, title in enumerate(make_titles(workload['documents']))]
+    embedding_functions = EmbeddingFunctions(embedding_cache_path=os.path.join(folder, 'embeddings.sqlite'))
+    vectors = np.random.default_rng(0).random((len(documents), 384), dtype=np.float32)
+    embedding_functions.get_embedding_cache().set_many({
+        get_content_hash(document, 'all-MiniLM-L6-v2'): vector.tobytes()
+        for document, vector in zip(documents, vectors)
+    })
+
+    def run():
+        embedding_functions.create_embedding(documents)
+    return run, len(documents)
+
+
+def bench_embedding_encode(workload, folder):
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        return None, 0
+    from utils.embedding_funcs import EmbeddingFunctions
+    documents = make_titles(min(workload['documents'], 2000))
+    embedding_functions = EmbeddingFunctions(embedding_cache_path=None)
+    embedding_functions.create_embedding(documents[:8], use_cache=False)  # load the model before timing.
+
+    def run():
+        embedding_functions.create_embedding(documents, use_cache=False)
+    return run, len(documents)
+
+
+BENCHMARKS = {
+    'ir_metrics': bench_ir_metrics,
+    'query_results_parsing': bench_query_results_parsing,
+    'title_regex': bench_title_regex,
+    'title_match_index': bench_title_match_index,
+    'csv_io': bench_csv_io,
+    'parquet_io': bench_parquet_io,
+    'embedding_cache': bench_embedding_cache,
+    'embedding_encode': bench_embedding_encode,
+}
+
+
+def run_benchmarks(size='small', names=None, repeat=None, quiet=False):
+    """
+    Run the benchmarks on the workload of a size.
+    :param size: the workload size, one of WORKLOADS.
+    :param names: the benchmarks to run. All of them if None.
+    :param repeat: the number of timed runs of each benchmark. Defaults to the repeat of the workload.
+    :param quiet: do not print the results as they come.
+    :return: dict of benchmark name to its median and best time in seconds, items processed and items per second.
+    """
+    workload = WORKLOADS[size]
+    repeat = repeat if repeat is not None else workload['repeat']
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for name in names if names is not None else BENCHMARKS:
+            run, items = BENCHMARKS[name](workload, folder)
+            if run is None:
+                if not quiet:
+                    print(f"{name:<24} skipped")
+                continue
+            run()  # warm up caches and lazy imports.
+            timings = []
+            # like timeit, collect garbage before and not during the timed runs, so timings do not depend on what
+            # earlier benchmarks left in memory.
+            gc.collect()
+            gc.disable()
+            try:
+                for _ in range(0, repeat):
+                    start = time.perf_counter()
+                    run()
+                    timings.append(time.perf_counter() - start)
+            finally:
+                gc.enable()
+            median = statistics.median(timings)
+            results[name] = {
+                'median_s': round(median, 6),
+                'min_s': round(min(timings), 6),
+                'items': items,
+                'items_per_s': round(items / median, 1) if median > 0 else None
+            }
+            if not quiet:
+                print(f"{name:<24}{median * 1000:>12.2f} ms{results[name]['items_per_s']:>16,.0f} items/s")
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_baseline(results, size, path=BASELINE_PATH):
+    """
+    Record results as the baseline of a workload size, keeping the baselines of the other sizes.
+    """
+    baseline = load_baseline(path)
+    baseline[size] = {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'system': platform.system()
+        },
+        'results': results
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=4, sort_keys=True)
+        f.write('\n')
+
+
+def compare_with_baseline(results, baseline_results, tolerance=0.5):
+    """
+    Compare results with baseline results.
+    :param results: the results of run_benchmarks.
+    :param baseline_results: the results recorded in the baseline.
+    :param tolerance: the slowdown allowed before a benchmark is a regression, 0.5 allows 50% slower.
+    :return: dict of benchmark name to its best time relative to the baseline, and the names of the regressions.
+    """
+    ratios = {}
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline_results:
+            continue
+        ratio = result['min_s'] / baseline_results[name]['min_s']
+        ratios[name] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return ratios, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run the benchmarks and compare them with the baseline")
+    parser.add_argument('--size', type=str, choices=list(WORKLOADS), default='small')
+    parser.add_argument('--only', type=str, nargs='+', choices=list(BENCHMARKS), default=None,
+                        help="only run these benchmarks.")
+    parser.add_argument('--repeat', type=int, default=None, help="number of timed runs of each benchmark.")
+    parser.add_argument('--save_baseline', action='store_true', help="record the results as the baseline.")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="slowdown relative to the baseline reported as a regression.")
+    parser.add_argument('--baseline_path', type=str, default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+
+    print(f"Running benchmarks on the '{args.size}' workload.")
+    results = run_benchmarks(size=args.size, names=args.only, repeat=args.repeat)
+
+    if args.save_baseline:
+        save_baseline(results, args.size, args.baseline_path)
+        print(f"Saved baseline to {args.baseline_path}")
+        return 0
+
+    baseline = load_baseline(args.baseline_path).get(args.size)
+    if baseline is None:
+        print(f"No '{args.size}' baseline in {args.baseline_path}, run with --save_baseline to record one.")
+        return 0
+
+    ratios, regressions = compare_with_baseline(results, baseline['results'], args.tolerance)
+    print(f"\n{'benchmark':<24}{'vs baseline':>12}")
+    for name, ratio in ratios.items():
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f"{name:<24}{ratio:>11.2f}x{flag}")
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}.")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
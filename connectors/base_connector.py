@@ -0,0 +1,197 @@
+"""
+Docstring
+---------
+Base class shared by the search connectors. A connector fetches Discovery shaped response json packets, i.e.
+{'results': [{'document_id', 'title', 'result_metadata': {'confidence'}, 'document_passages', ...}]}, and the getters
+read the loaded response through a QueryResults view, so every search backend can be used by the test scripts in the
+same way.
+"""
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import List
+from utils.dispatch import dispatch_ordered
+
+
+class QueryResults:
+
+    def __init__(self, response: dict):
+        """
+        A struct-of-arrays view of the results of a query response, built in a single pass over response['results'].
+        Values that are missing from a result are stored as None (nan for confidences) and flagged in the presence
+        mask of their key.
+        :param response: the response json packet.
+        """
+        results = response['results']
+        n_results = len(results)
+        self.n_results = n_results
+        self.__results = results
+
+        self.titles = [None] * n_results
+        self.document_ids = [None] * n_results
+        self.passages = [None] * n_results
+        self.result_metadata = [None] * n_results
+        self.confidences = np.full(n_results, np.nan)
+        self.present = {
+            key: np.zeros(n_results, dtype=bool)
+            for key in ['title', 'document_id', 'document_passages', 'result_metadata', 'confidence']
+        }
+        self.__columns = {}
+
+        for i, result in enumerate(results):
+            if 'title' in result:
+                self.titles[i] = result['title']
+                self.present['title'][i] = True
+            if 'document_id' in result:
+                self.document_ids[i] = result['document_id']
+                self.present['document_id'][i] = True
+            if 'document_passages' in result:
+                self.passages[i] = result['document_passages']
+                self.present['document_passages'][i] = True
+            if 'result_metadata' in result:
+                metadata = result['result_metadata']
+                self.result_metadata[i] = metadata
+                self.present['result_metadata'][i] = True
+                if 'confidence' in metadata:
+                    self.confidences[i] = metadata['confidence']
+                    self.present['confidence'][i] = True
+
+    def get_column(self, key: str, top_k: int = None):
+        """
+        Get the values of any other key of the results, for instance 'subtitle', 'text' or 'table'. The column is
+        extracted on first use and kept for later calls.
+        :param key: the key to be searched for in the results.
+        :param top_k: only return the values of the top k results.
+        :return: List of values, None where a result has no value for the key.
+        """
+        if key not in self.__columns:
+            self.__columns[key] = [result.get(key) for result in self.__results]
+            self.present[key] = np.array([key in result for result in self.__results], dtype=bool)
+        return self.__columns[key][:top_k]
+
+    def __len__(self):
+        return self.n_results
+
+
+class SearchConnector(ABC):
+
+    def __init__(self):
+        """
+        Search connector base class. Subclasses implement 'fetch_response', and may override 'fetch_responses' with a
+        faster way to answer many queries at once.
+        """
+        self.response = None  # to be reassigned with response json packet.
+        self.results = None  # to be reassigned with the parsed QueryResults view of the response.
+
+    @abstractmethod
+    def fetch_response(self, query, collection_ids: List[str]):
+        """Fetch the query results without storing them on the connector.
+        :param query: The query used for search.
+        :param collection_ids: the set of collections to send the query request to.
+        :return: the response json packet."""
+
+    def fetch_responses(self, queries: List[str], collection_ids: List[str], max_in_flight=8):
+        """Fetch the results of many queries. By default the queries are sent concurrently through 'fetch_response'.
+        :param queries: the queries used for search.
+        :param collection_ids: the set of collections to send the query requests to.
+        :param max_in_flight: the maximum number of queries sent at the same time.
+        :return: List of response json packets (or the exception raised for a query), ordered as the queries."""
+        return dispatch_ordered(
+            func=lambda query: self.fetch_response(query=query, collection_ids=collection_ids),
+            items=queries,
+            max_in_flight=max_in_flight
+        )
+
+    def query_response(self, query, collection_ids: List[str]):
+        """Query results from Discovery collections.
+        :param query: The query used for search.
+        :param collection_ids: the set of collections to send the query request to."""
+
+        self.load_response(self.fetch_response(query=query, collection_ids=collection_ids))
+
+    def load_response(self, response):
+        """Load a response json packet, for instance one returned by 'fetch_response', so that the getters can be
+        used on it. The results are parsed once into a QueryResults view that all the getters read from.
+        :param response: the response json packet."""
+        self.response = response
+        self.results = QueryResults(response)
+
+    def __get_results(self):
+        """
+        A hidden method that fetches the parsed results of running the query.
+        :return: the QueryResults view of the response.
+        """
+        assert self.response is not None, "Please run the 'get_query_response' method before using this method."
+        return self.results
+
+    def get_presence_mask(self, key: str, top_k: int = None):
+        """
+        A function that flags which results have a value for a key.
+        :param key: one of 'title', 'document_id', 'confidence', 'document_passages' or 'result_metadata'.
+        :param top_k: only return the mask for the top k results.
+        :return: numpy bool array.
+        """
+        return self.__get_results().present[key][:top_k]
+
+    def get_result_metadata(self, top_k: int = None):
+        """
+        A function that grabs the result metadata from the results of the query response.
+        :param top_k: only return the result metadata of the top k results.
+        :return: List[result metadata]
+        """
+        return self.__get_results().result_metadata[:top_k]
+
+    def get_document_ids(self, top_k: int = None):
+        """
+        A function that grabs the document ids from the results of the query response.
+        :param top_k: only return the document ids of the top k results.
+        :return: List[document ids]
+        """
+        return self.__get_results().document_ids[:top_k]
+
+    def get_result_confidence(self, top_k: int = None):
+        """
+        A function that grabs the confidence scores from result metadata of the query response result.
+        :param top_k: only return the confidence scores of the top k results.
+        :return: List[confidence scores], nan where a result has no confidence.
+        """
+        return self.__get_results().confidences[:top_k].tolist()
+
+    def get_title(self, top_k: int = None):
+        """
+        A function that grabs the titles from the results of the query response.
+        :param top_k: only return the titles of the top k results.
+        :return: List[titles]
+        """
+        return self.__get_results().titles[:top_k]
+
+    def get_subtitle(self, top_k: int = None):
+        """
+        A function that grabs the subtitles from the results of the query response.
+        :param top_k: only return the subtitles of the top k results.
+        :return: List[subtitles]
+        """
+        return self.__get_results().get_column('subtitle', top_k=top_k)
+
+    def get_document_passages(self, top_k: int = None):
+        """
+        A function that grabs the document passages from the results of the query response.
+        :param top_k: only return the passages of the top k results.
+        :return: List[passages]
+        """
+        return self.__get_results().passages[:top_k]
+
+    def get_text(self, top_k: int = None):
+        """
+        A function that grabs the text from the results of the query response.
+        :param top_k: only return the text of the top k results.
+        :return: List[text]
+        """
+        return self.__get_results().get_column('text', top_k=top_k)
+
+    def get_table(self, top_k: int = None):
+        """
+        A function that grabs the table data from the results of the query response.
+        :param top_k: only return the table data of the top k results.
+        :return: List[table]
+        """
+        return self.__get_results().get_column('table', top_k=top_k)
@@ -0,0 +1,358 @@
+"""
+Docstring
+---------
+An in-process BM25 search backend, used as a lexical baseline and as a fast offline replacement for Watson Discovery.
+The index is a compact inverted index: the vocabulary, and for each term a contiguous slice of document ids with the
+BM25 weight of the term in that document, precomputed at build time. Scoring a query only adds up the weights of its
+terms. The index is saved to a single .npz file that loads without parsing any text. Strings are stored as one utf-8
+buffer with offsets rather than as fixed width arrays, which would pad every text to the length of the longest one.
+"""
+import os
+import re
+import numpy as np
+import pandas as pd
+from typing import List
+from connectors.base_connector import SearchConnector
+from utils.files_handler import FileHandler
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class StringArray:
+
+    def __init__(self, buffer, offsets):
+        """
+        Array of strings stored as one utf-8 buffer, string i being the bytes offsets[i]:offsets[i + 1]. Build it with
+        StringArray.from_strings.
+        :param buffer: uint8 array of the concatenated utf-8 strings.
+        :param offsets: int64 array of the n + 1 string boundaries in the buffer.
+        """
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        """
+        :param strings: iterable of strings, None is stored as an empty string.
+        :return: StringArray.
+        """
+        encoded = [('' if string is None else str(string)).encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.array([len(string) for string in encoded], dtype=np.int64), out=offsets[1:])
+        return cls(buffer=np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets=offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def tolist(self):
+        data = self.buffer.tobytes()
+        offsets = self.offsets.tolist()
+        return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+# the string arrays of a saved index, each saved as a '_buffer' and an '_offsets' array.
+STRING_ARRAYS = ['vocabulary', 'titles', 'texts', 'document_ids', 'urls']
+
+
+class BM25Index:
+
+    def __init__(self, vocabulary, postings_offsets, postings_documents, postings_weights, idf, titles, texts,
+                 document_ids, urls, k1=1.2, b=0.75, source=''):
+        """
+        BM25 index class. Build it with BM25Index.build or BM25Index.load rather than directly.
+        :param vocabulary: StringArray of the index terms, sorted.
+        :param postings_offsets: the postings of term i are the rows postings_offsets[i]:postings_offsets[i + 1].
+        :param postings_documents: the document of each posting.
+        :param postings_weights: the BM25 weight of the term in the document of each posting.
+        :param idf: the inverse document frequency of each term.
+        :param titles: StringArray of the title of each document.
+        :param texts: StringArray of the text of each document.
+        :param document_ids: StringArray of the id of each document.
+        :param urls: StringArray of the url of each document.
+        :param k1: the BM25 term frequency saturation.
+        :param b: the BM25 document length normalisation.
+        :param source: a description of what the index was built from, used to know when it is out of date.
+        """
+        self.vocabulary = vocabulary
+        self.postings_offsets = postings_offsets
+        self.postings_documents = postings_documents
+        self.postings_weights = postings_weights
+        self.idf = idf
+        self.titles = titles
+        self.texts = texts
+        self.document_ids = document_ids
+        self.urls = urls
+        self.k1 = k1
+        self.b = b
+        self.source = source
+        self.term_ids = {term: i for i, term in enumerate(vocabulary.tolist())}
+
+    @classmethod
+    def build(cls, titles: List[str], texts: List[str] = None, document_ids: List[str] = None, urls: List[str] = None,
+              k1=1.2, b=0.75, source=''):
+        """
+        Build an index over documents. The title and the text of a document are indexed together.
+        :param titles: the title of each document.
+        :param texts: the text of each document. Defaults to no text.
+        :param document_ids: the id of each document. Defaults to the row number.
+        :param urls: the url of each document. Defaults to empty urls.
+        :return: BM25Index.
+        """
+        n_documents = len(titles)
+        texts = list(texts) if texts is not None else [''] * n_documents
+        document_ids = [str(i) for i in range(0, n_documents)] if document_ids is None else list(document_ids)
+        urls = list(urls) if urls is not None else [''] * n_documents
+
+        # count the terms of every document.
+        term_ids = {}
+        posting_terms = []
+        posting_documents = []
+        posting_counts = []
+        document_lengths = np.zeros(n_documents, dtype=np.float32)
+        for document, (title, text) in enumerate(zip(titles, texts)):
+            tokens = tokenize(title) + tokenize(text)
+            document_lengths[document] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                posting_terms.append(term_ids.setdefault(token, len(term_ids)))
+                posting_documents.append(document)
+                posting_counts.append(count)
+
+        # renumber the terms in sorted order and group the postings by term.
+        vocabulary = StringArray.from_strings(sorted(term_ids))
+        sorted_ids = np.empty(len(term_ids), dtype=np.int64)
+        sorted_ids[[term_ids[term] for term in vocabulary.tolist()]] = np.arange(len(term_ids))
+        posting_terms = sorted_ids[np.array(posting_terms, dtype=np.int64)]
+        order = np.argsort(posting_terms, kind='stable')
+        posting_terms = posting_terms[order]
+        posting_documents = np.array(posting_documents, dtype=np.int32)[order]
+        posting_counts = np.array(posting_counts, dtype=np.float32)[order]
+        document_frequency = np.bincount(posting_terms, minlength=len(vocabulary))
+        postings_offsets = np.concatenate([[0], np.cumsum(document_frequency)]).astype(np.int64)
+
+        # precompute the BM25 weight of every posting.
+        idf = np.log(1 + (n_documents - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        average_length = document_lengths.mean() if n_documents > 0 else 0.0
+        length_norm = k1 * (1 - b + b * document_lengths[posting_documents] / max(average_length, 1e-12))
+        postings_weights = idf[posting_terms] * posting_counts * (k1 + 1) / (posting_counts + length_norm)
+
+        return cls(
+            vocabulary=vocabulary,
+            postings_offsets=postings_offsets,
+            postings_documents=posting_documents,
+            postings_weights=postings_weights.astype(np.float32),
+            idf=idf,
+            titles=StringArray.from_strings(titles),
+            texts=StringArray.from_strings(texts),
+            document_ids=StringArray.from_strings(document_ids),
+            urls=StringArray.from_strings(urls),
+            k1=k1,
+            b=b,
+            source=source
+        )
+
+    def save(self, path):
+        """
+        Save the index to a .npz file.
+        :param path: the path of the file.
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # write to a temporary file first so that a reader never sees a partial index.
+        temp_path = path + '.tmp.npz'
+        string_arrays = {}
+        for name in STRING_ARRAYS:
+            string_arrays[f"{name}_buffer"] = getattr(self, name).buffer
+            string_arrays[f"{name}_offsets"] = getattr(self, name).offsets
+        np.savez(
+            temp_path,
+            postings_offsets=self.postings_offsets,
+            postings_documents=self.postings_documents,
+            postings_weights=self.postings_weights,
+            idf=self.idf,
+            **string_arrays,
+            parameters=np.array([self.k1, self.b], dtype=np.float64),
+            source=np.array(self.source, dtype=str)
+        )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with save.
+        :param path: the path of the file.
+        :return: BM25Index.
+        """
+        with np.load(path) as data:
+            k1, b = data['parameters'].tolist()
+            string_arrays = {}
+            for name in STRING_ARRAYS:
+                string_arrays[name] = StringArray(buffer=data[f"{name}_buffer"], offsets=data[f"{name}_offsets"])
+            return cls(
+                postings_offsets=data['postings_offsets'],
+                postings_documents=data['postings_documents'],
+                postings_weights=data['postings_weights'],
+                idf=data['idf'],
+                **string_arrays,
+                k1=k1,
+                b=b,
+                source=str(data['source'])
+            )
+
+    def __len__(self):
+        return len(self.titles)
+
+    def score(self, query):
+        """
+        Score every document against a query.
+        :param query: the query text.
+        :return: the BM25 score of each document and the highest score any document could get for the query.
+        """
+        term_ids = [self.term_ids[token] for token in tokenize(query) if token in self.term_ids]
+        if not term_ids:
+            return np.zeros(len(self), dtype=np.float32), 0.0
+        slices = [slice(self.postings_offsets[i], self.postings_offsets[i + 1]) for i in term_ids]
+        documents = np.concatenate([self.postings_documents[s] for s in slices])
+        weights = np.concatenate([self.postings_weights[s] for s in slices])
+        scores = np.bincount(documents, weights=weights, minlength=len(self)).astype(np.float32)
+        # the weight of a term in a document is at most idf * (k1 + 1).
+        max_score = float(self.idf[term_ids].sum() * (self.k1 + 1))
+        return scores, max_score
+
+    def search(self, queries: List[str], top_k=10):
+        """
+        Find the top k documents of each query.
+        :param queries: the query texts.
+        :param top_k: the number of documents to return per query.
+        :return: List of (document indices, scores, max score) per query, highest score first. Documents that share no
+        term with the query are not returned.
+        """
+        results = []
+        for query in queries:
+            scores, max_score = self.score(query)
+            k = min(top_k, int(np.count_nonzero(scores)))
+            if k == 0:
+                results.append((np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), max_score))
+                continue
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            results.append((top, scores[top], max_score))
+        return results
+
+
+class BM25Connector(SearchConnector):
+
+    def __init__(self, index: BM25Index = None, count=None):
+        """
+        BM25 connector class. Without an index, the index configured in the BM25 section of the config is loaded, or
+        built from the configured corpus file and saved if it is missing or out of date.
+        :param index: the BM25Index to search.
+        :param count: the number of results returned per query. Defaults to the BM25 count in the config.
+        """
+        super().__init__()
+
+        file_handler = FileHandler()
+        file_handler.get_config(config_file_name='elasticsearch_config')
+        self.config = file_handler.config
+        self.bm25_config = self.config['BM25']
+        self.test_query = self.config['TEST_QUERY']
+
+        self.count = count if count is not None else self.bm25_config['count']
+        self.characters = self.config['WATSON_DISCOVERY_V2']['passages']['characters']
+        self.index = index if index is not None else self.get_index(
+            corpus_file=self.bm25_config['corpus_file'],
+            index_path=self.bm25_config['index_path'],
+            k1=self.bm25_config['k1'],
+            b=self.bm25_config['b']
+        )
+
+    @staticmethod
+    def get_index(corpus_file, index_path, k1=1.2, b=0.75):
+        """
+        Load the saved index of a corpus file, rebuilding it if the corpus file or the BM25 parameters changed.
+        :param corpus_file: a test case csv with 'Correct FAQ' and 'Associated URL' columns.
+        :param index_path: the path of the saved index.
+        :return: BM25Index.
+        """
+        stat = os.stat(corpus_file)
+        source = f"{os.path.abspath(corpus_file)}:{stat.st_size}:{stat.st_mtime_ns}:{k1}:{b}"
+        if os.path.exists(index_path):
+            index = BM25Index.load(index_path)
+            if index.source == source:
+                return index
+
+        index = BM25Connector.build_index_from_file(corpus_file, k1=k1, b=b, source=source)
+        index.save(index_path)
+        print(f"Built BM25 index of {len(index)} FAQs from {corpus_file}.")
+        return index
+
+    @staticmethod
+    def build_index_from_file(corpus_file, k1=1.2, b=0.75, source=''):
+        """
+        Build an index over the unique FAQ titles of a test case file, with their urls.
+        """
+        df = pd.read_csv(corpus_file, encoding='utf-8')
+        df = df[['Correct FAQ', 'Associated URL']].dropna().drop_duplicates(subset='Correct FAQ')
+        titles = df['Correct FAQ'].to_list()
+        return BM25Index.build(titles=titles, urls=df['Associated URL'].to_list(), k1=k1, b=b, source=source)
+
+    @staticmethod
+    def build_index_from_collection(collection, title_key='title', k1=1.2, b=0.75):
+        """
+        Build an index over a collection loaded with EmbeddingFunctions.get_collection_from_file. The title of a
+        document is read from its metadata, falling back to the first line of its text.
+        :param collection: List of langchain Documents.
+        """
+        texts = [document.page_content for document in collection]
+        titles = [document.metadata.get(title_key) or text.strip().split('\n')[0][:100]
+                  for document, text in zip(collection, texts)]
+        urls = [document.metadata.get('source', '') for document in collection]
+        return BM25Index.build(titles=titles, texts=texts, urls=urls, k1=k1, b=b)
+
+    def __to_response(self, documents, scores, max_score, collection_id):
+        results = []
+        for i, score in zip(documents.tolist(), scores.tolist()):
+            text = self.index.texts[i] or self.index.titles[i]
+            results.append({
+                'document_id': str(self.index.document_ids[i]),
+                'result_metadata': {
+                    'document_retrieval_source': 'bm25',
+                    'collection_id': collection_id,
+                    # scaled by the best score possible for the query, so confidences fall between 0 and 1.
+                    'confidence': round(score / max_score, 5) if max_score > 0 else 0.0
+                },
+                'title': str(self.index.titles[i]),
+                'url': str(self.index.urls[i]),
+                'document_passages': [{'passage_text': str(text)[:self.characters], 'field': 'text'}]
+            })
+        return {'matching_results': len(results), 'results': results}
+
+    def fetch_response(self, query, collection_ids: List[str]):
+        """Search the index for a query.
+        :param query: The query used for search.
+        :param collection_ids: only used to fill in the collection_id of the results.
+        :return: the response json packet."""
+        return self.fetch_responses([query], collection_ids=collection_ids)[0]
+
+    def fetch_responses(self, queries: List[str], collection_ids: List[str], max_in_flight=None):
+        """Search the index for all the queries.
+        :param queries: the queries used for search.
+        :param collection_ids: only used to fill in the collection_id of the results.
+        :param max_in_flight: unused, the search runs in process.
+        :return: List of response json packets, ordered as the queries."""
+        collection_id = collection_ids[0] if collection_ids else 'bm25'
+        return [
+            self.__to_response(documents, scores, max_score, collection_id)
+            for documents, scores, max_score in self.index.search(queries, top_k=self.count)
+        ]
@@ -0,0 +1,188 @@
+"""
+Docstring
+---------
+Shared Watson Discovery V2 clients. Every connector (and every worker thread) in a process that uses the same
+credentials gets the same DiscoveryV2 client, so IAM tokens and keep-alive TLS connections are reused instead of
+being set up again per connector. The connection pool of the client is sized for the number of queries in flight, and
+IAM access tokens are kept in a token cache file that survives process restarts until the token expires, so a new run
+does not wait on a token exchange before its first query.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from ibm_watson import DiscoveryV2
+from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+from ibm_cloud_sdk_core.http_adapter import SSLHTTPAdapter
+from ibm_cloud_sdk_core.token_managers.iam_token_manager import IAMTokenManager
+from utils.files_handler import FileHandler, load_environment
+
+
+# shared clients by their connection settings.
+_clients = {}
+_clients_lock = threading.Lock()
+# token managers of different clients can share a token cache file, their writes are serialized in the process.
+_token_cache_lock = threading.Lock()
+
+
+class PersistentIAMTokenManager(IAMTokenManager):
+
+    def __init__(self, apikey, url=None, token_cache_path=None, **kwargs):
+        """
+        IAM token manager that stores the access tokens it fetches in a token cache file, and starts from the cached
+        token of the same api key if it has not expired. The file is only readable by its owner.
+        :param apikey: the IAM api key.
+        :param url: the IAM url. Defaults to the IBM Cloud IAM url.
+        :param token_cache_path: the path of the token cache file. Tokens are only kept in memory if None.
+        """
+        super().__init__(apikey, url=url, **kwargs)
+        self.token_cache_path = token_cache_path
+        # tokens are stored under a hash of the api key and IAM url, never under the api key itself.
+        self.cache_key = hashlib.sha256(f"{self.url}\n{apikey}".encode('utf-8')).hexdigest()
+        self.load_cached_token()
+
+    def __read_token_cache(self):
+        try:
+            with open(self.token_cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def load_cached_token(self):
+        """
+        Start from the cached access token of the api key, if there is one that has not expired.
+        :return: True if a cached token was loaded.
+        """
+        if not self.token_cache_path:
+            return False
+        cached = self.__read_token_cache().get(self.cache_key)
+        if cached is None:
+            return False
+
+        self.access_token = cached['access_token']
+        self.expire_time = cached['expire_time']
+        self.refresh_time = cached['refresh_time']
+        if self._is_token_expired():
+            self.access_token = None
+            self.expire_time = 0
+            self.refresh_time = 0
+            return False
+        return True
+
+    def _save_token_info(self, token_response: dict) -> None:
+        super()._save_token_info(token_response)
+        if self.token_cache_path:
+            self.save_cached_token()
+
+    def save_cached_token(self):
+        """
+        Write the current access token to the token cache file, dropping the expired tokens of other api keys.
+        """
+        folder = os.path.dirname(self.token_cache_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        with _token_cache_lock:
+            now = time.time()
+            token_cache = {key: cached for key, cached in self.__read_token_cache().items()
+                           if cached['expire_time'] > now}
+            # only the access token is kept, the refresh token is not needed to reuse it.
+            token_cache[self.cache_key] = {
+                'access_token': self.access_token,
+                'expire_time': self.expire_time,
+                'refresh_time': self.refresh_time
+            }
+            # write to a uniquely named temporary file, created owner-only next to the cache file, then swap it in, so
+            # readers never see a partial file.
+            fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.token_cache_path) + '.', suffix='.tmp',
+                                             dir=folder or '.')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(token_cache, f)
+                os.replace(temp_path, self.token_cache_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+
+def get_client_config():
+    """
+    :return: the DISCOVERY_CLIENT settings of the config, with the pool size defaulting to the DISPATCH
+    max_in_flight.
+    """
+    file_handler = FileHandler()
+    file_handler.get_config(config_file_name='elasticsearch_config')
+    client_config = dict(file_handler.config.get('DISCOVERY_CLIENT') or {})
+    if not client_config.get('pool_size'):
+        client_config['pool_size'] = file_handler.config['DISPATCH']['max_in_flight']
+    return client_config
+
+
+def get_discovery_client(query_timeout=None, pool_size=None, token_cache_path=None):
+    """
+    Get the shared DiscoveryV2 client of the credentials in the environment (or .env):
+        WATSON_DISCOVERY_APIKEY, WATSON_DISCOVERY_VERSION, WATSON_DISCOVERY_URL
+        WATSON_DISCOVERY_IAM_URL    optional, for instance to authenticate against a local stand-in server.
+    The client is created on the first call and reused by later calls with the same settings. It is safe to use from
+    several threads at once.
+    :param query_timeout: seconds to wait on a single request. No timeout if None.
+    :param pool_size: the number of keep-alive connections kept open to the service, which should be at least the
+    number of queries in flight. Defaults to the DISCOVERY_CLIENT pool_size in the config.
+    :param token_cache_path: the path of the IAM token cache file. Defaults to the DISCOVERY_CLIENT token_cache_path
+    in the config, tokens are only kept in memory if it is empty.
+    :return: the DiscoveryV2 client.
+    """
+    load_environment()
+    if pool_size is None or token_cache_path is None:
+        client_config = get_client_config()
+        pool_size = pool_size if pool_size is not None else client_config['pool_size']
+        token_cache_path = token_cache_path if token_cache_path is not None else client_config.get('token_cache_path')
+
+    apikey = os.environ['WATSON_DISCOVERY_APIKEY']
+    iam_url = os.environ.get('WATSON_DISCOVERY_IAM_URL')
+    client_key = (
+        os.environ['WATSON_DISCOVERY_URL'],
+        os.environ['WATSON_DISCOVERY_VERSION'],
+        hashlib.sha256(apikey.encode('utf-8')).hexdigest(),
+        iam_url,
+        query_timeout,
+        pool_size,
+        token_cache_path
+    )
+
+    with _clients_lock:
+        client = _clients.get(client_key)
+        if client is None:
+            authenticator = IAMAuthenticator(apikey, url=iam_url)
+            authenticator.token_manager = PersistentIAMTokenManager(
+                apikey, url=iam_url, token_cache_path=token_cache_path or None
+            )
+            client = DiscoveryV2(version=os.environ['WATSON_DISCOVERY_VERSION'], authenticator=authenticator)
+            client.set_service_url(os.environ['WATSON_DISCOVERY_URL'])
+
+            # size the keep-alive pool for the queries in flight, the default pool keeps 10 connections and drops
+            # the rest after every request.
+            client.http_adapter = SSLHTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=pool_size,
+                _disable_ssl_verification=client.disable_ssl_verification
+            )
+            client.http_client.mount('http://', client.http_adapter)
+            client.http_client.mount('https://', client.http_adapter)
+            if query_timeout is not None:
+                client.set_http_config({'timeout': query_timeout})
+            _clients[client_key] = client
+    return client
+
+
+def clear_clients():
+    """
+    Drop the shared clients and close their connections, for instance after the credentials changed.
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            client.http_client.close()
+        _clients.clear()
@@ -1,166 +1,211 @@
-from ibm_watson import DiscoveryV2
-from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
-from dotenv import load_dotenv
+"""
+Docstring
+---------
+Elasticsearch (or OpenSearch) search backend, talking to the REST API over a pooled requests session. It only needs
+requests, not the Watson SDK, so it can be selected with SEARCH_SERVICE: ELASTICSEARCH on its own.
+The Watson Discovery connector and its response cache used to live in this module and are now in
+connectors/watson_discovery_connector.py. Importing them from here still works, they are only loaded on first access.
+"""
+from requests.adapters import HTTPAdapter
+import json
 import os
+import requests
 from typing import List
-from utils.files_handler import FileHandler
+from connectors.base_connector import SearchConnector
+from utils.dispatch import dispatch_ordered
+from utils.files_handler import FileHandler, load_environment
+from utils.tracing import tracer
 
 
-class WatsonDiscoveryV2Connector:
+# names moved to connectors/watson_discovery_connector.py.
+WATSON_DISCOVERY_NAMES = ['WatsonDiscoveryV2Connector', 'ResponseCache', 'ResponseCacheMiss', 'QueryResults',
+                          'CACHE_MODE_DISABLED', 'CACHE_MODE_READ_WRITE', 'CACHE_MODE_REPLAY']
 
-    def __init__(self):
+
+def __getattr__(name):
+    # load the Watson SDK only for callers that still import the Watson connector from here.
+    if name in WATSON_DISCOVERY_NAMES:
+        import connectors.watson_discovery_connector as watson_discovery_connector
+        return getattr(watson_discovery_connector, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class ElasticsearchConnector(SearchConnector):
+
+    def __init__(self, query_timeout=None, batch_size=None):
         """
-        Watson Discovery V2 connector class.
+        Elasticsearch (or OpenSearch) connector class. Queries are packed into _msearch requests of batch_size queries,
+        sent over a pooled HTTP session. The connection details are read from the environment (or .env):
+            ELASTICSEARCH_URL           e.g. http://localhost:9200
+            ELASTICSEARCH_API_KEY       optional, sent as an ApiKey authorization header.
+            ELASTICSEARCH_USERNAME      optional, with ELASTICSEARCH_PASSWORD for basic authentication.
+        :param query_timeout: seconds to wait on a single _msearch request. Defaults to the DISPATCH query_timeout in
+        the config.
+        :param batch_size: the number of queries per _msearch request. Defaults to the ELASTICSEARCH batch_size in the
+        config.
         """
-        # we will get the connection keys from the .env file by loading it to the environment variables.
-        load_dotenv()
-        self.authenticator = IAMAuthenticator(os.environ['WATSON_DISCOVERY_APIKEY'])
-        self.discovery_instance = DiscoveryV2(
-            version=os.environ['WATSON_DISCOVERY_VERSION'],
-            authenticator=self.authenticator
-        )
-        self.discovery_instance.set_service_url(os.environ['WATSON_DISCOVERY_URL'])
-        self.project_id = os.environ['WATSON_DISCOVERY_PROJECT_ID']
-
-        # Confirm connection
-        print("Successfully connected to Watson Discovery Instance!")
+        super().__init__()
 
-        # get passage details from config
         file_handler = FileHandler()
         file_handler.get_config(config_file_name='elasticsearch_config')
         self.config = file_handler.config
-
-        # get parameter values after parsing config.
-        self.passages_config = self.config['WATSON_DISCOVERY_V2']['passages']
+        self.es_config = self.config['ELASTICSEARCH']
         self.test_query = self.config['TEST_QUERY']
-        self.max_per_document = self.passages_config['max_per_document']
-        self.characters = self.passages_config['characters']
-
-
-        self.response = None  # to be reassigned with response json packet.
 
-    def query_response(self, query, collection_ids: List[str]):
-        """Query results from Discovery collections.
+        self.index = self.es_config['index']
+        self.fields = self.es_config['fields']
+        self.title_field = self.es_config['title_field']
+        self.text_field = self.es_config['text_field']
+        self.collection_field = self.es_config.get('collection_field')
+        self.count = self.es_config['count']
+        self.characters = self.config['WATSON_DISCOVERY_V2']['passages']['characters']
+        self.batch_size = batch_size if batch_size is not None else self.es_config['batch_size']
+        self.query_timeout = query_timeout if query_timeout is not None else self.config['DISPATCH']['query_timeout']
+
+        load_environment()
+        self.url = os.environ.get('ELASTICSEARCH_URL', 'http://localhost:9200').rstrip('/')
+
+        # one session for every request, so connections are kept alive and reused instead of opened per query.
+        pool_size = self.es_config['pool_size']
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-Type': 'application/x-ndjson'})
+        if os.environ.get('ELASTICSEARCH_API_KEY'):
+            self.session.headers.update({'Authorization': f"ApiKey {os.environ['ELASTICSEARCH_API_KEY']}"})
+        elif os.environ.get('ELASTICSEARCH_USERNAME'):
+            self.session.auth = (os.environ['ELASTICSEARCH_USERNAME'], os.environ.get('ELASTICSEARCH_PASSWORD', ''))
+        self.session.verify = self.es_config.get('verify_certs', True)
+
+    def get_search_body(self, query, collection_ids: List[str]):
+        """
+        Build the search body of a query.
         :param query: The query used for search.
-        :param collection_ids: the set of collections to send the query request to."""
-
-        response = self.discovery_instance.query(
-            project_id=self.project_id,
-            collection_ids=collection_ids,
-            passages=self.passages_config,
-            natural_language_query=query
-        ).get_result()
-
-        self.response = response
-
-    def __get_results(self):
-        """
-        A hidden method that fetches the results of running the query.
-        :return: the result json.
-        """
-        assert self.response is not None, "Please run the 'get_query_response' method before using this method."
-        return self.response['results']
-
-    def __get_kv_from_result(self, key: str):
-        """
-        Returns a list of all the items form a metadata. For instance the returned 'result' from the response,
-        which is generated using the __get_results(self) method may or may not have certain key-value pairs.
-        For instance, subtitle or table may appear as a key that can be accessed to retrieve the associated value for
-        certain retrieved response results or not.
-        :param key: Str the key to be searched for in the results output.
-        :return: List of all values associated with the key (metadata)
-        """
-        # get all results
-        results = self.__get_results()
-        # store output.
-        output = []
-
-        for i in range(0, len(results)):
-            try:
-                output.append(results[i][key])
-            except KeyError:
-                # exception needed as not all desired keys will be retrieved for all retrieved data.
-                output.append(f"THERE IS NO {key} FOR THIS DATA")
-
-        return output
-    
-    def get_result_metadata(self):
-        """
-        A function that grabs the result metadata from the results of the query response.
-        :return: List[result metadata]
-        """
-        result_metadata = self.__get_kv_from_result(key='result_metadata')
-        return result_metadata
-    
-    def __get_kv_from_result_metadata(self, key: str):
-        # get all results
-        results_metadata = self.get_result_metadata()
-
-        # store output of the values for the specified key.
-        output = []
-
-        for i in range(0, len(results_metadata)):
+        :param collection_ids: only match documents whose collection_field is one of these, if collection_field is set.
+        :return: the search body dict.
+        """
+        match = {'multi_match': {'query': query, 'fields': self.fields}}
+        if self.collection_field and collection_ids:
+            match = {'bool': {'must': match, 'filter': {'terms': {self.collection_field: collection_ids}}}}
+        return {
+            'size': self.count,
+            'query': match,
+            '_source': [self.title_field, self.text_field, 'url']
+        }
+
+    def to_response(self, es_response):
+        """
+        Convert the response of one search to a Discovery shaped response json packet. The confidence of a hit is its
+        score relative to the top hit, the raw score is kept as score.
+        """
+        if 'error' in es_response:
+            raise RuntimeError(f"Elasticsearch search failed: {es_response['error']}")
+        hits = es_response['hits']['hits']
+        max_score = es_response['hits'].get('max_score') or 0
+        results = []
+        for hit in hits:
+            source = hit.get('_source', {})
+            text = source.get(self.text_field) or ''
+            score = hit.get('_score') or 0
+            results.append({
+                'document_id': hit['_id'],
+                'result_metadata': {
+                    'document_retrieval_source': 'elasticsearch',
+                    'collection_id': hit['_index'],
+                    'confidence': round(score / max_score, 5) if max_score > 0 else 0.0,
+                    'score': score
+                },
+                'title': source.get(self.title_field),
+                'url': source.get('url'),
+                'document_passages': [{'passage_text': text[:self.characters], 'field': self.text_field}]
+            })
+        total = es_response['hits'].get('total', len(hits))
+        return {
+            'matching_results': total['value'] if isinstance(total, dict) else total,
+            'results': results
+        }
+
+    def msearch(self, queries: List[str], collection_ids: List[str]):
+        """
+        Send a batch of queries in a single _msearch request.
+        :param queries: the queries used for search.
+        :param collection_ids: passed on to get_search_body.
+        :return: List of response json packets (or the exception of a failed search), ordered as the queries.
+        """
+        lines = []
+        for query in queries:
+            lines.append(json.dumps({'index': self.index}))
+            lines.append(json.dumps(self.get_search_body(query, collection_ids)))
+        # the _msearch body is newline delimited json and must end with a newline.
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+
+        with tracer.span('elasticsearch.msearch', queries=len(queries)) as span:
+            http_response = self.session.post(f"{self.url}/_msearch", data=body, timeout=self.query_timeout)
+            http_response.raise_for_status()
+            span.add_bytes(len(http_response.content))
+
+        responses = []
+        for es_response in http_response.json()['responses']:
             try:
-                output.append(results_metadata[i][key])
-            except KeyError:
-                output.append(f"THERE IS NO {key} IN RESULTS METADATA")
-        
-        return output
-
-
-    def get_document_ids(self):
-        """
-        A function that grabs the document ids from the results of the query response.
-        :return: List[document ids]
-        """
-        document_ids = self.__get_kv_from_result(key='document_id')
-        return document_ids
-
-
-    def get_result_confidence(self):
-        """
-        A function that grabs the confidence scores from result metadata of the query response result.
-        :return: List[result metadata]
-        """
-        confidence_score = self.__get_kv_from_result_metadata(key='confidence')
-        return confidence_score
-    
-    def get_title(self):
-        """
-        A function that grabs the subtitles from the results of the query response.
-        :return: List[subtitles]
-        """
-        titles = self.__get_kv_from_result(key='title')
-        return titles
-
-    def get_subtitle(self):
-        """
-        A function that grabs the subtitles from the results of the query response.
-        :return: List[subtitles]
-        """
-        subtitles = self.__get_kv_from_result(key='subtitle')
-        return subtitles
-
-    def get_document_passages(self):
-        """
-        A function that grabs the document passages from the results of the query response.
-        :return: List[passages]
-        """
-        passages = self.__get_kv_from_result(key='document_passages')
-        return passages
-
-    def get_text(self):
-        """
-        A function that grabs the text from the results of the query response.
-        :return: List[text]
-        """
-        text = self.__get_kv_from_result(key='text')
-        return text
+                responses.append(self.to_response(es_response))
+            except Exception as e:
+                # a failed search only fails its own query, not the whole batch.
+                responses.append(e)
+        return responses
+
+    def fetch_response(self, query, collection_ids: List[str]):
+        """Fetch the results of a single query.
+        :param query: The query used for search.
+        :param collection_ids: passed on to get_search_body.
+        :return: the response json packet."""
+        response = self.msearch([query], collection_ids)[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def fetch_responses(self, queries: List[str], collection_ids: List[str], max_in_flight=8):
+        """Fetch the results of many queries, batch_size queries per _msearch request, with up to max_in_flight
+        requests at the same time.
+        :param queries: the queries used for search.
+        :param collection_ids: passed on to get_search_body.
+        :param max_in_flight: the maximum number of _msearch requests sent at the same time.
+        :return: List of response json packets (or the exception of a failed query), ordered as the queries."""
+        queries = list(queries)
+        batches = [queries[start:start + self.batch_size] for start in range(0, len(queries), self.batch_size)]
+        batch_responses = dispatch_ordered(
+            lambda batch: self.msearch(batch, collection_ids), batches, max_in_flight=max_in_flight
+        )
 
-    def get_table(self):
-        """
-        A function that grabs the table data from the results of the query response.
-        :return: List[table]
-        """
-        table = self.__get_kv_from_result(key='table')
-        return table
+        responses = []
+        for batch, batch_response in zip(batches, batch_responses):
+            if isinstance(batch_response, Exception):
+                # the whole request failed, so every query of the batch gets the error.
+                responses.extend([batch_response] * len(batch))
+            else:
+                responses.extend(batch_response)
+        return responses
+
+    def create_index(self, documents: List[dict], recreate=False):
+        """
+        Index documents with the _bulk API, for instance to fill a local single-node instance for testing.
+        :param documents: List of dicts with the title_field, text_field and optionally 'url', 'id' and the
+        collection_field.
+        :param recreate: delete the index first if it exists.
+        """
+        if recreate:
+            self.session.delete(f"{self.url}/{self.index}", timeout=self.query_timeout)
+        for start in range(0, len(documents), self.batch_size):
+            lines = []
+            for document in documents[start:start + self.batch_size]:
+                document = dict(document)
+                action = {'index': {'_index': self.index}}
+                if 'id' in document:
+                    action['index']['_id'] = str(document.pop('id'))
+                lines.append(json.dumps(action))
+                lines.append(json.dumps(document))
+            http_response = self.session.post(
+                f"{self.url}/_bulk", data=('\n'.join(lines) + '\n').encode('utf-8'), timeout=self.query_timeout
+            )
+            http_response.raise_for_status()
+        self.session.post(f"{self.url}/{self.index}/_refresh", timeout=self.query_timeout).raise_for_status()
@@ -0,0 +1,130 @@
+"""
+Docstring
+---------
+Fan a query out to several search sources at once, each collection of a connector or each search service, and fuse
+the ranked lists into one response with modules.rank_fusion. The sources are queried concurrently, so a fused query
+costs about the latency of the slowest source rather than the sum of them.
+"""
+from typing import List
+from connectors.base_connector import SearchConnector
+from modules.rank_fusion import FUSION_METHODS, MATCH_KEYS, fuse_responses
+from utils.dispatch import dispatch_ordered
+from utils.files_handler import FileHandler
+
+
+class FusionConnector(SearchConnector):
+
+    def __init__(self, connectors: List[SearchConnector], per_collection=None, method=None, rrf_k=None, weights=None,
+                 count=None, match_on=None):
+        """
+        Fusion connector class. It is a SearchConnector itself, so fused responses are loaded and read with the usual
+        getters, and it can replace the connector of a test run.
+        :param connectors: the connectors to fan out to, e.g. a Watson Discovery and a BM25 connector.
+        :param per_collection: query each collection id separately and fuse them, rather than sending every
+        collection id in one query per connector. Defaults to the FUSION per_collection in the config.
+        :param method: one of 'rrf', 'min_max' or 'z_score'. Defaults to the FUSION method in the config.
+        :param rrf_k: the rank offset of reciprocal rank fusion. Defaults to the FUSION rrf_k in the config.
+        :param weights: the weight of each connector in the fusion. Equal weights if None.
+        :param count: the number of fused results kept per query. Defaults to the FUSION count in the config.
+        :param match_on: 'document_id', 'title' or 'auto'. Document ids differ between search services (the local
+        backends number their rows), so 'auto' matches on the normalized title when there is more than one connector,
+        and on the document id otherwise. Defaults to the FUSION match_on in the config.
+        """
+        super().__init__()
+
+        file_handler = FileHandler()
+        file_handler.get_config(config_file_name='elasticsearch_config')
+        self.config = file_handler.config
+        fusion_config = self.config['FUSION']
+        self.test_query = self.config['TEST_QUERY']
+
+        assert len(connectors) > 0, "At least one connector is needed to fan out to."
+        self.connectors = connectors
+        self.per_collection = per_collection if per_collection is not None else fusion_config['per_collection']
+        self.method = method if method is not None else fusion_config['method']
+        assert self.method in FUSION_METHODS, f"Unknown fusion method '{self.method}'."
+        self.rrf_k = rrf_k if rrf_k is not None else fusion_config['rrf_k']
+        self.weights = weights
+        self.count = count if count is not None else fusion_config['count']
+        match_on = match_on if match_on is not None else fusion_config.get('match_on', 'auto')
+        if match_on == 'auto':
+            match_on = 'title' if len(self.connectors) > 1 else 'document_id'
+        assert match_on in MATCH_KEYS, f"Unknown fusion match key '{match_on}'."
+        self.match_on = match_on
+
+    def get_sources(self, collection_ids: List[str]):
+        """
+        :param collection_ids: the collections the query is sent to.
+        :return: List of (connector, collection ids, weight) tuples, one per ranked list to fuse.
+        """
+        weights = self.weights if self.weights is not None else [1.0] * len(self.connectors)
+        sources = []
+        for connector, weight in zip(self.connectors, weights):
+            if self.per_collection and len(collection_ids) > 1:
+                sources.extend((connector, [collection_id], weight) for collection_id in collection_ids)
+            else:
+                sources.append((connector, collection_ids, weight))
+        return sources
+
+    def fuse(self, responses, sources):
+        """
+        Fuse the responses of the sources to one query. Failed sources are left out of the fusion.
+        :param responses: the response json packet (or the exception raised) of each source.
+        :param sources: the sources, as returned by 'get_sources'.
+        :return: the fused response json packet.
+        :raises: the first exception if every source failed.
+        """
+        errors = [response for response in responses if isinstance(response, Exception)]
+        if len(errors) == len(responses):
+            raise errors[0]
+        fused = fuse_responses(
+            responses=[None if isinstance(response, Exception) else response for response in responses],
+            method=self.method,
+            k=self.rrf_k,
+            weights=[weight for _, _, weight in sources],
+            count=self.count,
+            key_function=MATCH_KEYS[self.match_on]
+        )
+        fused['fusion']['failed_lists'] = len(errors)
+        return fused
+
+    def fetch_response(self, query, collection_ids: List[str]):
+        """Fetch the fused results of a query, querying every source concurrently.
+        :param query: The query used for search.
+        :param collection_ids: the set of collections to send the query request to.
+        :return: the fused response json packet."""
+        sources = self.get_sources(collection_ids)
+        responses = dispatch_ordered(
+            func=lambda source: source[0].fetch_response(query=query, collection_ids=source[1]),
+            items=sources,
+            max_in_flight=len(sources)
+        )
+        return self.fuse(responses, sources)
+
+    def fetch_responses(self, queries: List[str], collection_ids: List[str], max_in_flight=8):
+        """Fetch the fused results of many queries. Every source gets all the queries at once through its own
+        'fetch_responses', so batched backends keep batching, and the sources run concurrently.
+        :param queries: the queries used for search.
+        :param collection_ids: the set of collections to send the query requests to.
+        :param max_in_flight: the maximum number of queries sent at the same time to each source.
+        :return: List of fused response json packets (or the exception raised for a query), ordered as the
+        queries."""
+        sources = self.get_sources(collection_ids)
+        source_responses = dispatch_ordered(
+            func=lambda source: source[0].fetch_responses(
+                queries=queries, collection_ids=source[1], max_in_flight=max_in_flight
+            ),
+            items=sources,
+            max_in_flight=len(sources)
+        )
+
+        fused_responses = []
+        for i in range(0, len(queries)):
+            # a source that failed as a whole failed for every query.
+            responses = [responses if isinstance(responses, Exception) else responses[i]
+                         for responses in source_responses]
+            try:
+                fused_responses.append(self.fuse(responses, sources))
+            except Exception as e:
+                fused_responses.append(e)
+        return fused_responses
@@ -0,0 +1,350 @@
+"""
+Docstring
+---------
+Client-side policy for requests to a remote search service, applied around every query of a connector:
+    - an adaptive token bucket that paces the requests sent, lowering the rate multiplicatively when the service
+      answers 429 (too many requests) and raising it additively while requests succeed (AIMD), so a run settles just
+      under the service quota instead of hammering it.
+    - retries of throttled (429), transient (5xx) and connection errors after a jittered exponential backoff, or the
+      Retry-After the service asked for.
+    - optional hedged requests: when a request is slower than a percentile of the recent latencies, a duplicate is
+      sent and the first answer is used, which cuts the tail latency of a run for a few percent more requests.
+The policy only needs the errors raised to carry a status code, as the ibm_cloud_sdk_core ApiException
+('status_code') and the requests HTTPError ('response.status_code') do.
+"""
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+from utils.tracing import LatencyHistogram, tracer
+
+
+# status codes worth retrying: throttling and transient server errors.
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+STATUS_TOO_MANY_REQUESTS = 429
+
+# hedged request threads shared by every policy of the process, by their number of threads.
+_hedge_executors = {}
+_hedge_executors_lock = threading.Lock()
+
+
+def get_status_code(exception):
+    """
+    :param exception: an exception raised by a request.
+    :return: the HTTP status code carried by the exception, or None if it has none.
+    """
+    for attribute in ['status_code', 'code']:
+        code = getattr(exception, attribute, None)
+        if isinstance(code, int):
+            return code
+    response = getattr(exception, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def get_hedge_executor(max_workers):
+    """
+    Get the shared thread pool running hedged requests, creating it on first use. Policies with the same number of
+    threads share one pool, so a connector created per run does not leave its own threads behind.
+    :param max_workers: the number of threads of the pool.
+    :return: the ThreadPoolExecutor.
+    """
+    with _hedge_executors_lock:
+        if max_workers not in _hedge_executors:
+            _hedge_executors[max_workers] = ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix='request_policy_hedge')
+        return _hedge_executors[max_workers]
+
+
+def shutdown_hedge_executors():
+    """
+    Stop the shared hedged request threads. Policies created afterwards start new ones.
+    """
+    with _hedge_executors_lock:
+        executors = list(_hedge_executors.values())
+        _hedge_executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False)
+
+
+def get_retry_after(exception):
+    """
+    :param exception: an exception raised by a request.
+    :return: the seconds the service asked to wait in a Retry-After header, or None if it did not.
+    """
+    response = getattr(exception, 'http_response', None)
+    if response is None:
+        response = getattr(exception, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveTokenBucket:
+
+    def __init__(self, rate=20.0, burst=None, min_rate=1.0, max_rate=None, increase=1.0, decrease_factor=0.5,
+                 decrease_cooldown=1.0):
+        """
+        Token bucket rate limiter class. Tokens are added at 'rate' per second up to 'burst', and every request takes
+        one, waiting for it if the bucket is empty.
+        :param rate: the starting number of requests per second.
+        :param burst: the number of requests that can be sent at once after a quiet period. Defaults to the rate,
+        at least 1.
+        :param min_rate: the rate is never lowered below this.
+        :param max_rate: the rate is never raised above this. No limit if None.
+        :param increase: requests per second added to the rate for every second of successful requests.
+        :param decrease_factor: the rate is multiplied by this on a throttled request.
+        :param decrease_cooldown: seconds after a decrease in which further throttled requests do not lower the rate
+        again, as they were mostly sent before the first decrease.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst) if burst is not None else max(1.0, self.rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate) if max_rate is not None else None
+        self.increase = float(increase)
+        self.decrease_factor = float(decrease_factor)
+        self.decrease_cooldown = decrease_cooldown
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.last_decrease = float('-inf')
+        self.__lock = threading.Lock()
+
+    def __refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available.
+        :return: the seconds waited.
+        """
+        waited = 0.0
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+            waited += wait_seconds
+
+    def on_success(self):
+        """
+        Additive increase: raise the rate by 'increase' per second of successful requests.
+        """
+        with self.__lock:
+            rate = self.rate + self.increase / self.rate
+            self.rate = rate if self.max_rate is None else min(self.max_rate, rate)
+
+    def on_throttle(self, retry_after=None):
+        """
+        Multiplicative decrease: lower the rate after a throttled request, and empty the bucket.
+        :param retry_after: the seconds the service asked to wait, no token is handed out before then.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            if now - self.last_decrease >= self.decrease_cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self.last_decrease = now
+            self.__refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                # a negative balance holds the bucket empty for retry_after seconds.
+                self.tokens = min(self.tokens, -retry_after * self.rate)
+
+
+class RetryPolicy:
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=20.0, retry_status_codes=RETRYABLE_STATUS_CODES):
+        """
+        Retry policy class with jittered exponential backoff.
+        :param max_retries: the number of times a failed request is sent again. 0 never retries.
+        :param base_delay: the backoff ceiling of the first retry in seconds, doubled on every later retry.
+        :param max_delay: the highest backoff ceiling in seconds.
+        :param retry_status_codes: the status codes worth retrying. Connection errors and timeouts are always retried.
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_status_codes = tuple(retry_status_codes)
+        self.random = random.Random()
+
+    def is_retryable(self, exception):
+        """
+        :return: True if the request that raised the exception is worth sending again.
+        """
+        if isinstance(exception, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        return get_status_code(exception) in self.retry_status_codes
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        Full jitter backoff: a random delay up to the exponential ceiling, so clients that failed together do not
+        retry together.
+        :param attempt: the number of the retry, from 0.
+        :param retry_after: the seconds the service asked to wait, the delay is at least this.
+        :return: the seconds to wait before the retry.
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = self.random.uniform(0, ceiling)
+        return max(delay, retry_after) if retry_after else delay
+
+
+class HedgePolicy:
+
+    def __init__(self, percentile=95, min_samples=20, min_delay=0.05):
+        """
+        Hedged request policy class. It tracks the latency of successful requests, and a request still running after
+        the given percentile of those latencies gets a duplicate.
+        :param percentile: the latency percentile after which a duplicate request is sent, from 0 to 100.
+        :param min_samples: no duplicates are sent before this many latencies were recorded.
+        :param min_delay: duplicates are never sent sooner than this many seconds.
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.histogram = LatencyHistogram()
+        self.__lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.__lock:
+            self.histogram.record(seconds)
+
+    def get_delay(self):
+        """
+        :return: the seconds to wait on a request before sending a duplicate, or None while too few latencies were
+        recorded.
+        """
+        with self.__lock:
+            if self.histogram.count < self.min_samples:
+                return None
+            return max(self.min_delay, self.histogram.percentile(self.percentile))
+
+
+class RequestPolicy:
+
+    def __init__(self, rate_limiter: AdaptiveTokenBucket = None, retry_policy: RetryPolicy = None,
+                 hedge_policy: HedgePolicy = None, max_hedge_workers=16):
+        """
+        Request policy class, combining the rate limiter, the retries and the hedged requests. Every part is
+        optional. It is safe to call from several threads at once.
+        :param rate_limiter: paces the requests. No pacing if None.
+        :param retry_policy: retries failed requests. No retries if None.
+        :param hedge_policy: sends duplicates of slow requests. No duplicates if None.
+        :param max_hedge_workers: the number of threads of the shared pool running hedged requests, at least twice the
+        number of requests in flight so the duplicates never wait on a thread.
+        """
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.hedge_policy = hedge_policy
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'hedges': 0, 'hedge_wins': 0}
+        self.__stats_lock = threading.Lock()
+        self.__executor = get_hedge_executor(max_hedge_workers) if hedge_policy is not None else None
+
+    @classmethod
+    def from_config(cls, policy_config: dict, max_in_flight=8):
+        """
+        Build a request policy from the REQUEST_POLICY section of the config.
+        :param policy_config: the REQUEST_POLICY settings.
+        :param max_in_flight: the number of requests sent at the same time, to size the hedged request threads.
+        :return: the RequestPolicy.
+        """
+        rate_limiter = None
+        if policy_config.get('rate'):
+            rate_limiter = AdaptiveTokenBucket(
+                rate=policy_config['rate'],
+                burst=policy_config.get('burst'),
+                min_rate=policy_config.get('min_rate') or 1.0,
+                max_rate=policy_config.get('max_rate')
+            )
+        retry_policy = RetryPolicy(
+            max_retries=policy_config.get('max_retries') or 0,
+            base_delay=policy_config.get('base_delay', 0.5),
+            max_delay=policy_config.get('max_delay', 20.0)
+        )
+        hedge_policy = None
+        if policy_config.get('hedge_percentile'):
+            hedge_policy = HedgePolicy(
+                percentile=policy_config['hedge_percentile'],
+                min_samples=policy_config.get('hedge_min_samples', 20)
+            )
+        return cls(rate_limiter=rate_limiter, retry_policy=retry_policy, hedge_policy=hedge_policy,
+                   max_hedge_workers=max(32, 2 * max_in_flight))
+
+    def __count(self, key, n=1):
+        with self.__stats_lock:
+            self.stats[key] += n
+
+    def __send(self, func):
+        # take a token for every request actually sent, including duplicates.
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        self.__count('requests')
+        start = time.perf_counter()
+        result = func()
+        if self.hedge_policy is not None:
+            self.hedge_policy.record(time.perf_counter() - start)
+        return result
+
+    def __send_hedged(self, func):
+        hedge_delay = self.hedge_policy.get_delay()
+        primary = self.__executor.submit(self.__send, func)
+        if hedge_delay is None:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        with tracer.span('request_policy.hedge'):
+            self.__count('hedges')
+            hedge = self.__executor.submit(self.__send, func)
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        # the slower request is left to finish, its answer is dropped.
+                        if future is hedge:
+                            self.__count('hedge_wins')
+                        return future.result()
+                    error = future.exception()
+            raise error
+
+    def call(self, func):
+        """
+        Send a request under the policy.
+        :param func: callable without arguments sending the request, for instance a lambda around a query.
+        :return: the output of func.
+        :raises: the last exception of func once it is not retryable or the retries are used up.
+        """
+        attempt = 0
+        while True:
+            try:
+                if self.hedge_policy is not None:
+                    result = self.__send_hedged(func)
+                else:
+                    result = self.__send(func)
+            except Exception as e:
+                retry_after = get_retry_after(e)
+                if get_status_code(e) == STATUS_TOO_MANY_REQUESTS:
+                    self.__count('throttled')
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.on_throttle(retry_after=retry_after)
+                if self.retry_policy is None or attempt >= self.retry_policy.max_retries \
+                        or not self.retry_policy.is_retryable(e):
+                    raise
+                self.__count('retries')
+                with tracer.span('request_policy.backoff', status=get_status_code(e)):
+                    time.sleep(self.retry_policy.get_delay(attempt, retry_after=retry_after))
+                attempt += 1
+                continue
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.on_success()
+            return result
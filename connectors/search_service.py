@@ -0,0 +1,50 @@
+"""
+Docstring
+---------
+Select the search connector named by the SEARCH_SERVICE key of configs/elasticsearch_config.yaml.
+"""
+from utils.files_handler import FileHandler
+
+
+SEARCH_SERVICE_WATSON_DISCOVERY_V2 = 'WATSON_DISCOVERY_V2'
+SEARCH_SERVICE_BM25 = 'BM25'
+SEARCH_SERVICE_ELASTICSEARCH = 'ELASTICSEARCH'
+
+
+def get_search_connector(search_service=None, query_timeout=None, cache_mode=None, fusion=None):
+    """
+    Instantiate the configured search connector. Connectors are imported on use, so a local backend does not need the
+    Watson SDK installed.
+    :param search_service: the name of the search service. Defaults to SEARCH_SERVICE in the config.
+    :param query_timeout: seconds to wait on a single query, for remote services.
+    :param cache_mode: the response cache mode, for remote services.
+    :param fusion: fan every query out to each collection, and to each of the FUSION search_services, and fuse the
+    results. Defaults to the FUSION enabled setting in the config.
+    :return: the connector, a SearchConnector.
+    """
+    file_handler = FileHandler()
+    file_handler.get_config(config_file_name='elasticsearch_config')
+    if search_service is None:
+        search_service = file_handler.config['SEARCH_SERVICE']
+    if fusion is None:
+        fusion = file_handler.config['FUSION']['enabled']
+
+    if fusion:
+        from connectors.fusion_connector import FusionConnector
+        search_services = file_handler.config['FUSION']['search_services'] or [search_service]
+        return FusionConnector(connectors=[
+            get_search_connector(search_service=service, query_timeout=query_timeout, cache_mode=cache_mode,
+                                 fusion=False)
+            for service in search_services
+        ])
+
+    if search_service == SEARCH_SERVICE_WATSON_DISCOVERY_V2:
+        from connectors.watson_discovery_connector import WatsonDiscoveryV2Connector
+        return WatsonDiscoveryV2Connector(query_timeout=query_timeout, cache_mode=cache_mode)
+    if search_service == SEARCH_SERVICE_BM25:
+        from connectors.bm25_connector import BM25Connector
+        return BM25Connector()
+    if search_service == SEARCH_SERVICE_ELASTICSEARCH:
+        from connectors.elasticsearch_connector import ElasticsearchConnector
+        return ElasticsearchConnector(query_timeout=query_timeout)
+    raise ValueError(f"Unknown search service '{search_service}'.")
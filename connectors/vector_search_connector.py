@@ -0,0 +1,318 @@
+"""
+Docstring
+---------
+A local dense-vector search backend built on the embeddings from EmbeddingFunctions. It answers queries with the same
+response shape and getters as WatsonDiscoveryV2Connector, so retrieval quality tests can run offline and be compared
+with Discovery. Two indexes are available:
+    ExactIndex: brute-force cosine similarity with NumPy, exact top-k.
+    IVFIndex: an inverted file index that clusters the embeddings with k-means and only scores the n_probe clusters
+    closest to a query. Raising n_probe trades speed for recall.
+"""
+import numpy as np
+from typing import List
+from connectors.base_connector import SearchConnector
+from utils.embedding_funcs import EmbeddingFunctions
+from utils.embedding_store import EmbeddingStore
+
+
+def normalize_rows(vectors):
+    """Scale each row to unit length so that dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k_rows(scores, top_k):
+    """
+    Get the top k columns of each row of a score matrix, highest first.
+    :return: the scores and the column indices, both of shape (n_rows, min(top_k, n_columns)).
+    """
+    top_k = min(top_k, scores.shape[1])
+    if top_k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=scores.dtype), np.zeros((scores.shape[0], 0), dtype=np.int64)
+    # argpartition finds the top k in linear time, only those k are then sorted.
+    candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidate_scores, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+
+def merge_top_k(scores, indices, other_scores, other_indices, top_k):
+    """
+    Merge two top k lists of the same rows into one, highest first.
+    :return: the scores and the indices of the merged top k.
+    """
+    candidate_scores = np.concatenate([scores, other_scores], axis=1)
+    candidate_indices = np.concatenate([indices, other_indices], axis=1)
+    best_scores, best = top_k_rows(candidate_scores, top_k)
+    return best_scores, np.take_along_axis(candidate_indices, best, axis=1)
+
+
+class ExactIndex:
+
+    def __init__(self, embeddings, block_size=1024, document_block_size=8192):
+        """
+        Brute-force index class. The embeddings are used as they are, without a copy, so the vectors of a
+        memory-mapped EmbeddingStore stay on disk and are read block by block while searching.
+        :param embeddings: the document embeddings, shape (n_documents, dim).
+        :param block_size: the number of queries scored against a document block at a time.
+        :param document_block_size: the number of documents read and scored at a time.
+        """
+        self.embeddings = embeddings
+        self.block_size = block_size
+        self.document_block_size = document_block_size
+        # the inverse document norms turn dot products into cosine similarities, computed once block by block.
+        self.inverse_norms = np.empty(len(embeddings), dtype=np.float32)
+        for start, stop, block in self.__iter_blocks():
+            self.inverse_norms[start:stop] = 1 / np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+
+    def __iter_blocks(self):
+        for start in range(0, len(self.embeddings), self.document_block_size):
+            stop = min(start + self.document_block_size, len(self.embeddings))
+            yield start, stop, np.asarray(self.embeddings[start:stop], dtype=np.float32)
+
+    def search(self, query_vectors, top_k=10, mask=None):
+        """
+        Find the top k documents of each query.
+        :param query_vectors: the query embeddings, shape (n_queries, dim).
+        :param top_k: the number of documents to return per query.
+        :param mask: bool array over the documents, only documents where it is True are returned.
+        :return: the cosine similarities and the document indices, both of shape (n_queries, top_k). Index -1 marks an
+        empty slot when fewer than top_k documents can be returned.
+        """
+        query_vectors = normalize_rows(query_vectors)
+        n_queries = len(query_vectors)
+        if n_queries == 0:
+            return np.zeros((0, 0), dtype=np.float32), np.zeros((0, 0), dtype=np.int64)
+
+        # a running top k per query, merged with the top k of every document block, so only a query block by
+        # document block score matrix is held at a time and every document block is read once.
+        scores = np.zeros((n_queries, 0), dtype=np.float32)
+        indices = np.zeros((n_queries, 0), dtype=np.int64)
+        for document_start, document_stop, block in self.__iter_blocks():
+            inverse_norms = self.inverse_norms[document_start:document_stop]
+            block_mask = mask[document_start:document_stop] if mask is not None else None
+            merged_scores = []
+            merged_indices = []
+            for start in range(0, n_queries, self.block_size):
+                block_scores = query_vectors[start:start + self.block_size] @ block.T
+                block_scores *= inverse_norms
+                if block_mask is not None:
+                    block_scores[:, ~block_mask] = -np.inf
+                best_scores, best = top_k_rows(block_scores, top_k)
+                merged_scores.append(best_scores)
+                merged_indices.append(best + document_start)
+            scores, indices = merge_top_k(
+                scores, indices, np.concatenate(merged_scores), np.concatenate(merged_indices), top_k
+            )
+        return scores, np.where(np.isfinite(scores), indices, -1)
+
+
+class IVFIndex:
+
+    def __init__(self, embeddings, n_lists=None, n_probe=8, n_iter=10, seed=0):
+        """
+        Inverted file index class. The index keeps its own normalized copy of the embeddings, stored by cluster.
+        :param embeddings: the document embeddings, shape (n_documents, dim).
+        :param n_lists: the number of k-means clusters. Defaults to the square root of the number of documents.
+        :param n_probe: the number of clusters scored per query.
+        :param n_iter: the number of k-means iterations.
+        :param seed: seed for the k-means initialisation.
+        """
+        embeddings = normalize_rows(embeddings)
+        n_documents = len(embeddings)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(n_documents)))
+        n_lists = min(n_lists, n_documents)
+        self.n_probe = n_probe
+
+        # spherical k-means: centroids are kept at unit length and documents assigned by cosine similarity.
+        rng = np.random.default_rng(seed)
+        centroids = embeddings[rng.choice(n_documents, size=n_lists, replace=False)]
+        for _ in range(0, n_iter):
+            assignments = np.argmax(embeddings @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, embeddings)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            # clusters that lost all their documents keep their previous centroid.
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+        assignments = np.argmax(embeddings @ centroids.T, axis=1)
+
+        # store the documents of each list contiguously, list i holds rows offsets[i]:offsets[i + 1].
+        self.order = np.argsort(assignments, kind='stable')
+        self.embeddings = embeddings[self.order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        self.centroids = centroids
+
+    def search(self, query_vectors, top_k=10, mask=None, n_probe=None):
+        """
+        Find the approximate top k documents of each query.
+        :param query_vectors: the query embeddings, shape (n_queries, dim).
+        :param top_k: the number of documents to return per query.
+        :param mask: bool array over the documents, only documents where it is True are returned.
+        :param n_probe: the number of clusters scored per query. Defaults to the n_probe of the index.
+        :return: the cosine similarities and the document indices, both of shape (n_queries, top_k). Index -1 marks an
+        empty slot when fewer than top_k documents are found.
+        """
+        if n_probe is None:
+            n_probe = self.n_probe
+        n_probe = min(n_probe, len(self.centroids))
+        query_vectors = normalize_rows(query_vectors)
+        sorted_mask = mask[self.order] if mask is not None else None
+
+        # pick the closest clusters of every query at once.
+        _, probes = top_k_rows(query_vectors @ self.centroids.T, n_probe)
+
+        # score each list once against all the queries that probe it, rather than each query against its lists.
+        n_queries = len(query_vectors)
+        probing_queries = np.repeat(np.arange(0, n_queries), n_probe)
+        probed_lists = probes.ravel()
+        by_list = np.argsort(probed_lists, kind='stable')
+        list_starts = np.searchsorted(probed_lists[by_list], np.arange(0, len(self.centroids) + 1))
+
+        scores = np.full((n_queries, top_k), -np.inf, dtype=np.float32)
+        rows = np.full((n_queries, top_k), -1, dtype=np.int64)
+        for p in range(0, len(self.centroids)):
+            queries = probing_queries[by_list[list_starts[p]:list_starts[p + 1]]]
+            list_start, list_stop = self.offsets[p], self.offsets[p + 1]
+            if len(queries) == 0 or list_start == list_stop:
+                continue
+            list_scores = query_vectors[queries] @ self.embeddings[list_start:list_stop].T
+            if sorted_mask is not None:
+                list_scores[:, ~sorted_mask[list_start:list_stop]] = -np.inf
+            best_scores, best = top_k_rows(list_scores, top_k)
+            scores[queries], rows[queries] = merge_top_k(
+                scores[queries], rows[queries], best_scores, best + list_start, top_k
+            )
+        found = np.isfinite(scores)
+        return scores, np.where(found, self.order[np.where(found, rows, 0)], -1)
+
+
+class LocalVectorSearchConnector(SearchConnector):
+
+    def __init__(self, embeddings, titles: List[str], texts: List[str] = None, document_ids: List[str] = None,
+                 collection_ids: List[str] = None, index_type='exact', n_lists=None, n_probe=8, count=10,
+                 characters=200, embedding_model='all-MiniLM-L6-v2', embedding_functions=None):
+        """
+        Local vector search connector class.
+        :param embeddings: the document embeddings, shape (n_documents, dim). An EmbeddingStore's vectors work too.
+        :param titles: the title of each document, returned as the result title.
+        :param texts: the text of each document, returned as the passage.
+        :param document_ids: the id of each document. Defaults to the row number.
+        :param collection_ids: the collection of each document, so queries can be limited to some collections.
+        :param index_type: 'exact' for brute-force search or 'ivf' for the approximate inverted file index.
+        :param n_lists: the number of clusters of the 'ivf' index.
+        :param n_probe: the number of clusters the 'ivf' index scores per query.
+        :param count: the number of results returned per query.
+        :param characters: the maximum number of characters of the passage text.
+        :param embedding_model: the model used to embed the queries. It must be the model of the document embeddings.
+        :param embedding_functions: the EmbeddingFunctions used to embed the queries.
+        """
+        super().__init__()
+        assert index_type in ['exact', 'ivf'], f"Unknown index type '{index_type}'."
+        self.titles = list(titles)
+        self.texts = list(texts) if texts is not None else list(titles)
+        self.document_ids = [str(i) for i in range(0, len(self.titles))] if document_ids is None \
+            else [str(document_id) for document_id in document_ids]
+        self.collection_ids = np.asarray(collection_ids) if collection_ids is not None else None
+        self.count = count
+        self.characters = characters
+        self.embedding_model = embedding_model
+        self.embedding_functions = embedding_functions if embedding_functions is not None else EmbeddingFunctions()
+
+        if index_type == 'exact':
+            self.index = ExactIndex(embeddings)
+        else:
+            self.index = IVFIndex(embeddings, n_lists=n_lists, n_probe=n_probe)
+
+    @classmethod
+    def from_embedding_store(cls, store_path, title_key='title', **kwargs):
+        """
+        Build the connector from an EmbeddingStore, for instance one written by EmbeddingFunctions.embeddings_from_file.
+        The title of a document is read from its metadata, falling back to the first line of its text.
+        :param store_path: the folder of the store.
+        :param title_key: the metadata key holding the document title.
+        """
+        store = EmbeddingStore(store_path)
+        metadata = list(store.iter_metadata())
+        texts = [row.get('text', '') for row in metadata]
+        titles = [row.get(title_key) or text.strip().split('\n')[0][:100] for row, text in zip(metadata, texts)]
+        collection_ids = None
+        if metadata and all('collection_id' in row for row in metadata):
+            collection_ids = [row['collection_id'] for row in metadata]
+        return cls(
+            embeddings=store.vectors,
+            titles=titles,
+            texts=texts,
+            document_ids=store.ids.tolist(),
+            collection_ids=collection_ids,
+            embedding_model=store.embedding_model or 'all-MiniLM-L6-v2',
+            **kwargs
+        )
+
+    @classmethod
+    def from_documents(cls, titles: List[str], texts: List[str] = None, embedding_model='all-MiniLM-L6-v2', **kwargs):
+        """
+        Build the connector by embedding the documents with EmbeddingFunctions.
+        :param titles: the title of each document.
+        :param texts: the text of each document, embedded together with the title. Defaults to the titles.
+        """
+        embedding_functions = kwargs.pop('embedding_functions', None) or EmbeddingFunctions()
+        texts = list(texts) if texts is not None else list(titles)
+        documents = [title if title == text else f"{title}\n{text}" for title, text in zip(titles, texts)]
+        embeddings = embedding_functions.create_embedding(documents, embedding_model=embedding_model)
+        return cls(embeddings=embeddings, titles=titles, texts=texts, embedding_model=embedding_model,
+                   embedding_functions=embedding_functions, **kwargs)
+
+    def __get_mask(self, collection_ids: List[str]):
+        # only limit the search when the documents have collections and some were asked for.
+        if self.collection_ids is None or not collection_ids:
+            return None
+        return np.isin(self.collection_ids, collection_ids)
+
+    def search_vectors(self, query_vectors, collection_ids: List[str] = None):
+        """
+        Search with query embeddings that are already computed.
+        :param query_vectors: the query embeddings, shape (n_queries, dim).
+        :param collection_ids: only return documents of these collections.
+        :return: List of response json packets, one per query.
+        """
+        scores, indices = self.index.search(query_vectors, top_k=self.count, mask=self.__get_mask(collection_ids))
+        responses = []
+        for query_scores, query_indices in zip(scores, indices):
+            results = []
+            for score, i in zip(query_scores.tolist(), query_indices.tolist()):
+                if i < 0:
+                    continue
+                collection_id = str(self.collection_ids[i]) if self.collection_ids is not None else 'local'
+                results.append({
+                    'document_id': self.document_ids[i],
+                    'result_metadata': {
+                        'document_retrieval_source': 'vector',
+                        'collection_id': collection_id,
+                        'confidence': round(score, 5)
+                    },
+                    'title': self.titles[i],
+                    'document_passages': [{'passage_text': self.texts[i][:self.characters], 'field': 'text'}]
+                })
+            responses.append({'matching_results': len(results), 'results': results})
+        return responses
+
+    def fetch_response(self, query, collection_ids: List[str]):
+        """Embed the query and search the index.
+        :param query: The query used for search.
+        :param collection_ids: only return documents of these collections.
+        :return: the response json packet."""
+        return self.fetch_responses([query], collection_ids=collection_ids)[0]
+
+    def fetch_responses(self, queries: List[str], collection_ids: List[str], max_in_flight=None):
+        """Embed all the queries in one batch and search the index for all of them at once.
+        :param queries: the queries used for search.
+        :param collection_ids: only return documents of these collections.
+        :param max_in_flight: unused, the search runs in process.
+        :return: List of response json packets, ordered as the queries."""
+        query_vectors = self.embedding_functions.create_embedding(
+            list(queries), embedding_model=self.embedding_model, use_cache=False
+        )
+        return self.search_vectors(query_vectors, collection_ids=collection_ids)
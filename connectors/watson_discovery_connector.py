@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import zlib
+from typing import List
+from connectors.base_connector import SearchConnector, QueryResults
+from connectors.discovery_client import get_discovery_client
+from connectors.request_policy import RequestPolicy
+from utils.disk_cache import DiskCache
+from utils.files_handler import FileHandler
+from utils.tracing import tracer
+
+
+# response cache modes.
+CACHE_MODE_DISABLED = 'disabled'  # always query the service.
+CACHE_MODE_READ_WRITE = 'read_write'  # serve from the cache when possible, and store new responses.
+CACHE_MODE_REPLAY = 'replay'  # serve only from the cache, never query the service.
+
+
+class ResponseCacheMiss(KeyError):
+    """Raised in replay mode when a query has no recorded response in the cache."""
+
+
+class ResponseCache:
+
+    def __init__(self, path, passages_config: dict, max_size_mb=None, ttl_hours=None):
+        """
+        Disk-backed cache of Discovery query responses, keyed by the query text, the collection ids and the passages
+        settings the query was sent with.
+        :param path: the path of the cache file.
+        :param passages_config: the passages settings sent with every query.
+        :param max_size_mb: the maximum size of the cache before the least recently used responses are evicted.
+        :param ttl_hours: the number of hours a cached response stays valid.
+        """
+        self.passages_config = passages_config
+        self.cache = DiskCache(
+            path=path,
+            max_size_bytes=None if max_size_mb is None else int(max_size_mb * 1024 * 1024),
+            ttl_seconds=None if ttl_hours is None else ttl_hours * 3600
+        )
+
+    def get_key(self, query, collection_ids: List[str]):
+        """
+        Build the cache key of a query.
+        :param query: The query used for search.
+        :param collection_ids: the set of collections the query is sent to.
+        :return: str sha256 hex digest of the query parameters.
+        """
+        key_fields = {
+            'query': query,
+            'collection_ids': sorted(collection_ids),
+            'passages': self.passages_config
+        }
+        return hashlib.sha256(json.dumps(key_fields, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, query, collection_ids: List[str], ignore_ttl=False):
+        """
+        Get the cached response of a query.
+        :return: the response json packet, or None if it is not cached.
+        """
+        value = self.cache.get(self.get_key(query, collection_ids), ignore_ttl=ignore_ttl)
+        if value is None:
+            return None
+        return json.loads(zlib.decompress(value).decode('utf-8'))
+
+    def set(self, query, collection_ids: List[str], response: dict):
+        """
+        Store the response of a query.
+        """
+        value = zlib.compress(json.dumps(response).encode('utf-8'))
+        self.cache.set(self.get_key(query, collection_ids), value)
+
+
+class WatsonDiscoveryV2Connector(SearchConnector):
+
+    def __init__(self, query_timeout=None, cache_mode=None):
+        """
+        Watson Discovery V2 connector class.
+        :param query_timeout: seconds to wait on the service for a single query before giving up. Defaults to the
+        DISPATCH query_timeout in the config.
+        :param cache_mode: one of 'disabled', 'read_write' or 'replay'. Defaults to the RESPONSE_CACHE mode in the
+        config. In 'replay' mode no connection is made and responses are only served from the cache.
+        """
+        super().__init__()
+
+        # get passage details from config
+        file_handler = FileHandler()
+        file_handler.get_config(config_file_name='elasticsearch_config')
+        self.config = file_handler.config
+
+        # get parameter values after parsing config.
+        self.passages_config = self.config['WATSON_DISCOVERY_V2']['passages']
+        self.test_query = self.config['TEST_QUERY']
+        self.max_per_document = self.passages_config['max_per_document']
+        self.characters = self.passages_config['characters']
+
+        # set up the response cache.
+        cache_config = self.config['RESPONSE_CACHE']
+        if cache_mode is None:
+            cache_mode = cache_config['mode']
+        assert cache_mode in [CACHE_MODE_DISABLED, CACHE_MODE_READ_WRITE, CACHE_MODE_REPLAY], \
+            f"Unknown response cache mode '{cache_mode}'."
+        self.cache_mode = cache_mode
+        self.response_cache = None
+        if self.cache_mode != CACHE_MODE_DISABLED:
+            self.response_cache = ResponseCache(
+                path=cache_config['path'],
+                passages_config=self.passages_config,
+                max_size_mb=cache_config['max_size_mb'],
+                ttl_hours=cache_config['ttl_hours']
+            )
+
+        self.discovery_instance = None
+        self.authenticator = None
+        self.project_id = None
+        self.query_timeout = None
+        self.request_policy = None
+
+        if self.cache_mode == CACHE_MODE_REPLAY:
+            # replay runs are served from recorded responses, so no credentials are needed.
+            print("Replaying Watson Discovery responses from the response cache.")
+            return
+
+        # the per query timeout of the http client.
+        if query_timeout is None:
+            query_timeout = self.config['DISPATCH']['query_timeout']
+        self.query_timeout = query_timeout
+
+        # connectors with the same credentials share one client, with its IAM token and keep-alive connections.
+        self.discovery_instance = get_discovery_client(query_timeout=self.query_timeout)
+        self.authenticator = self.discovery_instance.authenticator
+        self.project_id = os.environ['WATSON_DISCOVERY_PROJECT_ID']
+
+        # pace the queries and retry or hedge them as set in the REQUEST_POLICY config.
+        self.request_policy = RequestPolicy.from_config(
+            self.config['REQUEST_POLICY'], max_in_flight=self.config['DISPATCH']['max_in_flight']
+        )
+
+        # Confirm connection
+        print("Successfully connected to Watson Discovery Instance!")
+
+    def fetch_response(self, query, collection_ids: List[str]):
+        """Fetch the query results from Discovery collections without storing them on the connector. This is safe to
+        call from several threads at once.
+        :param query: The query used for search.
+        :param collection_ids: the set of collections to send the query request to.
+        :return: the response json packet."""
+
+        if self.response_cache is not None:
+            # recorded responses are always served in replay mode, however old they are.
+            response = self.response_cache.get(
+                query, collection_ids, ignore_ttl=self.cache_mode == CACHE_MODE_REPLAY
+            )
+            if response is not None:
+                return response
+            if self.cache_mode == CACHE_MODE_REPLAY:
+                raise ResponseCacheMiss(f"No recorded response for query '{query}' in replay mode.")
+
+        with tracer.span('discovery.query') as span:
+            # throttled and transient errors are retried, and only raised once the retries are used up.
+            detailed_response = self.request_policy.call(lambda: self.discovery_instance.query(
+                project_id=self.project_id,
+                collection_ids=collection_ids,
+                passages=self.passages_config,
+                natural_language_query=query
+            ))
+            span.add_bytes(detailed_response.get_headers().get('Content-Length'))
+        response = detailed_response.get_result()
+
+        if self.response_cache is not None:
+            self.response_cache.set(query, collection_ids, response)
+
+        return response
@@ -1,25 +1,148 @@
-from scripts.run_vodafone_discovery_test import run_vodafone_test, custom_preprocess
-# from tests.test_ir_metrics import test_ir_metrics
+"""
+Docstring
+---------
+Command line entry point, with a subcommand per task:
+    python main.py run_discovery_test [--max_in_flight N] [--cache_mode replay] ...
+    python main.py list_tests
+    python main.py score_output data/output/<output file>
+    python main.py run_history [--since STAMP]
+Without a subcommand the discovery test is run, and the old '--test_script <name>' option still selects a subcommand.
+Heavy dependencies (pandas, pyarrow, the search service SDKs) are only imported by the subcommands that need them, so
+quick commands start fast. Only the standard library is imported at module level.
+"""
 import argparse
+import sys
 
 
-# Create an ArgumentParser object
-parser = argparse.ArgumentParser(description="choose the test you want to run")
-parser.add_argument('--test_script',
-                    type=str,
-                    choices=['run_discovery_test'],
-                    default='run_discovery_test')
+# the test scripts that can be run, with what they do.
+TEST_SCRIPTS = {
+    'run_discovery_test': "run the vodafone test case file through the configured search service and score it.",
+}
 
-# parse arguments
-args = parser.parse_args()
 
-# script to run
-test_script = args.test_script
+def run_discovery_test(args):
+    from scripts.run_vodafone_discovery_test import run_vodafone_test
+    run_vodafone_test(max_in_flight=args.max_in_flight, query_timeout=args.query_timeout,
+                      cache_mode=args.cache_mode, resume=args.resume,
+                      output_format=args.output_format, fusion=args.fusion)
+
+
+def list_tests(args):
+    for name, description in TEST_SCRIPTS.items():
+        print(f"{name:<24}{description}")
+
+
+def score_output(args):
+    """
+    Print the top 3 accuracy of a saved test output. csv outputs are read with the csv module, parquet outputs only
+    read their top 3 column.
+    """
+    column = 'Correct FAQ in top 3'
+    if args.output_path.endswith('.csv'):
+        import csv
+        with open(args.output_path, 'r', encoding='utf-8', newline='') as f:
+            values = [row[column] for row in csv.DictReader(f)]
+    else:
+        import pyarrow.parquet as pq
+        values = pq.read_table(args.output_path, columns=[column]).column(column).to_pylist()
+
+    rows = len(values)
+    correct = sum(1 for value in values if value == 'Y')
+    errors = sum(1 for value in values if value is not None and value.startswith('ERROR'))
+    print(f"User inputs: {rows}")
+    print(f"Correct FAQ in top 3: {correct} ({correct / rows if rows else 0:.1%})")
+    print(f"Errors: {errors}")
+
+
+def run_history(args):
+    from utils.run_history import RunHistoryStore
+    store = RunHistoryStore(args.run_history_path)
+    if not store.list_runs():
+        print(f"No runs in {args.run_history_path}.")
+        return
+    print(store.get_accuracy_trend(since=args.since, until=args.until).to_string(index=False))
+
+
+def get_parser():
+    # Create an ArgumentParser object
+    parser = argparse.ArgumentParser(description="choose the test you want to run")
+    subparsers = parser.add_subparsers(dest='command')
+
+    test_parser = subparsers.add_parser('run_discovery_test', help=TEST_SCRIPTS['run_discovery_test'])
+    test_parser.add_argument('--max_in_flight',
+                             type=int,
+                             default=None,
+                             help="maximum number of queries sent to the search service at the same time.")
+    test_parser.add_argument('--query_timeout',
+                             type=float,
+                             default=None,
+                             help="seconds to wait on a single query before recording it as an error.")
+    test_parser.add_argument('--cache_mode',
+                             type=str,
+                             choices=['disabled', 'read_write', 'replay'],
+                             default=None,
+                             help="serve responses from the response cache. 'replay' never calls the search service.")
+    test_parser.add_argument('--resume',
+                             action='store_true',
+                             help="resume the last unfinished run, skipping the input rows that already have results.")
+    test_parser.add_argument('--output_format',
+                             type=str,
+                             choices=['csv', 'parquet'],
+                             default=None,
+                             help="format of the test output. 'parquet' stores typed top 3 titles and confidence "
+                                  "scores.")
+    test_parser.add_argument('--fusion',
+                             action='store_true',
+                             default=None,
+                             help="query each collection (and each FUSION search service) separately and score the "
+                                  "fused ranking.")
+    test_parser.set_defaults(func=run_discovery_test)
+
+    list_parser = subparsers.add_parser('list_tests', help="list the test scripts that can be run.")
+    list_parser.set_defaults(func=list_tests)
+
+    score_parser = subparsers.add_parser('score_output', help="print the top 3 accuracy of a saved test output.")
+    score_parser.add_argument('output_path', type=str, help="path of a csv output or a parquet output folder.")
+    score_parser.set_defaults(func=score_output)
+
+    history_parser = subparsers.add_parser('run_history', help="print the top 3 accuracy of every recorded run.")
+    history_parser.add_argument('--run_history_path', type=str, default='data/run_history/')
+    history_parser.add_argument('--since', type=str, default=None, help="only runs with a timestamp at or after.")
+    history_parser.add_argument('--until', type=str, default=None, help="only runs with a timestamp at or before.")
+    history_parser.set_defaults(func=run_history)
+
+    return parser
+
+
+def get_command_argv(argv):
+    """
+    Map the command lines of the single command interface onto the subcommands: '--test_script <name>' (deprecated)
+    selects the subcommand, and a command line without one runs the discovery test.
+    :param argv: the command line arguments.
+    :return: the arguments with the subcommand first.
+    """
+    argv = list(argv)
+    for i, arg in enumerate(argv):
+        if arg == '--test_script' or arg.startswith('--test_script='):
+            if '=' in arg:
+                test_script = arg.split('=', 1)[1]
+                del argv[i]
+            else:
+                test_script = argv[i + 1] if i + 1 < len(argv) else ''
+                del argv[i:i + 2]
+            print(f"--test_script is deprecated, use: python main.py {test_script}", file=sys.stderr)
+            return [test_script] + argv
+    if not argv or (argv[0].startswith('-') and argv[0] not in ['-h', '--help']):
+        return ['run_discovery_test'] + argv
+    return argv
+
+
+def main(argv=None):
+    parser = get_parser()
+    args = parser.parse_args(get_command_argv(sys.argv[1:] if argv is None else argv))
+    args.func(args)
+    return 0
 
-def main():
-    if test_script == 'run_discovery_test':
-        run_vodafone_test()
-        
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
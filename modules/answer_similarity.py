@@ -1,14 +1,132 @@
+import numpy as np
 import pandas as pd
-from datasets import Dataset
-from ragas.metrics import answer_similarity
-from ragas import evaluate
+from utils.embedding_funcs import EmbeddingFunctions
 
 
-dataset = pd.read_csv('data/q_a_synthetic_data.csv')
-breakpoint()
-dataset = dataset.to_dict()
-dataset = Dataset.from_dict(dataset)
-score = evaluate(dataset,metrics=[answer_similarity])
-score.to_pandas()
+class AnswerSimilarity:
+    """
+    A class to score the semantic similarity of generated answers to their ground truths, as the cosine similarity of
+    their sentence transformer embeddings (the same measure as the ragas answer_similarity metric, without its per-row
+    overhead).
 
-breakpoint()
+    Answers and ground truths are encoded in large batches, and the similarities of a block of pairs are computed in a
+    single vectorized operation. Ground truth embeddings are kept in the embedding cache of EmbeddingFunctions, so they
+    are only encoded once across runs.
+
+    Attributes:
+        embedding_model (str): The name of the sentence transformer model.
+        threshold (float): If set, similarities are turned into 1/0 scores by comparing them with this threshold.
+        block_size (int): The number of pairs encoded and scored at a time.
+        embedding_functions (EmbeddingFunctions): The embedding functions used to encode the texts.
+
+    Methods:
+        __call__(answers, ground_truths): Score lists of answers against their ground truths.
+        score_dataframe(df): Score the answer and ground truth columns of a DataFrame.
+        score_file(file_path): Score the answer and ground truth columns of a csv file.
+    """
+
+    def __init__(self, embedding_model='all-MiniLM-L6-v2', threshold=None, batch_size=256, block_size=20000,
+                 cache_answers=False, embedding_functions=None):
+        """
+        Constructs all the necessary attributes for the AnswerSimilarity object.
+
+        Parameters:
+            embedding_model (str): The name of the sentence transformer model.
+            threshold (float): If set, similarities at or above it score 1 and the rest 0.
+            batch_size (int): The number of texts encoded by the model at a time.
+            block_size (int): The number of pairs encoded and scored at a time, bounding the memory used.
+            cache_answers (bool): Also keep the answer embeddings in the embedding cache. Answers usually change
+                between runs, so by default only the ground truths are cached.
+            embedding_functions (EmbeddingFunctions): The embedding functions to encode with. A new one with the
+                default embedding cache is created if None.
+        """
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.block_size = block_size
+        self.cache_answers = cache_answers
+        self.embedding_functions = embedding_functions if embedding_functions is not None \
+            else EmbeddingFunctions(batch_size=batch_size)
+
+    @staticmethod
+    def cosine_similarity(a, b):
+        """
+        Calculate the cosine similarity of each row of a with the same row of b.
+
+        Parameters:
+            a (np.ndarray): Array of shape (n, dim).
+            b (np.ndarray): Array of shape (n, dim).
+
+        Returns:
+            np.ndarray: The n cosine similarities.
+        """
+        a_norms = np.linalg.norm(a, axis=1)
+        b_norms = np.linalg.norm(b, axis=1)
+        return np.einsum('ij,ij->i', a, b) / np.maximum(a_norms * b_norms, 1e-12)
+
+    def __call__(self, answers, ground_truths):
+        """
+        Score answers against their ground truths.
+
+        Parameters:
+            answers (list): The generated answers.
+            ground_truths (list): The ground truth answer of each generated answer.
+
+        Returns:
+            np.ndarray: The similarity (or the 1/0 score if a threshold is set) of each pair.
+        """
+        answers = [str(answer) for answer in answers]
+        ground_truths = [str(ground_truth) for ground_truth in ground_truths]
+        if len(answers) != len(ground_truths):
+            raise ValueError("There must be one ground truth per answer.")
+
+        scores = np.zeros(len(answers), dtype=np.float32)
+        for start in range(0, len(answers), self.block_size):
+            stop = start + self.block_size
+            answer_embeddings = self.embedding_functions.create_embedding(
+                answers[start:stop], embedding_model=self.embedding_model, use_cache=self.cache_answers
+            )
+            ground_truth_embeddings = self.embedding_functions.create_embedding(
+                ground_truths[start:stop], embedding_model=self.embedding_model, use_cache=True
+            )
+            scores[start:stop] = self.cosine_similarity(answer_embeddings, ground_truth_embeddings)
+
+        if self.threshold is not None:
+            return (scores >= self.threshold).astype(np.float32)
+        return scores
+
+    def score_dataframe(self, df, answer_column='answer', ground_truth_column='ground_truth',
+                        score_column='answer_similarity'):
+        """
+        Score the answer and ground truth columns of a DataFrame.
+
+        Parameters:
+            df (pd.DataFrame): The DataFrame, for instance data/q_a_synthetic_data.csv.
+            answer_column (str): The column with the generated answers.
+            ground_truth_column (str): The column with the ground truths.
+            score_column (str): The column the scores are written to.
+
+        Returns:
+            pd.DataFrame: A copy of df with the score column added.
+        """
+        df = df.copy()
+        df[score_column] = self(df[answer_column].to_list(), df[ground_truth_column].to_list())
+        return df
+
+    def score_file(self, file_path, **kwargs):
+        """
+        Score the answer and ground truth columns of a csv file.
+
+        Parameters:
+            file_path (str): The path of the csv file.
+
+        Returns:
+            pd.DataFrame: The file contents with the score column added.
+        """
+        return self.score_dataframe(pd.read_csv(file_path), **kwargs)
+
+
+if __name__ == '__main__':
+    # Example usage:
+    scored = AnswerSimilarity().score_file('data/q_a_synthetic_data.csv')
+    print(scored[['question', 'answer_similarity']])
+    print(f"Mean answer similarity: {scored['answer_similarity'].mean():.4f}")
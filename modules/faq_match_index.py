@@ -0,0 +1,134 @@
+import difflib
+import re
+
+
+PIPE_SUFFIX_PATTERN = re.compile(r'\|.*$')
+TOKEN_PATTERN = re.compile(r'\w+')
+
+NO_MATCH = -1
+
+
+def strip_pipe_suffix(title):
+    """Remove everything after the first '|' of a title, e.g. the site name Discovery appends."""
+    return PIPE_SUFFIX_PATTERN.sub('', title)
+
+
+def normalize_title(title):
+    """The match key of a title: the title before any '|', without spaces and in lower case."""
+    return strip_pipe_suffix(title).replace(' ', '').lower()
+
+
+class FAQMatchIndex:
+    """
+    A class to resolve FAQ titles, as written in the test case file or as returned by a search service, to integer ids
+    of a known FAQ catalog. The normalized key of every catalog title is computed once, so resolving a title is a hash
+    lookup, and each distinct title is only resolved once. Checking a returned title against the correct FAQ is then
+    an integer comparison.
+
+    Titles without an exact key match can optionally be resolved by a fuzzy fallback: the catalog title sharing the
+    largest share of word tokens with it (token set Jaccard similarity), with ties broken by edit distance similarity.
+
+    Attributes:
+        titles (list): The catalog titles, the id of a title is its position in the list.
+        fuzzy_threshold (float): The minimum token set similarity of a fuzzy match. No fuzzy matching if None.
+
+    Methods:
+        resolve(title): Get the catalog id and the display title of a title.
+        get_id(title): Get the catalog id of a title.
+        get_ids(titles): Get the catalog ids of several titles.
+    """
+
+    def __init__(self, titles, fuzzy_threshold=None):
+        """
+        Constructs all the necessary attributes for the FAQMatchIndex object.
+
+        Parameters:
+            titles (list): The FAQ catalog titles, for instance the unique 'Correct FAQ' values of a test case file.
+                Titles with the same key share an id.
+            fuzzy_threshold (float): The minimum token set similarity (0 to 1) for a fuzzy match of titles without an
+                exact key match. No fuzzy matching if None.
+        """
+        self.titles = []
+        self.fuzzy_threshold = fuzzy_threshold
+        self.__key_to_id = {}
+        self.__resolved = {}
+
+        for title in titles:
+            key = normalize_title(str(title))
+            if key not in self.__key_to_id:
+                self.__key_to_id[key] = len(self.titles)
+                self.titles.append(str(title))
+
+        # token sets and an inverted index over them, for the fuzzy fallback.
+        self.__token_sets = [self.__tokenize(title) for title in self.titles]
+        self.__token_to_ids = {}
+        for faq_id, tokens in enumerate(self.__token_sets):
+            for token in tokens:
+                self.__token_to_ids.setdefault(token, []).append(faq_id)
+
+    def __len__(self):
+        return len(self.titles)
+
+    @staticmethod
+    def __tokenize(title):
+        return frozenset(TOKEN_PATTERN.findall(strip_pipe_suffix(title).lower()))
+
+    def __fuzzy_match(self, title):
+        tokens = self.__tokenize(title)
+        shared = {}
+        for token in tokens:
+            for faq_id in self.__token_to_ids.get(token, []):
+                shared[faq_id] = shared.get(faq_id, 0) + 1
+        if not shared:
+            return NO_MATCH
+
+        def similarity(faq_id):
+            return shared[faq_id] / len(tokens | self.__token_sets[faq_id])
+
+        best_similarity = max(similarity(faq_id) for faq_id in shared)
+        if best_similarity < self.fuzzy_threshold:
+            return NO_MATCH
+        candidates = [faq_id for faq_id in shared if similarity(faq_id) == best_similarity]
+        if len(candidates) == 1:
+            return candidates[0]
+        key = normalize_title(title)
+        return max(candidates, key=lambda faq_id: difflib.SequenceMatcher(
+            None, key, normalize_title(self.titles[faq_id])).ratio())
+
+    def resolve(self, title):
+        """
+        Get the catalog id and the display title of a title. Results are memoized per distinct title.
+
+        Parameters:
+            title (str): The title, e.g. as returned by the search service. None is treated as an empty title.
+
+        Returns:
+            tuple: The catalog id (NO_MATCH if the title is not in the catalog) and the title before any '|'.
+        """
+        resolved = self.__resolved.get(title)
+        if resolved is None:
+            text = '' if title is None else str(title)
+            faq_id = self.__key_to_id.get(normalize_title(text), NO_MATCH)
+            if faq_id == NO_MATCH and self.fuzzy_threshold is not None and text:
+                faq_id = self.__fuzzy_match(text)
+            resolved = (faq_id, strip_pipe_suffix(text))
+            self.__resolved[title] = resolved
+        return resolved
+
+    def get_id(self, title):
+        """
+        Get the catalog id of a title.
+
+        Returns:
+            int: The catalog id, or NO_MATCH.
+        """
+        return self.resolve(title)[0]
+
+    def get_ids(self, titles):
+        """
+        Get the catalog ids of several titles.
+
+        Returns:
+            list: The catalog id (or NO_MATCH) of each title.
+        """
+        return [self.resolve(title)[0] for title in titles]
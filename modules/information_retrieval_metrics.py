@@ -1,4 +1,6 @@
 import math
+import numpy as np
+import pandas as pd
 
 class InformationRetrievalMetrics:
     """
@@ -86,19 +88,282 @@ class InformationRetrievalMetrics:
 
     def precision_at_k(self, k):
         """Calculate the precision at the top k retrieved documents."""
-        return self.precision()[:k]
+        return InformationRetrievalMetrics(list(self.retrieved)[:k], self.relevant).precision()
 
     def recall_at_k(self, k):
         """Calculate the recall at the top k retrieved documents."""
-        return self.recall()[:k]
-
-# Example usage:
-retrieved = ['doc1', 'doc2', 'doc3', 'doc4', 'doc5']
-relevant = {'doc1', 'doc3', 'doc6', 'doc7'}
-metrics = InformationRetrievalMetrics(retrieved, relevant)
-
-print("Precision:", metrics.precision())
-print("Recall:", metrics.recall())
-print("F1-Score:", metrics.f1_score())
-print("MRR:", metrics.mean_reciprocal_rank())
-print("nDCG:", metrics.ndcg())
+        return InformationRetrievalMetrics(list(self.retrieved)[:k], self.relevant).recall()
+
+
+class BatchInformationRetrievalMetrics:
+    """
+    A class to calculate information retrieval metrics for many queries at once, from a relevance matrix of
+    queries x ranks, with every metric computed as a vectorized NumPy operation over all the queries.
+
+    Attributes:
+        relevance (np.ndarray): queries x ranks matrix of the relevance of the document retrieved at each rank.
+            Binary (0/1) or graded (e.g. 0-3) relevance. Graded values are used as the gains for nDCG.
+        hits (np.ndarray): queries x ranks bool matrix, True where the retrieved document is relevant.
+        graded (bool): whether the relevance is graded rather than binary.
+        lengths (np.ndarray): the number of documents retrieved for each query. Ranks past it are padding.
+        n_relevant (np.ndarray): the number of relevant documents for each query.
+
+    Methods:
+        precision(): Calculate the precision of each query.
+        recall(): Calculate the recall of each query.
+        f1_score(): Calculate the F1 score of each query.
+        mean_reciprocal_rank(): Calculate the reciprocal rank of each query (the mean of which is the MRR).
+        ndcg(): Calculate the normalized discounted cumulative gain of each query.
+        average_precision(): Calculate the average precision of each query (the mean of which is the MAP).
+        precision_at_k(k), recall_at_k(k), ndcg_at_k(k), average_precision_at_k(k): the metrics over the first k ranks.
+        metrics_at_cutoffs(ks): Calculate precision, recall, nDCG and AP at many cutoffs from shared prefix sums.
+        cutoff_table(ks): The metric by cutoff table averaged over all the queries.
+        all_metrics(ks): Calculate every metric, including the @k variants, for every query.
+    """
+
+    def __init__(self, relevance, n_relevant=None, lengths=None):
+        """
+        Constructs all the necessary attributes for the BatchInformationRetrievalMetrics object.
+
+        Parameters:
+            relevance (array-like): queries x ranks matrix of binary or graded relevance.
+            n_relevant (array-like): the number of relevant documents for each query, including the ones that were
+                not retrieved. Defaults to the number of relevant documents retrieved.
+            lengths (array-like): the number of documents retrieved for each query. Defaults to the number of ranks.
+        """
+        relevance = np.asarray(relevance, dtype=np.float64)
+        if relevance.ndim == 1:
+            relevance = relevance[np.newaxis, :]
+        n_queries, n_ranks = relevance.shape
+
+        if lengths is None:
+            self.lengths = np.full(n_queries, n_ranks, dtype=np.int64)
+        else:
+            # zero out the padding past the number of retrieved documents.
+            self.lengths = np.minimum(np.asarray(lengths, dtype=np.int64), n_ranks)
+            relevance = np.where(np.arange(n_ranks)[np.newaxis, :] < self.lengths[:, np.newaxis], relevance, 0.0)
+
+        self.relevance = relevance
+        self.hits = relevance > 0
+        self.graded = not np.array_equal(relevance, self.hits)
+        self.n_ranks = n_ranks
+
+        if n_relevant is None:
+            self.n_relevant = self.hits.sum(axis=1)
+        else:
+            self.n_relevant = np.asarray(n_relevant, dtype=np.int64)
+
+        # discount for each rank: 1 / log2(rank + 1), with ranks starting at 1.
+        self.discounts = 1 / np.log2(np.arange(n_ranks) + 2)
+        self._prefix_sums = None  # built on first use of an @k metric.
+
+    @classmethod
+    def from_dataframe(cls, df, query_column='Query', relevance_column='Is Relevant', rank_column='Retrieval Order'):
+        """
+        Build the relevance matrix from a long format DataFrame with one row per retrieved document, such as the
+        synthetic ranking data from scripts/generate_data.py.
+
+        Parameters:
+            df (pd.DataFrame): the retrieved documents with their query, relevance and rank (starting at 1).
+            query_column (str): the column identifying the query.
+            relevance_column (str): the column with the relevance of the document.
+            rank_column (str): the column with the rank the document was retrieved at.
+
+        Returns:
+            The BatchInformationRetrievalMetrics object and the query labels for its rows.
+        """
+        query_codes, queries = pd.factorize(df[query_column], sort=False)
+        ranks = df[rank_column].to_numpy(dtype=np.int64) - 1
+        relevance = np.zeros((len(queries), ranks.max() + 1), dtype=np.float64)
+        relevance[query_codes, ranks] = df[relevance_column].to_numpy(dtype=np.float64)
+        lengths = np.bincount(query_codes, minlength=len(queries))
+        return cls(relevance, lengths=lengths), queries
+
+    @staticmethod
+    def _safe_divide(numerator, denominator):
+        """Divide element-wise, returning 0 where the denominator is 0."""
+        numerator = np.asarray(numerator, dtype=np.float64)
+        denominator = np.asarray(denominator, dtype=np.float64)
+        out = np.zeros(np.broadcast(numerator, denominator).shape, dtype=np.float64)
+        return np.divide(numerator, denominator, out=out, where=denominator != 0)
+
+    def _ideal_dcg(self, k=None):
+        """The DCG of the ideal ranking of each query, over the first k ranks (all relevant documents if None)."""
+        if not self.graded:
+            # binary relevance: the ideal ranking has every relevant document first.
+            n_ideal = self.n_relevant if k is None else np.minimum(self.n_relevant, k)
+            max_ideal = int(n_ideal.max()) if n_ideal.size else 0
+            ideal_discounts = np.concatenate([[0.0], np.cumsum(1 / np.log2(np.arange(max_ideal) + 2))])
+            return ideal_discounts[n_ideal]
+        # graded relevance: the ideal ranking orders the judged gains from highest to lowest.
+        ideal_gains = -np.sort(-self.relevance, axis=1)[:, :k]
+        return ideal_gains @ self.discounts[:ideal_gains.shape[1]]
+
+    def precision(self):
+        """Calculate the precision of each query as the proportion of retrieved documents that are relevant."""
+        return self._safe_divide(self.hits.sum(axis=1), self.lengths)
+
+    def recall(self):
+        """Calculate the recall of each query as the proportion of relevant documents that are retrieved."""
+        return self._safe_divide(self.hits.sum(axis=1), self.n_relevant)
+
+    def f1_score(self):
+        """Calculate the F1 score of each query, the harmonic mean of precision and recall."""
+        prec = self.precision()
+        rec = self.recall()
+        return self._safe_divide(2 * prec * rec, prec + rec)
+
+    def mean_reciprocal_rank(self):
+        """Calculate the reciprocal rank of the first relevant document of each query (0 if there is none)."""
+        first_hit = self.hits.argmax(axis=1)
+        return np.where(self.hits.any(axis=1), 1 / (first_hit + 1), 0.0)
+
+    def ndcg(self):
+        """Calculate the normalized discounted cumulative gain (nDCG) of each query."""
+        dcg = self.relevance @ self.discounts
+        return self._safe_divide(dcg, self._ideal_dcg())
+
+    def average_precision(self):
+        """Calculate the average precision (AP) of each query as the mean of the precision values at each rank a
+        relevant document is retrieved."""
+        precision_at_ranks = np.cumsum(self.hits, axis=1) / np.arange(1, self.n_ranks + 1)
+        return self._safe_divide((precision_at_ranks * self.hits).sum(axis=1), self.n_relevant)
+
+    def _cumulative(self):
+        """
+        Build, once, the prefix sums over the ranks that every @k metric is read from:
+            hits: the number of relevant documents in the first r ranks.
+            dcg: the DCG of the first r ranks.
+            ideal_dcg: the DCG of the ideal ranking over its first r ranks.
+            precision_sum: the sum of the precision values at the relevant ranks among the first r ranks.
+        Each is a queries x ranks matrix where column r - 1 holds the value for cutoff r.
+        """
+        if self._prefix_sums is None:
+            cum_hits = np.cumsum(self.hits, axis=1)
+            cum_dcg = np.cumsum(self.relevance * self.discounts, axis=1)
+
+            if not self.graded:
+                cum_discounts = np.concatenate([[0.0], np.cumsum(self.discounts)])
+                n_ideal = np.minimum(np.arange(1, self.n_ranks + 1)[np.newaxis, :], self.n_relevant[:, np.newaxis])
+                cum_ideal_dcg = cum_discounts[n_ideal]
+            else:
+                ideal_gains = -np.sort(-self.relevance, axis=1)
+                cum_ideal_dcg = np.cumsum(ideal_gains * self.discounts, axis=1)
+
+            precision_at_ranks = cum_hits / np.arange(1, self.n_ranks + 1)
+            cum_precision_sum = np.cumsum(precision_at_ranks * self.hits, axis=1)
+
+            self._prefix_sums = {
+                'hits': cum_hits,
+                'dcg': cum_dcg,
+                'ideal_dcg': cum_ideal_dcg,
+                'precision_sum': cum_precision_sum
+            }
+        return self._prefix_sums
+
+    def _cutoff_columns(self, ks):
+        """The prefix sum column of each cutoff (cutoffs past the last rank read the last column)."""
+        ks = np.asarray(ks)
+        if np.any(ks < 1):
+            raise ValueError(f"Cutoffs must be at least 1, got {ks[ks < 1].tolist()}.")
+        return np.minimum(ks, self.n_ranks) - 1
+
+    def _at_cutoff(self, name, k):
+        """Read the column of a prefix sum matrix for cutoff k."""
+        return self._cumulative()[name][:, self._cutoff_columns(k)]
+
+    def precision_at_k(self, k):
+        """Calculate the precision of each query over the top k retrieved documents."""
+        return self._safe_divide(self._at_cutoff('hits', k), np.minimum(self.lengths, k))
+
+    def recall_at_k(self, k):
+        """Calculate the recall of each query over the top k retrieved documents."""
+        return self._safe_divide(self._at_cutoff('hits', k), self.n_relevant)
+
+    def ndcg_at_k(self, k):
+        """Calculate the nDCG of each query over the top k retrieved documents."""
+        return self._safe_divide(self._at_cutoff('dcg', k), self._at_cutoff('ideal_dcg', k))
+
+    def average_precision_at_k(self, k):
+        """Calculate the AP of each query over the top k retrieved documents, normalized by the number of relevant
+        documents as average_precision is, so the AP at the last rank is the AP of the full ranking."""
+        return self._safe_divide(self._at_cutoff('precision_sum', k), self.n_relevant)
+
+    def metrics_at_cutoffs(self, ks=(1, 3, 5, 10, 20)):
+        """
+        Calculate precision, recall, nDCG and AP at every cutoff for every query, all read from the prefix sums so
+        that each extra cutoff only costs a column lookup.
+
+        Parameters:
+            ks (iterable): the cutoffs.
+
+        Returns:
+            dict of metric name to a queries x cutoffs array.
+        """
+        ks = list(ks)
+        prefix_sums = self._cumulative()
+        columns = self._cutoff_columns(ks)
+        k_array = np.asarray(ks)[np.newaxis, :]
+        hits = prefix_sums['hits'][:, columns]
+        return {
+            'precision': self._safe_divide(hits, np.minimum(self.lengths[:, np.newaxis], k_array)),
+            'recall': self._safe_divide(hits, self.n_relevant[:, np.newaxis]),
+            'ndcg': self._safe_divide(prefix_sums['dcg'][:, columns], prefix_sums['ideal_dcg'][:, columns]),
+            'average_precision': self._safe_divide(prefix_sums['precision_sum'][:, columns],
+                                                   self.n_relevant[:, np.newaxis])
+        }
+
+    def cutoff_table(self, ks=(1, 3, 5, 10, 20)):
+        """
+        Calculate the metric by cutoff table for the report, averaged over all the queries.
+
+        Parameters:
+            ks (iterable): the cutoffs.
+
+        Returns:
+            pd.DataFrame with a row per metric and a column per cutoff.
+        """
+        ks = list(ks)
+        metrics = self.metrics_at_cutoffs(ks)
+        return pd.DataFrame(
+            {f'@{k}': [metrics[name][:, i].mean() for name in metrics] for i, k in enumerate(ks)},
+            index=list(metrics)
+        )
+
+    def all_metrics(self, ks=(1, 3, 5, 10)):
+        """
+        Calculate every metric for every query.
+
+        Parameters:
+            ks (iterable): the cutoffs for the @k metrics.
+
+        Returns:
+            dict of metric name to an array with the metric value for each query.
+        """
+        metrics = {
+            'precision': self.precision(),
+            'recall': self.recall(),
+            'f1_score': self.f1_score(),
+            'reciprocal_rank': self.mean_reciprocal_rank(),
+            'ndcg': self.ndcg(),
+            'average_precision': self.average_precision()
+        }
+        ks = list(ks)
+        metrics_at_cutoffs = self.metrics_at_cutoffs(ks)
+        for i, k in enumerate(ks):
+            for name in metrics_at_cutoffs:
+                metrics[f'{name}@{k}'] = metrics_at_cutoffs[name][:, i]
+        return metrics
+
+
+if __name__ == '__main__':
+    # Example usage:
+    retrieved = ['doc1', 'doc2', 'doc3', 'doc4', 'doc5']
+    relevant = {'doc1', 'doc3', 'doc6', 'doc7'}
+    metrics = InformationRetrievalMetrics(retrieved, relevant)
+
+    print("Precision:", metrics.precision())
+    print("Recall:", metrics.recall())
+    print("F1-Score:", metrics.f1_score())
+    print("MRR:", metrics.mean_reciprocal_rank())
+    print("nDCG:", metrics.ndcg())
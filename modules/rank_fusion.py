@@ -0,0 +1,186 @@
+"""
+Docstring
+---------
+Fuse the ranked results of several searches of the same query (one per collection, or one per search service) into a
+single ranking. Every ranked list is flattened into one array of documents, so the fused score of every document is
+computed in one vectorized step whatever the number of lists:
+    - 'rrf': reciprocal rank fusion, a document scores sum(weight / (k + rank)) over the lists it appears in. It only
+      uses the ranks, so lists with confidences on different scales fuse fairly.
+    - 'min_max': the confidences of each list are rescaled to 0-1 and summed with the list weights.
+    - 'z_score': the confidences of each list are standardized and summed with the list weights.
+Documents are matched across lists on their document id, which is only meaningful within one search service, or on
+their normalized title (the FAQMatchIndex key), which also matches the same FAQ returned by different search services.
+"""
+import numpy as np
+from modules.faq_match_index import normalize_title
+
+
+FUSION_METHODS = ['rrf', 'min_max', 'z_score']
+
+
+def document_id_key(result):
+    """Match documents on their document id, else on their title."""
+    key = result.get('document_id') or result.get('title')
+    return None if key is None else str(key)
+
+
+def title_key(result):
+    """Match documents on their normalized title, the key the FAQMatchIndex resolves titles with."""
+    title = result.get('title')
+    return None if title is None else normalize_title(str(title))
+
+
+# the key functions by name.
+MATCH_KEYS = {'document_id': document_id_key, 'title': title_key}
+
+
+def get_document_key(result, list_index, rank, key_function=document_id_key):
+    """The key a document is matched on across lists, unique to the result if it has no key."""
+    key = key_function(result)
+    return key if key is not None else f"{list_index}:{rank}"
+
+
+def normalize_scores(scores, list_ids, n_lists, method='min_max'):
+    """
+    Normalize the scores of each list separately, in one pass over all the lists.
+
+    Parameters:
+        scores (np.ndarray): The scores of the documents of every list, concatenated. Missing scores are nan and
+            count as the lowest score of their list.
+        list_ids (np.ndarray): The list index of each score.
+        n_lists (int): The number of lists.
+        method (str): 'min_max' rescales each list to 0-1 (1 for every document of a list of equal scores), 'z_score'
+            standardizes each list to a mean of 0 and a standard deviation of 1.
+
+    Returns:
+        np.ndarray: The normalized scores.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    missing = np.isnan(scores)
+
+    if method == 'min_max':
+        highest = np.full(n_lists, -np.inf)
+        np.maximum.at(highest, list_ids, np.where(missing, -np.inf, scores))
+        lowest = np.full(n_lists, np.inf)
+        np.minimum.at(lowest, list_ids, np.where(missing, np.inf, scores))
+        span = (highest - lowest)[list_ids]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            normalized = np.where(span > 0, (scores - lowest[list_ids]) / span, 1.0)
+        return np.where(missing, 0.0, normalized)
+
+    if method == 'z_score':
+        present = np.bincount(list_ids, weights=~missing, minlength=n_lists)
+        filled = np.where(missing, 0.0, scores)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(list_ids, weights=filled, minlength=n_lists) / present
+            variance = np.bincount(list_ids, weights=filled ** 2, minlength=n_lists) / present - mean ** 2
+            std = np.sqrt(np.maximum(variance, 0.0))
+            normalized = np.where(std[list_ids] > 0, (scores - mean[list_ids]) / std[list_ids], 0.0)
+        # missing scores sit just below the lowest score of their list.
+        lowest = np.full(n_lists, np.inf)
+        np.minimum.at(lowest, list_ids, np.where(missing, np.inf, normalized))
+        lowest = np.where(np.isfinite(lowest), lowest, 0.0)
+        return np.where(missing, lowest[list_ids] - 1.0, normalized)
+
+    raise ValueError(f"Unknown score normalization '{method}'.")
+
+
+def fuse_rankings(keys, list_ids, ranks, scores=None, method='rrf', k=60, weights=None):
+    """
+    Fuse ranked lists given as flat arrays, one entry per document of every list.
+
+    Parameters:
+        keys (np.ndarray): The document key of each entry, documents with the same key are fused.
+        list_ids (np.ndarray): The list index of each entry, from 0.
+        ranks (np.ndarray): The rank of each entry in its list, from 1.
+        scores (np.ndarray): The score of each entry, needed by the 'min_max' and 'z_score' methods.
+        method (str): One of FUSION_METHODS.
+        k (float): The rank offset of reciprocal rank fusion, higher values flatten the weight of the top ranks.
+        weights (list): The weight of each list. Equal weights if None.
+
+    Returns:
+        tuple: The entry index that represents each fused document (its best entry), and the fused scores, both
+        ordered from the best fused score. Ties keep the order of the best rank, then of the first list.
+    """
+    assert method in FUSION_METHODS, f"Unknown fusion method '{method}'."
+    list_ids = np.asarray(list_ids, dtype=np.int64)
+    ranks = np.asarray(ranks, dtype=np.float64)
+    if len(list_ids) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    n_lists = int(list_ids.max()) + 1
+    weights = np.ones(n_lists) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    if method == 'rrf':
+        contributions = weights[list_ids] / (k + ranks)
+    else:
+        contributions = weights[list_ids] * normalize_scores(scores, list_ids, n_lists, method=method)
+
+    unique_keys, inverse = np.unique(np.asarray(keys, dtype=object), return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions, minlength=len(unique_keys))
+
+    # the best entry of each document: highest contribution, then best rank, then first list.
+    order = np.lexsort((list_ids, ranks, -contributions, inverse))
+    _, first = np.unique(inverse[order], return_index=True)
+    best_entry = order[first]
+
+    ranking = np.lexsort((list_ids[best_entry], ranks[best_entry], -fused))
+    return best_entry[ranking], fused[ranking]
+
+
+def fuse_responses(responses, method='rrf', k=60, weights=None, count=None, key_function=document_id_key):
+    """
+    Fuse Discovery shaped query responses of the same query into one response, so the fused ranking can be loaded
+    on a connector and read with the usual getters.
+
+    Parameters:
+        responses (list): The response json packets, e.g. one per collection or per search service.
+        method (str): One of FUSION_METHODS.
+        k (float): The rank offset of reciprocal rank fusion.
+        weights (list): The weight of each response. Equal weights if None.
+        count (int): The number of fused results to keep. All of them if None.
+        key_function (callable): Gets the key a result is matched on across the responses, e.g. title_key to fuse
+            the responses of different search services, whose document ids differ.
+
+    Returns:
+        dict: A response json packet with the fused results. Each result is its best ranked copy among the responses,
+        with the fused score as its confidence: scaled to 0-1 for 'rrf' (1 for a document ranked first everywhere)
+        and 'min_max', standardized for 'z_score'.
+    """
+    results, keys, list_ids, ranks, scores = [], [], [], [], []
+    for list_index, response in enumerate(responses):
+        for rank, result in enumerate((response or {}).get('results') or [], start=1):
+            results.append(result)
+            keys.append(get_document_key(result, list_index, rank, key_function=key_function))
+            list_ids.append(list_index)
+            ranks.append(rank)
+            confidence = (result.get('result_metadata') or {}).get('confidence')
+            scores.append(np.nan if confidence is None else confidence)
+
+    entries, fused = fuse_rankings(
+        keys=keys,
+        list_ids=list_ids,
+        ranks=ranks,
+        scores=scores if method != 'rrf' else None,
+        method=method,
+        k=k,
+        weights=weights
+    )
+
+    # scale the fused scores so a document ranked first (or scored highest) in every list has a confidence of 1.
+    total_weight = len(responses) if weights is None else float(np.sum(weights))
+    if method == 'rrf':
+        fused = fused * (k + 1) / total_weight
+    elif method == 'min_max':
+        fused = fused / total_weight
+
+    fused_results = []
+    for entry, score in zip(entries[:count].tolist(), fused[:count].tolist()):
+        result = dict(results[entry])
+        result['result_metadata'] = dict(result.get('result_metadata') or {}, confidence=score)
+        fused_results.append(result)
+
+    return {
+        'matching_results': len(entries),
+        'results': fused_results,
+        'fusion': {'method': method, 'lists': len(responses)}
+    }
@@ -1,24 +1,53 @@
-from tests.test_discovery_connector import test_discovery_connection
-# from tests.test_ir_metrics import test_ir_metrics
+"""
+Docstring
+---------
+Run a single test function by name, importing only the module it lives in:
+    python run_tests.py test_discovery_connection
+    python run_tests.py --test_function test_discovery_connection
+    python run_tests.py --list
+"""
 import argparse
+import importlib
+import sys
 
 
-# Create an ArgumentParser object
-parser = argparse.ArgumentParser(description="choose the test you want to run")
-parser.add_argument('--test_function',
-                    type=str,
-                    choices=['test_discovery_connection', 'test_ir_metrics'],
-                    default='test_discovery_connection')
+# test functions that can be run, by the module that defines them.
+TEST_FUNCTIONS = {
+    'test_discovery_connection': 'tests.test_discovery_connector',
+    'test_ir_metrics': 'tests.test_ir_metrics',
+}
 
-# parse arguments
-args = parser.parse_args()
 
-# function to test
-test_function = args.test_function
+def run_test(test_function):
+    module = importlib.import_module(TEST_FUNCTIONS[test_function])
+    return getattr(module, test_function)()
 
-def run_test():
-    if test_function == 'test_discovery_connection':
-        response = test_discovery_connection()
-        
 
-run_test()
+def main(argv=None):
+    # Create an ArgumentParser object
+    parser = argparse.ArgumentParser(description="choose the test you want to run")
+    parser.add_argument('test_function',
+                        type=str,
+                        nargs='?',
+                        choices=list(TEST_FUNCTIONS),
+                        default=None)
+    parser.add_argument('--test_function',
+                        dest='test_function_option',
+                        type=str,
+                        choices=list(TEST_FUNCTIONS),
+                        default=None,
+                        help="the test function to run, the same as the positional argument.")
+    parser.add_argument('--list', action='store_true', help="list the test functions that can be run.")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for test_function, module in TEST_FUNCTIONS.items():
+            print(f"{test_function:<32}{module}")
+        return 0
+
+    run_test(args.test_function or args.test_function_option or 'test_discovery_connection')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+Docstring
+---------
+A local HTTP stand-in for the Watson Discovery V2 'query' endpoint (and the IAM token endpoint the connector
+authenticates with), answering from a fixture corpus built from the FAQ titles and URLs in data/input. It has
+configurable latency, jitter and error rates so the whole test pipeline can be load-tested and profiled without
+network access.
+
+Point the connector at it by setting in the environment (or .env):
+    WATSON_DISCOVERY_URL=http://127.0.0.1:<port>
+    WATSON_DISCOVERY_IAM_URL=http://127.0.0.1:<port>
+
+Run with: python -m scripts.discovery_stand_in --port 8765 --latency_ms 150 --jitter_ms 50 --error_rate 0.01
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pandas as pd
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def build_corpus_from_file(file_path='data/input/TestCase_Discovery_Apr2024.csv'):
+    """
+    Build the fixture corpus from the unique FAQ titles and URLs of a test case file.
+    :param file_path: path to a test case csv with 'Correct FAQ' and 'Associated URL' columns.
+    :return: List of documents shaped like Discovery results.
+    """
+    df = pd.read_csv(file_path, encoding='utf-8')
+    df = df[['Correct FAQ', 'Associated URL']].dropna().drop_duplicates(subset='Correct FAQ')
+
+    corpus = []
+    for title, url in zip(df['Correct FAQ'].to_list(), df['Associated URL'].to_list()):
+        corpus.append({
+            'document_id': hashlib.md5(url.encode('utf-8')).hexdigest(),
+            # Discovery titles carry the site name after a pipe, which the test script strips.
+            'title': f"{title} | Vodafone UK",
+            'text': title,
+            'url': url
+        })
+    return corpus
+
+
+def make_access_token(expires_in=3600):
+    """
+    Make an unsigned JWT the IAM token manager can decode to read its expiry.
+    """
+    def encode(part):
+        return base64.urlsafe_b64encode(json.dumps(part).encode('utf-8')).rstrip(b'=').decode('utf-8')
+
+    now = int(time.time())
+    header = encode({'alg': 'RS256', 'typ': 'JWT'})
+    payload = encode({'iat': now, 'exp': now + expires_in, 'sub': 'discovery-stand-in'})
+    signature = base64.urlsafe_b64encode(b'stand-in').rstrip(b'=').decode('utf-8')
+    return f"{header}.{payload}.{signature}"
+
+
+class StandInHTTPServer(ThreadingHTTPServer):
+    # a deep listen backlog so that many concurrent clients are not reset while connecting.
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class DiscoveryStandInServer:
+
+    def __init__(self, corpus=None, host='127.0.0.1', port=0, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 throttle_rate=0.0, seed=None):
+        """
+        Discovery stand-in server class.
+        :param corpus: List of documents to search. Defaults to the corpus built from the Apr2024 test case file.
+        :param host: host to bind to.
+        :param port: port to bind to, 0 picks a free port.
+        :param latency_ms: base latency added to every query response.
+        :param jitter_ms: maximum random latency added on top of the base latency.
+        :param error_rate: fraction of queries answered with a 500 error.
+        :param throttle_rate: fraction of queries answered with a 429 error.
+        :param seed: seed for the latency and error draws.
+        """
+        self.corpus = corpus if corpus is not None else build_corpus_from_file()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.request_count = 0
+        self.token_request_count = 0
+
+        # precompute the document tokens once.
+        self.corpus_tokens = [set(tokenize(doc['title'].split('|')[0] + ' ' + doc['text'])) for doc in self.corpus]
+
+        self.httpd = StandInHTTPServer((host, port), self.__make_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def search(self, query, collection_ids, count=10, characters=200):
+        """
+        Score the corpus against a query by token overlap and return a Discovery shaped response.
+        """
+        query_tokens = set(tokenize(query))
+        scored = []
+        for i, doc_tokens in enumerate(self.corpus_tokens):
+            overlap = len(query_tokens & doc_tokens)
+            if overlap > 0:
+                scored.append((overlap / math.sqrt(len(query_tokens) * len(doc_tokens)), i))
+        scored.sort(key=lambda item: item[0], reverse=True)
+
+        collection_id = collection_ids[0] if collection_ids else 'stand-in-collection'
+        results = []
+        for score, i in scored[:count]:
+            doc = self.corpus[i]
+            results.append({
+                'document_id': doc['document_id'],
+                'result_metadata': {
+                    'document_retrieval_source': 'search',
+                    'collection_id': collection_id,
+                    'confidence': round(score, 5)
+                },
+                'metadata': {'parent_document_id': doc['document_id']},
+                'title': doc['title'],
+                'url': doc['url'],
+                'document_passages': [{
+                    'passage_text': doc['text'][:characters],
+                    'start_offset': 0,
+                    'end_offset': min(len(doc['text']), characters),
+                    'field': 'text'
+                }]
+            })
+
+        return {
+            'matching_results': len(scored),
+            'retrieval_details': {'document_retrieval_strategy': 'untrained'},
+            'results': results
+        }
+
+    def draw_outcome(self):
+        # draw the latency and the outcome of a request.
+        with self.random_lock:
+            self.request_count += 1
+            delay = (self.latency_ms + self.random.uniform(0, self.jitter_ms)) / 1000
+            outcome = self.random.random()
+        if outcome < self.throttle_rate:
+            return delay, 429
+        if outcome < self.throttle_rate + self.error_rate:
+            return delay, 500
+        return delay, 200
+
+    def __make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep connections alive between requests like the real service does.
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else b''
+
+                if path == '/identity/token':
+                    with server.random_lock:
+                        server.token_request_count += 1
+                    self.send_json(200, {
+                        'access_token': make_access_token(),
+                        'refresh_token': 'stand-in',
+                        'token_type': 'Bearer',
+                        'expires_in': 3600,
+                        'expiration': int(time.time()) + 3600
+                    })
+                    return
+
+                if path.startswith('/v2/projects/') and path.endswith('/query'):
+                    delay, status = server.draw_outcome()
+                    time.sleep(delay)
+                    if status != 200:
+                        self.send_json(status, {'code': status, 'error': 'Stand-in injected error'})
+                        return
+
+                    request = json.loads(body or b'{}')
+                    passages = request.get('passages') or {}
+                    response = server.search(
+                        query=request.get('natural_language_query', ''),
+                        collection_ids=request.get('collection_ids', []),
+                        count=request.get('count', 10),
+                        characters=passages.get('characters', 200)
+                    )
+                    self.send_json(200, response)
+                    return
+
+                self.send_json(404, {'code': 404, 'error': f'Unknown path {path}'})
+
+        return Handler
+
+    def start(self):
+        """
+        Start serving in a background thread.
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving and release the port.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="run a local Watson Discovery V2 stand-in server")
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--corpus_file', type=str, default='data/input/TestCase_Discovery_Apr2024.csv')
+    parser.add_argument('--latency_ms', type=float, default=0)
+    parser.add_argument('--jitter_ms', type=float, default=0)
+    parser.add_argument('--error_rate', type=float, default=0.0)
+    parser.add_argument('--throttle_rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    stand_in = DiscoveryStandInServer(
+        corpus=build_corpus_from_file(args.corpus_file),
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed
+    )
+    print(f"Discovery stand-in serving {len(stand_in.corpus)} documents at {stand_in.url}")
+    try:
+        stand_in.httpd.serve_forever()
+    except KeyboardInterrupt:
+        stand_in.httpd.server_close()
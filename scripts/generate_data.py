@@ -1,36 +1,124 @@
+import argparse
+import os
 import pandas as pd
 import numpy as np
 
 
-def generate_ranking_synthetic_data():
-    # Constants
-    NUM_QUERIES = 5
-    DOCS_PER_QUERY = 10
+# how the chance of a retrieved document being relevant is drawn.
+RELEVANCE_DISTRIBUTIONS = [
+    'uniform',  # every document is relevant with relevant_probability.
+    'rank_decay',  # the chance decays with rank: relevant_probability * decay ** (rank - 1), like a working ranker.
+    'query_beta',  # each query draws its own chance from a beta distribution with mean relevant_probability, so some
+                   # queries are easy and some have almost no relevant documents.
+]
 
-    # Seed for reproducibility
-    np.random.seed(42)
 
-    # Create the dataset
-    data = []
-    for query_id in range(1, NUM_QUERIES + 1):
-        # Simulate a random order for documents
-        docs_order = np.random.permutation(DOCS_PER_QUERY) + 1
-        for doc_index, doc_id in enumerate(docs_order):
-            document = f"doc{query_id}_{doc_id}"
-            is_relevant = np.random.choice([0, 1], p=[0.7, 0.3])  # 30% chance of being relevant
-            data.append({
-                "Query": f"Query{query_id}", 
-                "Document ID": document, 
-                "Is Relevant": is_relevant,
-                "Retrieval Order": doc_index + 1  # Add 1 to start from 1 instead of 0
-            })
+def iter_ranking_chunks(num_queries=5, docs_per_query=10, relevant_probability=0.3, seed=42, chunk_queries=10000,
+                        relevance_distribution='uniform', decay=0.85, beta_concentration=2.0, max_grade=0,
+                        grade_weights=None):
+    """
+    Generate synthetic ranking data (the documents retrieved for each query, in retrieval order, with whether they are
+    relevant) as DataFrame chunks, built with vectorized numpy operations so millions of rows can be generated quickly
+    without holding them all in memory.
+    :param num_queries: the number of queries.
+    :param docs_per_query: the number of documents retrieved per query (the ranking depth).
+    :param relevant_probability: the chance of a document being relevant (at the first rank for 'rank_decay', on
+    average over the queries for 'query_beta').
+    :param seed: seed for reproducibility. The same seed and chunk_queries always give the same data.
+    :param chunk_queries: the number of queries per chunk.
+    :param relevance_distribution: one of RELEVANCE_DISTRIBUTIONS.
+    :param decay: the per rank decay of the chance of relevance for 'rank_decay'.
+    :param beta_concentration: the sum of the beta parameters for 'query_beta', lower values spread the queries more.
+    :param max_grade: if above 0, relevant documents also get a relevance grade from 1 to max_grade in a
+    'Relevance Grade' column (0 for documents that are not relevant), to test graded metrics such as nDCG.
+    :param grade_weights: the relative chance of each grade from 1 to max_grade. Defaults to equal chances.
+    :return: generator of DataFrames with 'Query', 'Document ID', 'Is Relevant' and 'Retrieval Order' columns, and
+    'Relevance Grade' if max_grade is above 0.
+    """
+    assert relevance_distribution in RELEVANCE_DISTRIBUTIONS, \
+        f"Unknown relevance distribution '{relevance_distribution}'."
+    if max_grade > 0:
+        grade_weights = np.ones(max_grade) if grade_weights is None else np.asarray(grade_weights, dtype=np.float64)
+        assert len(grade_weights) == max_grade, "There must be one grade weight per grade."
+        grade_probabilities = grade_weights / grade_weights.sum()
 
-    # Convert to DataFrame
-    df = pd.DataFrame(data)
+    rng = np.random.default_rng(seed)
+    retrieval_order = np.arange(1, docs_per_query + 1, dtype=np.int32)
+    order_dtype = np.int16 if docs_per_query < np.iinfo(np.int16).max else np.int32
+    doc_labels = np.array([str(i) for i in range(0, docs_per_query + 1)], dtype=object)
+    for chunk_start in range(0, num_queries, chunk_queries):
+        n_queries = min(chunk_queries, num_queries - chunk_start)
+        query_ids = np.arange(chunk_start + 1, chunk_start + n_queries + 1)
 
-    # Save to CSV
-    csv_file_path = "data/Synthetic_IR_Data.csv"
-    df.to_csv(csv_file_path, index=False)
+        # a random order of the documents of each query, from sorting a random key per document.
+        docs_order = np.argsort(rng.random((n_queries, docs_per_query)), axis=1) + 1
+
+        # the chance of each document being relevant, broadcast to queries x ranks.
+        if relevance_distribution == 'uniform':
+            probabilities = np.full((1, docs_per_query), relevant_probability)
+        elif relevance_distribution == 'rank_decay':
+            probabilities = relevant_probability * decay ** (retrieval_order[np.newaxis, :] - 1)
+        else:
+            a = relevant_probability * beta_concentration
+            probabilities = rng.beta(a, beta_concentration - a, size=(n_queries, 1))
+        is_relevant = rng.random((n_queries, docs_per_query)) < probabilities
+
+        # build the labels of each query once and repeat them, joining object arrays is much faster than np.char.
+        query_labels = np.array([f"Query{i}" for i in query_ids.tolist()], dtype=object)
+        doc_prefixes = np.array([f"doc{i}_" for i in query_ids.tolist()], dtype=object)
+        chunk = {
+            "Query": np.repeat(query_labels, docs_per_query),
+            "Document ID": np.repeat(doc_prefixes, docs_per_query) + doc_labels[docs_order.ravel()],
+            "Is Relevant": is_relevant.ravel().astype(np.int8),
+            "Retrieval Order": np.tile(retrieval_order.astype(order_dtype), n_queries)
+        }
+        if max_grade > 0:
+            grades = rng.choice(np.arange(1, max_grade + 1, dtype=np.int8), size=is_relevant.shape,
+                                p=grade_probabilities)
+            chunk["Relevance Grade"] = np.where(is_relevant, grades, 0).astype(np.int8).ravel()
+        yield pd.DataFrame(chunk)
+
+
+def generate_ranking_synthetic_data(num_queries=5, docs_per_query=10, relevant_probability=0.3, seed=42,
+                                    file_path="data/Synthetic_IR_Data.csv", file_format=None, chunk_queries=10000,
+                                    **kwargs):
+    """
+    Write synthetic ranking data to a csv or parquet file, one chunk at a time, so the size of the data is only limited
+    by the disk.
+    :param file_path: the path of the output file.
+    :param file_format: 'csv' or 'parquet'. Defaults to the extension of file_path.
+    :param kwargs: the relevance settings of iter_ranking_chunks.
+    :return: the number of rows written.
+    """
+    if file_format is None:
+        file_format = 'parquet' if file_path.endswith('.parquet') else 'csv'
+    assert file_format in ['csv', 'parquet'], f"Unknown file format '{file_format}'."
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    chunks = iter_ranking_chunks(num_queries, docs_per_query, relevant_probability, seed, chunk_queries, **kwargs)
+    rows = 0
+    if file_format == 'csv':
+        for i, df in enumerate(chunks):
+            df.to_csv(file_path, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+            rows += len(df)
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            # each chunk is written as a row group, only one chunk is in memory at a time.
+            for df in chunks:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(file_path, table.schema)
+                writer.write_table(table)
+                rows += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+    return rows
 
 
 def generate_q_a_synthetic_data():
@@ -79,4 +167,42 @@ def generate_q_a_synthetic_data():
     df = pd.DataFrame(data_samples)
     df.to_csv('data/q_a_synthetic_data.csv', index=False)
 
-generate_q_a_synthetic_data()
\ No newline at end of file
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="generate synthetic test data")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ranking_parser = subparsers.add_parser('ranking', help="synthetic ranking data for the IR metrics.")
+    ranking_parser.add_argument('--num_queries', type=int, default=5)
+    ranking_parser.add_argument('--docs_per_query', type=int, default=10)
+    ranking_parser.add_argument('--relevance_distribution', type=str, choices=RELEVANCE_DISTRIBUTIONS,
+                                default='uniform')
+    ranking_parser.add_argument('--relevant_probability', type=float, default=0.3)
+    ranking_parser.add_argument('--decay', type=float, default=0.85)
+    ranking_parser.add_argument('--beta_concentration', type=float, default=2.0)
+    ranking_parser.add_argument('--max_grade', type=int, default=0, help="graded relevance from 1 to max_grade.")
+    ranking_parser.add_argument('--seed', type=int, default=42)
+    ranking_parser.add_argument('--file_path', type=str, default='data/Synthetic_IR_Data.csv')
+    ranking_parser.add_argument('--file_format', type=str, choices=['csv', 'parquet'], default=None)
+    ranking_parser.add_argument('--chunk_queries', type=int, default=10000)
+
+    subparsers.add_parser('q_a', help="the sample question/answer/ground truth data.")
+    args = parser.parse_args()
+
+    if args.command == 'ranking':
+        rows = generate_ranking_synthetic_data(
+            num_queries=args.num_queries,
+            docs_per_query=args.docs_per_query,
+            relevant_probability=args.relevant_probability,
+            seed=args.seed,
+            file_path=args.file_path,
+            file_format=args.file_format,
+            chunk_queries=args.chunk_queries,
+            relevance_distribution=args.relevance_distribution,
+            decay=args.decay,
+            beta_concentration=args.beta_concentration,
+            max_grade=args.max_grade
+        )
+        print(f"Wrote {rows} rows to {args.file_path}")
+    else:
+        generate_q_a_synthetic_data()
@@ -1,13 +1,17 @@
+import math
+import os
 import re
 import pandas as pd
 from tqdm import tqdm
 
-from connectors.elasticsearch_connector import WatsonDiscoveryV2Connector
+from connectors.search_service import get_search_connector
+from modules.faq_match_index import FAQMatchIndex, NO_MATCH
 from utils.files_handler import FileHandler
+from utils.run_history import RunHistoryStore, discovery_output_to_table, read_parquet_output
+from utils.timestamps import get_stamp
+from utils.tracing import tracer
 
 
-file_handler = FileHandler()
-
 def replace_after_pipe(text):
     # Pattern to match everything after the first occurrence of '|'
     pattern = r'\|.*$'
@@ -29,10 +33,98 @@ def custom_preprocess(text):
     preprocessed_string = preprocessed_string.lower()
     return preprocessed_string
 
-def run_vodafone_test(version='Apr2024'):
+def normalize_query(text):
+    # queries that only differ in case or spacing get the same key.
+    return ' '.join(str(text).split()).casefold()
+
+def group_queries(queries):
+    """
+    Group queries by their normalized key so that each unique query is only sent once.
+    :param queries: List of queries, for instance the user inputs.
+    :return: the unique queries (in the form they were first seen) and, for every query, the index of its unique query.
+    """
+    unique_queries = []
+    unique_index = {}
+    query_to_unique = []
+    for query in queries:
+        key = normalize_query(query)
+        if key not in unique_index:
+            unique_index[key] = len(unique_queries)
+            unique_queries.append(query)
+        query_to_unique.append(unique_index[key])
+
+    return unique_queries, query_to_unique
+
+def score_response(discovery_instance, correct_faq, match_index):
+    """
+    Score the response currently loaded on the discovery instance against the correct faq.
+    :param discovery_instance: the connector with the query response loaded.
+    :param correct_faq: the faq title expected to be returned for the query.
+    :param match_index: the FAQMatchIndex of the faq catalog, resolving titles to catalog ids.
+    :return: the top title, whether the correct faq is in the top 3 ('Y'/'N') and the top 3 titles with confidence.
+    """
+    # From the results, get the top 3 titles and resolve them to catalog ids.
+    top_3_resolved = [match_index.resolve(title) for title in discovery_instance.get_title(top_k=3)]
+    top_3_titles = [title for _, title in top_3_resolved]
+
+    top_title = top_3_titles[0]
+
+    # compare the catalog ids of the returned titles with the id of the correct faq.
+    correct_faq_id = match_index.get_id(correct_faq)
+    if correct_faq_id != NO_MATCH and any(faq_id == correct_faq_id for faq_id, _ in top_3_resolved):
+        correct_faq_in_top_3 = 'Y'
+    else:
+        correct_faq_in_top_3 = 'N'
+
+    # get top 3 titles with confidence scores.
+    top_3_confidence_scores = discovery_instance.get_result_confidence(top_k=3)
+    top_3_titles_confidence_dict = {}
+    for i in range(0, len(top_3_titles)):
+        title = top_3_titles[i]
+        confidence = top_3_confidence_scores[i]
+
+        # a missing confidence is written as None, which the csv output can be parsed back from, unlike nan.
+        top_3_titles_confidence_dict[title] = None if math.isnan(confidence) else confidence
+
+    return top_title, correct_faq_in_top_3, top_3_titles_confidence_dict
+
+def run_vodafone_test(version='Apr2024', max_in_flight=None, query_timeout=None, cache_mode=None, resume=False,
+                      chunk_size=None, output_format=None, fusion=None):
+    """
+    Run the vodafone test case file through the search service set by SEARCH_SERVICE in the config (Watson Discovery
+    or the local BM25 index) and save the scored output. Rows are appended to the output chunk by chunk as they
+    finish, and a checkpoint manifest records how many rows are done so that an interrupted run can be resumed.
+    Finished runs are added to the run history dataset if it is enabled.
+    :param version: the version of the test case file to run.
+    :param max_in_flight: the maximum number of queries sent to Discovery at the same time. Defaults to the
+    DISPATCH max_in_flight in the config.
+    :param query_timeout: seconds to wait on a single query. Defaults to the DISPATCH query_timeout in the config.
+    :param cache_mode: the response cache mode ('disabled', 'read_write' or 'replay'). Defaults to the RESPONSE_CACHE
+    mode in the config.
+    :param resume: carry on from the checkpoint of an unfinished run instead of starting a new output file.
+    :param chunk_size: the number of rows processed and written out at a time. Defaults to the DISPATCH chunk_size in
+    the config.
+    :param output_format: 'csv', or 'parquet' for a folder of parquet parts with typed top 3 titles and confidences.
+    Defaults to the OUTPUT format in the config. A resumed run keeps the format it was started with.
+    :param fusion: query each collection (and each FUSION search service) separately and score the fused ranking.
+    Defaults to the FUSION enabled setting in the config.
+    """
+
+    file_handler = FileHandler()
+
+    # time the stages of the run, spans of previous runs in the process are dropped.
+    file_handler.get_config(config_file_name='elasticsearch_config')
+    tracing_config = file_handler.config['TRACING']
+    tracer.reset()
+    tracer.enabled = tracing_config['enabled']
+    tracer.keep_spans = bool(tracing_config['enabled'] and tracing_config.get('export_path'))
 
     if version == 'Apr2024':
-        df = file_handler.get_df_from_file('TestCase_Discovery_Apr2024.csv')
+        input_file_name = 'TestCase_Discovery_Apr2024.csv'
+        output_file_name = 'TestCase_Discovery_Apr2024_output'
+        with tracer.span('load_input') as span:
+            df = file_handler.get_df_from_file(input_file_name)
+            span.set('rows', len(df))
 
         # first filter to only keep the test input queries you want.
         df = df.loc[df['keep_faq_for_test'] == 'Y']
@@ -41,77 +133,179 @@ def run_vodafone_test(version='Apr2024'):
         # extract the columns out into lists.
         user_inputs = df['User Input'].to_list()
         correct_faqs = df['Correct FAQ'].to_list()
-        actual_faqs = []
-        correct_faq_in_top_3 = []
         urls = df['Associated URL'].to_list()
-        top_3_titles_with_confidence = []
 
-        # instantiate the discovery class
-        discovery_instance = WatsonDiscoveryV2Connector()
+        # instantiate the search connector selected by SEARCH_SERVICE in the config.
+        discovery_instance = get_search_connector(query_timeout=query_timeout, cache_mode=cache_mode, fusion=fusion)
+        if max_in_flight is None:
+            max_in_flight = discovery_instance.config['DISPATCH']['max_in_flight']
+        if chunk_size is None:
+            chunk_size = discovery_instance.config['DISPATCH']['chunk_size']
+        output_config = discovery_instance.config['OUTPUT']
+        if output_format is None:
+            output_format = output_config['format']
+        assert output_format in ['csv', 'parquet'], f"Unknown output format '{output_format}'."
+
+        # build the match index over the faq catalog once, returned titles are then resolved by hash lookup.
+        match_index = FAQMatchIndex(
+            titles=correct_faqs,
+            fuzzy_threshold=discovery_instance.config['FAQ_MATCH']['fuzzy_threshold']
+        )
 
         # get the queries json for a test query.
         file_handler.get_queries_from_json('vodafone_discovery_queries.json')
         collections_list = file_handler.queries_json["collections"]
-        # run the test response to get query responses.
-
-        for _ in tqdm(range(0, len(user_inputs)), desc="User Inputs/Queries Completed"):
-            query = user_inputs[_]
-            correct_faq = correct_faqs[_]
 
-            discovery_instance.query_response(
-                query=query,
-                collection_ids=collections_list
+        # pick up where an unfinished run of the same input stopped, or start a new output file.
+        checkpoint = file_handler.load_checkpoint(output_file_name) if resume else None
+        if (checkpoint is not None and not checkpoint['completed'] and checkpoint['input_file'] == input_file_name
+                and checkpoint['total_rows'] == len(user_inputs) and os.path.exists(checkpoint['output_file'])):
+            # checkpoints written before parquet output and the run history only cover csv outputs, without a stamp.
+            checkpoint.setdefault('output_format', 'csv')
+            checkpoint.setdefault('output_parts', 0)
+            checkpoint.setdefault('run_stamp', get_stamp())
+            output_file_path = checkpoint['output_file']
+            output_format = checkpoint['output_format']
+            start_row = checkpoint['rows_completed']
+            # drop any rows written after the last checkpoint, they are run again.
+            if output_format == 'csv':
+                with open(output_file_path, 'r+b') as f:
+                    f.truncate(checkpoint['output_bytes'])
+            else:
+                file_handler.remove_parquet_parts(output_file_path, from_index=checkpoint['output_parts'])
+            print(f"Resuming from row {start_row} of {len(user_inputs)}, appending to {output_file_path}.")
+        else:
+            if resume:
+                print("No unfinished run to resume, starting a new run.")
+            run_stamp = get_stamp()
+            output_file_path = file_handler.get_output_file_path(
+                output_file_name, extension='.' + output_format, stamp=run_stamp
             )
-            # From the results, get the top 3 titles.
-            try:
-                top_3_titles = discovery_instance.get_title()[:3]
-                top_3_titles = [replace_after_pipe(title) for title in top_3_titles]
-
-                top_title = top_3_titles[0]
-                actual_faqs.append(top_title)
-
-                # standardize correct_faq and returned titles
-                correct_faq_preprocessed = custom_preprocess(correct_faq)
-                top_3_titles_preprocessed = [custom_preprocess(title) for title in top_3_titles]
-            
-                # compare top title with correct faq.
-                if correct_faq_preprocessed in top_3_titles_preprocessed:
-                    correct_faq_in_top_3.append('Y')
+            start_row = 0
+            checkpoint = {
+                'input_file': input_file_name,
+                'output_file': output_file_path,
+                'output_format': output_format,
+                'run_stamp': run_stamp,
+                'total_rows': len(user_inputs),
+                'rows_completed': 0,
+                'output_bytes': 0,
+                'output_parts': 0,
+                'completed': False
+            }
+            file_handler.save_checkpoint(checkpoint, output_file_name)
+
+        # only send one request per unique query, user inputs that differ in case or spacing share a response.
+        unique_queries, query_to_unique = group_queries(user_inputs)
+        if len(user_inputs) > 0:
+            dedup_ratio = 1 - len(unique_queries) / len(user_inputs)
+            print(f"Deduplicated {len(user_inputs)} user inputs to {len(unique_queries)} unique queries "
+                  f"(dedup ratio {dedup_ratio:.1%}).")
+        # the last row each unique query is used by, so its response can be dropped once that row is written.
+        last_use = {}
+        for row, unique_id in enumerate(query_to_unique):
+            last_use[unique_id] = row
+
+        held_responses = {}
+        progress = tqdm(total=len(user_inputs), initial=start_row, desc="User Inputs/Queries Completed")
+        for chunk_start in range(start_row, len(user_inputs), chunk_size):
+            chunk_rows = range(chunk_start, min(chunk_start + chunk_size, len(user_inputs)))
+
+            # run the unique queries of the chunk that have no response yet concurrently.
+            pending = sorted({query_to_unique[row] for row in chunk_rows} - held_responses.keys())
+            with tracer.span('fetch_responses', queries=len(pending)):
+                pending_responses = discovery_instance.fetch_responses(
+                    queries=[unique_queries[unique_id] for unique_id in pending],
+                    collection_ids=collections_list,
+                    max_in_flight=max_in_flight
+                )
+            held_responses.update(zip(pending, pending_responses))
+
+            actual_faqs = []
+            correct_faq_in_top_3 = []
+            top_3_titles_with_confidence = []
+            for _ in chunk_rows:
+                # fan the response of the unique query back out to the user input.
+                response = held_responses[query_to_unique[_]]
+                correct_faq = correct_faqs[_]
+
+                try:
+                    if isinstance(response, Exception):
+                        raise response
+                    with tracer.span('parse_response'):
+                        discovery_instance.load_response(response)
+                    with tracer.span('score_response'):
+                        top_title, in_top_3, top_3_titles_confidence_dict = score_response(
+                            discovery_instance, correct_faq, match_index
+                        )
+
+                    actual_faqs.append(top_title)
+                    correct_faq_in_top_3.append(in_top_3)
+                    top_3_titles_with_confidence.append(top_3_titles_confidence_dict)
+
+                except Exception as e:
+                    message = f"ERROR: {e}"
+                    actual_faqs.append(message)
+                    correct_faq_in_top_3.append(message)
+                    top_3_titles_with_confidence.append(message)
+                    pass
+
+            # Prepare output
+            output_data = {
+                'User Input': user_inputs[chunk_rows.start:chunk_rows.stop],
+                'Correct FAQ': correct_faqs[chunk_rows.start:chunk_rows.stop],
+                'Actual FAQ returned (Top result)': actual_faqs,
+                'Correct FAQ in top 3': correct_faq_in_top_3,
+                'Top 3 returned FAQ with Confidence Scores': top_3_titles_with_confidence,
+                'Associated URL': urls[chunk_rows.start:chunk_rows.stop]
+            }
+            output_df = pd.DataFrame(output_data)
+
+            # Save output and record the rows as done.
+            with tracer.span('save_output', rows=len(chunk_rows)) as span:
+                if output_format == 'csv':
+                    output_bytes = file_handler.append_df_to_csv(df=output_df, file_path=output_file_path)
+                    span.add_bytes(output_bytes - checkpoint['output_bytes'])
+                    checkpoint['output_bytes'] = output_bytes
                 else:
-                    correct_faq_in_top_3.append('N')
-
-                # get top 3 titles with confidence scores.
-                top_3_confidence_scores = discovery_instance.get_result_confidence()[:3]
-                top_3_titles_confidence_dict = {}
-                for i in range(0, len(top_3_titles)):
-                    title = top_3_titles[i]
-                    confidence = top_3_confidence_scores[i]
-
-                    top_3_titles_confidence_dict[title] = confidence
-                
-                top_3_titles_with_confidence.append(top_3_titles_confidence_dict)
-            
-            except Exception as e:
-                message = f"ERROR: {e}"
-                actual_faqs.append(message)
-                correct_faq_in_top_3.append(message)
-                top_3_titles_with_confidence.append(message)
-                pass
-        
-        # Check to see that all values are equal length.
-        if len(user_inputs) != len(correct_faqs) != len(actual_faqs) != len(correct_faq_in_top_3) != len(top_3_titles_with_confidence) != len(urls):
-            breakpoint() 
-
-        # Prepare output
-        output_data = {
-            'User Input': user_inputs,
-            'Correct FAQ': correct_faqs,
-            'Actual FAQ returned (Top result)': actual_faqs,
-            'Correct FAQ in top 3': correct_faq_in_top_3,
-            'Top 3 returned FAQ with Confidence Scores': top_3_titles_with_confidence,
-            'Associated URL': urls
-        }
-        output_df = pd.DataFrame(output_data)
-        
-        # Save output.
-        file_handler.save_df_to_csv(df=output_df, file_name='TestCase_Discovery_Apr2024_output')
+                    file_handler.write_parquet_part(
+                        table=discovery_output_to_table(output_df),
+                        folder_path=output_file_path,
+                        part_index=checkpoint['output_parts']
+                    )
+                    checkpoint['output_parts'] += 1
+                checkpoint['rows_completed'] = chunk_rows.stop
+                file_handler.save_checkpoint(checkpoint, output_file_name)
+            progress.update(len(chunk_rows))
+
+            # drop the responses no later row needs.
+            for unique_id in [unique_id for unique_id in held_responses if last_use[unique_id] < chunk_rows.stop]:
+                del held_responses[unique_id]
+
+        progress.close()
+        checkpoint['completed'] = True
+        file_handler.save_checkpoint(checkpoint, output_file_name)
+        print(f"Saved output to {output_file_path}")
+
+        # add the finished run to the run history.
+        if output_config['run_history']:
+            if output_format == 'csv':
+                run_table = discovery_output_to_table(pd.read_csv(output_file_path, encoding='UTF-8'))
+            else:
+                run_table = read_parquet_output(output_file_path)
+            with tracer.span('run_history'):
+                RunHistoryStore(output_config['run_history_path']).append_run(
+                    table=run_table,
+                    run_stamp=checkpoint['run_stamp'],
+                    run_name=output_file_name
+                )
+
+        # report where the time of the run went.
+        if tracing_config['enabled']:
+            tracer.print_summary()
+            if tracer.keep_spans:
+                trace_path = os.path.join(
+                    tracing_config['export_path'], f"{output_file_name}_{checkpoint['run_stamp']}.jsonl"
+                )
+                tracer.export_jsonl(trace_path)
+                print(f"Saved trace to {trace_path}")
@@ -0,0 +1,40 @@
+import numpy as np
+import utils.embedding_funcs as embedding_funcs
+from modules.answer_similarity import AnswerSimilarity
+from utils.embedding_funcs import EmbeddingFunctions
+
+
+class BagOfWordsModel:
+    # a tiny deterministic encoder in place of a sentence transformer, counting the calls made to it.
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        self.encoded += len(texts)
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[i, sum(map(ord, word)) % 64] += 1
+        return vectors
+
+
+def test_answer_similarity(tmp_path, monkeypatch):
+    model = BagOfWordsModel()
+    monkeypatch.setattr(embedding_funcs, 'get_embedding_model', lambda embedding_model: model)
+    embedding_functions = EmbeddingFunctions(embedding_cache_path=str(tmp_path / 'embeddings.sqlite'))
+    similarity = AnswerSimilarity(embedding_functions=embedding_functions, block_size=2)
+
+    answers = ['paris is the capital of france', 'the titanic sank in 1905', 'oxygen']
+    ground_truths = ['the capital of france is paris', 'the titanic sank in 1912', 'mount everest']
+    scores = similarity(answers, ground_truths)
+    assert np.isclose(scores[0], 1.0)
+    assert 0 < scores[1] < 1
+    assert scores[2] == 0
+
+    # ground truths come from the embedding cache on the next run, only the answers are encoded again.
+    model.encoded = 0
+    assert np.allclose(similarity(answers, ground_truths), scores)
+    assert model.encoded == len(answers)
+
+    thresholded = AnswerSimilarity(threshold=0.5, embedding_functions=embedding_functions)(answers, ground_truths)
+    assert thresholded.tolist() == [1.0, 1.0, 0.0]
@@ -0,0 +1,12 @@
+from benchmarks.run_benchmarks import BENCHMARKS, compare_with_baseline, run_benchmarks
+
+
+def test_run_benchmarks_and_compare():
+    names = [name for name in BENCHMARKS if name != 'embedding_encode']
+    results = run_benchmarks(size='tiny', names=names, repeat=1, quiet=True)
+    assert set(results) == set(names)
+
+    slower = {name: dict(result, min_s=result['min_s'] * 2) for name, result in results.items()}
+    ratios, regressions = compare_with_baseline(slower, results, tolerance=0.25)
+    assert sorted(regressions) == sorted(names)
+    assert compare_with_baseline(results, slower)[1] == []
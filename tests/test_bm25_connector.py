@@ -0,0 +1,52 @@
+from connectors.bm25_connector import BM25Connector, BM25Index, StringArray
+
+
+def make_index():
+    return BM25Index.build(
+        titles=['Using a dual sim card device', 'Top up my pay as you go sim', 'Roaming charges in Europe'],
+        texts=['', 'Add credit to a sim online', ''],
+        urls=['https://a', 'https://b', 'https://c']
+    )
+
+
+def test_bm25_search_ranks_matching_document_first():
+    index = make_index()
+    (documents, scores, max_score), (no_documents, _, _) = index.search(['dual sim device', 'unknownword'], top_k=2)
+    assert documents[0] == 0
+    assert len(documents) == 2  # both sim documents match.
+    assert scores[0] > scores[1] and scores[0] <= max_score
+    assert len(no_documents) == 0
+
+
+def test_bm25_index_save_and_load(tmp_path):
+    index = make_index()
+    path = str(tmp_path / 'bm25_index.npz')
+    index.save(path)
+    loaded = BM25Index.load(path)
+    for query in ['dual sim', 'roaming europe', 'credit']:
+        (documents, scores, _), = index.search([query])
+        (loaded_documents, loaded_scores, _), = loaded.search([query])
+        assert documents.tolist() == loaded_documents.tolist()
+        assert scores.tolist() == loaded_scores.tolist()
+    assert loaded.titles.tolist() == index.titles.tolist() and loaded.texts[1] == 'Add credit to a sim online'
+
+
+def test_string_array_is_not_padded():
+    texts = ['', 'Ünïcode sim', 'x' * 10000, None]
+    strings = StringArray.from_strings(texts)
+    assert len(strings) == 4 and strings.tolist() == ['', 'Ünïcode sim', 'x' * 10000, '']
+    assert strings[1] == 'Ünïcode sim'
+    # one byte per character of ascii text, instead of 4 bytes times the longest text for every row.
+    assert strings.buffer.nbytes == 10013
+    assert len(StringArray.from_strings([])) == 0
+
+
+def test_bm25_connector_responses():
+    connector = BM25Connector(index=make_index(), count=3)
+    responses = connector.fetch_responses(['dual sim card', 'roaming'], collection_ids=['faq'])
+    connector.load_response(responses[0])
+    assert connector.get_title(top_k=1) == ['Using a dual sim card device']
+    confidences = connector.get_result_confidence(top_k=3)
+    assert all(0 < confidence <= 1 for confidence in confidences)
+    connector.load_response(responses[1])
+    assert connector.get_title(top_k=3) == ['Roaming charges in Europe']
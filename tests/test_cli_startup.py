@@ -0,0 +1,73 @@
+import subprocess
+import sys
+
+
+# modules the quick commands must not import.
+HEAVY_MODULES = ['pandas', 'pyarrow', 'ibm_watson', 'ibm_cloud_sdk_core', 'tqdm', 'dotenv', 'langchain',
+                 'sentence_transformers', 'scripts.run_vodafone_discovery_test']
+# seconds a quick command may take to import main and run. It takes milliseconds without the heavy modules, the budget
+# is generous so a loaded machine does not fail the test.
+STARTUP_BUDGET_SECONDS = 3.0
+
+def run_python(code):
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return completed.stdout
+
+
+def test_quick_commands_do_not_import_heavy_modules():
+    for argv in [['list_tests'], ['--help']]:
+        stdout = run_python(
+            "import sys, main\n"
+            "try:\n"
+            f"    main.main({argv!r})\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            f"print([module for module in {HEAVY_MODULES!r} if module in sys.modules])"
+        )
+        assert stdout.strip().splitlines()[-1] == '[]'
+
+    stdout = run_python(
+        "import sys, run_tests\n"
+        "run_tests.main(['--list'])\n"
+        f"print([module for module in {HEAVY_MODULES!r} if module in sys.modules])"
+    )
+    assert stdout.strip().splitlines()[-1] == '[]'
+
+
+def test_startup_budget():
+    stdout = run_python(
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "main.main(['list_tests'])\n"
+        "print(time.perf_counter() - start)"
+    )
+    assert float(stdout.strip().splitlines()[-1]) < STARTUP_BUDGET_SECONDS
+
+
+def test_embedding_funcs_import_is_light():
+    stdout = run_python(
+        "import sys, utils.embedding_funcs\n"
+        "print([module for module in ['langchain', 'langchain_community', 'sentence_transformers'] "
+        "if module in sys.modules])"
+    )
+    assert stdout.strip() == '[]'
+
+
+def test_main_import_is_light():
+    stdout = run_python(
+        "import sys, main\n"
+        f"print([module for module in {HEAVY_MODULES!r} if module in sys.modules])"
+    )
+    assert stdout.strip() == '[]'
+
+
+def test_legacy_command_lines():
+    from main import get_command_argv, get_parser
+    assert get_command_argv([]) == ['run_discovery_test']
+    assert get_command_argv(['--max_in_flight', '4']) == ['run_discovery_test', '--max_in_flight', '4']
+    assert get_command_argv(['--test_script', 'run_discovery_test']) == ['run_discovery_test']
+    assert get_command_argv(['--test_script=run_discovery_test', '--resume']) == ['run_discovery_test', '--resume']
+    assert get_command_argv(['list_tests']) == ['list_tests']
+    args = get_parser().parse_args(get_command_argv(['--test_script', 'run_discovery_test', '--resume']))
+    assert args.command == 'run_discovery_test' and args.resume
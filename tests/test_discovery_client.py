@@ -0,0 +1,56 @@
+import os
+import stat
+import threading
+import time
+from connectors.discovery_client import PersistentIAMTokenManager, clear_clients, get_discovery_client
+from scripts.discovery_stand_in import DiscoveryStandInServer
+
+
+def test_shared_client_and_persisted_token(tmp_path, monkeypatch):
+    stand_in = DiscoveryStandInServer(corpus=[], seed=0).start()
+    token_cache_path = str(tmp_path / 'iam_tokens.json')
+    try:
+        monkeypatch.setenv('WATSON_DISCOVERY_APIKEY', 'stand-in')
+        monkeypatch.setenv('WATSON_DISCOVERY_VERSION', '2023-03-31')
+        monkeypatch.setenv('WATSON_DISCOVERY_URL', stand_in.url)
+        monkeypatch.setenv('WATSON_DISCOVERY_IAM_URL', stand_in.url)
+
+        client = get_discovery_client(query_timeout=5, pool_size=4, token_cache_path=token_cache_path)
+        assert get_discovery_client(query_timeout=5, pool_size=4, token_cache_path=token_cache_path) is client
+        assert client.http_adapter._pool_maxsize == 4
+
+        token = client.authenticator.token_manager.get_token()
+        client.authenticator.token_manager.get_token()
+        assert stand_in.token_request_count == 1
+        # the token cache holds credentials, so only its owner can read it.
+        assert stat.S_IMODE(os.stat(token_cache_path).st_mode) == 0o600
+
+        # a new process starts from the cached token instead of fetching one.
+        clear_clients()
+        client = get_discovery_client(query_timeout=5, pool_size=4, token_cache_path=token_cache_path)
+        assert client.authenticator.token_manager.get_token() == token
+        assert stand_in.token_request_count == 1
+    finally:
+        clear_clients()
+        stand_in.stop()
+
+
+def test_token_managers_share_token_cache_file(tmp_path):
+    token_cache_path = str(tmp_path / 'iam_tokens.json')
+    token_managers = [PersistentIAMTokenManager(f'apikey-{i}', token_cache_path=token_cache_path) for i in range(8)]
+    for i, token_manager in enumerate(token_managers):
+        token_manager.access_token = f'token-{i}'
+        token_manager.expire_time = time.time() + 3600
+        token_manager.refresh_time = time.time() + 3000
+
+    threads = [threading.Thread(target=token_manager.save_cached_token) for token_manager in token_managers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # no write is lost and no temporary file is left behind.
+    assert os.listdir(tmp_path) == ['iam_tokens.json']
+    for i in range(8):
+        token_manager = PersistentIAMTokenManager(f'apikey-{i}', token_cache_path=token_cache_path)
+        assert token_manager.access_token == f'token-{i}'
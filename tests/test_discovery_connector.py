@@ -1,4 +1,4 @@
-from connectors.elasticsearch_connector import WatsonDiscoveryV2Connector
+from connectors.watson_discovery_connector import WatsonDiscoveryV2Connector
 from utils.files_handler import FileHandler
 
 file_handler = FileHandler()
@@ -0,0 +1,32 @@
+import connectors.discovery_client as discovery_client
+from connectors.discovery_client import clear_clients
+from connectors.watson_discovery_connector import WatsonDiscoveryV2Connector
+from scripts.discovery_stand_in import DiscoveryStandInServer
+
+
+def test_discovery_connector_against_stand_in(tmp_path, monkeypatch):
+    stand_in = DiscoveryStandInServer(seed=0).start()
+    try:
+        # keep the IAM token cache out of the working tree.
+        get_client_config = discovery_client.get_client_config
+        monkeypatch.setattr(discovery_client, 'get_client_config', lambda: dict(
+            get_client_config(), token_cache_path=str(tmp_path / 'iam_tokens.json')))
+        monkeypatch.setenv('WATSON_DISCOVERY_APIKEY', 'stand-in')
+        monkeypatch.setenv('WATSON_DISCOVERY_VERSION', '2023-03-31')
+        monkeypatch.setenv('WATSON_DISCOVERY_PROJECT_ID', 'stand-in-project')
+        monkeypatch.setenv('WATSON_DISCOVERY_URL', stand_in.url)
+        monkeypatch.setenv('WATSON_DISCOVERY_IAM_URL', stand_in.url)
+
+        discovery_instance = WatsonDiscoveryV2Connector(cache_mode='disabled')
+        discovery_instance.query_response(
+            query='How do I manage my dual-SIM phone?',
+            collection_ids=['stand-in-collection']
+        )
+
+        titles = discovery_instance.get_title()
+        assert titles[0].startswith('How do I manage my dual-SIM phone?')
+        confidences = discovery_instance.get_result_confidence()
+        assert confidences == sorted(confidences, reverse=True)
+    finally:
+        clear_clients()
+        stand_in.stop()
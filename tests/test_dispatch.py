@@ -0,0 +1,16 @@
+from utils.dispatch import dispatch_ordered
+import time
+
+
+def test_dispatch_ordered():
+    def slow_double(x):
+        # later items finish first so the output order has to be restored.
+        time.sleep(0.01 * (10 - x))
+        if x == 3:
+            raise ValueError("failed query")
+        return x * 2
+
+    outputs = dispatch_ordered(func=slow_double, items=range(10), max_in_flight=10)
+
+    assert [output for i, output in enumerate(outputs) if i != 3] == [x * 2 for x in range(10) if x != 3]
+    assert isinstance(outputs[3], ValueError)
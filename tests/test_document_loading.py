@@ -0,0 +1,78 @@
+import pytest
+from utils.embedding_funcs import EmbeddingFunctions
+
+
+def write_manuals(folder, n_files=4, n_sections=30):
+    for i in range(0, n_files):
+        sections = [f"Section {j} of manual {i}. " + "Restart the router and check the lights. " * 5
+                    for j in range(0, n_sections)]
+        with open(folder / f"manual_{i}.txt", 'w', encoding='cp1252') as f:
+            f.write('\n \n1.'.join(sections))
+    with open(folder / 'faqs.csv', 'w', encoding='utf-8') as f:
+        f.write('question,answer\nHow do I top up?,Online or in store.\nWhat is eSIM?,A digital SIM.\n')
+
+
+def write_pdf(path, pages):
+    """Write a minimal pdf with one line of Helvetica text per page."""
+    n_pages = len(pages)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(n_pages))
+               + b"] /Count %d >>" % n_pages,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, text in enumerate(pages):
+        stream = b"BT /F1 12 Tf 72 720 Td (" + text.encode('latin-1') + b") Tj ET"
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % (5 + 2 * i))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    content = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(content)
+    content += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    content += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    content += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    path.write_bytes(content)
+
+
+def test_parallel_chunking_matches_streaming(tmp_path):
+    write_manuals(tmp_path)
+    embedding_functions = EmbeddingFunctions()
+
+    serial_content = []
+    for name in ['faqs.csv', 'manual_0.txt', 'manual_1.txt', 'manual_2.txt', 'manual_3.txt']:
+        for content, metadata in embedding_functions.iter_documents(str(tmp_path / name), splitter='recursive'):
+            serial_content.append(content)
+            assert metadata['source'] == str(tmp_path / name)
+
+    parallel = embedding_functions.create_documents_parallel(str(tmp_path), splitter='recursive', max_workers=2)
+    assert parallel['documents_content'] == serial_content
+    assert len(parallel['document_metadata']) == len(serial_content)
+    # the manuals are split into many chunks, the csv into one per row.
+    assert len(serial_content) > 4 * 10 + 2
+
+
+def test_parallel_pdf_page_ranges_match_serial_load(tmp_path):
+    pytest.importorskip('pypdf')
+    pytest.importorskip('langchain_community')
+    pages = [f"Page {i} of the manual: restart the router and check the lights." for i in range(0, 7)]
+    write_pdf(tmp_path / 'manual.pdf', pages)
+    embedding_functions = EmbeddingFunctions()
+
+    serial = list(embedding_functions.iter_documents(str(tmp_path / 'manual.pdf'), chunk_size=40, chunk_overlap=0,
+                                                     splitter='recursive'))
+    # 3 pages per task splits the 7 pages into 3 tasks, run by 2 workers.
+    parallel = embedding_functions.create_documents_parallel(str(tmp_path), chunk_size=40, chunk_overlap=0,
+                                                             splitter='recursive', max_workers=2, pages_per_task=3)
+    assert parallel['documents_content'] == [content for content, _ in serial]
+    assert [metadata['page'] for metadata in parallel['document_metadata']] == list(range(0, 7))
+    assert all(content.startswith(f"Page {i} ") for i, content in enumerate(parallel['documents_content']))
+
+
+def test_custom_splitter_on_plain_strings():
+    embedding_functions = EmbeddingFunctions()
+    documents = embedding_functions.create_documents(['Intro\n1. Top up\n2. Roaming'], custom_splitter=True)
+    assert documents['documents_content'] == [['Intro', ' Top up', ' Roaming']]
+    assert documents['document_metadata'] == [{}]
@@ -0,0 +1,86 @@
+import json
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from connectors.elasticsearch_connector import ElasticsearchConnector
+
+
+DOCUMENTS = [
+    {'_id': '1', 'title': 'How do I set up a Dual SIM phone?', 'text': 'dual sim setup'},
+    {'_id': '2', 'title': 'How do I top up?', 'text': 'top up credit'},
+]
+
+
+def start_msearch_server():
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+            requests_seen.append(self.path)
+            lines = body.strip('\n').split('\n')
+            responses = []
+            for header, search in zip(lines[0::2], lines[1::2]):
+                query = json.loads(search)['query']['multi_match']['query']
+                if query == 'fail':
+                    responses.append({'error': {'type': 'search_phase_execution_exception'}, 'status': 400})
+                    continue
+                hits = [
+                    {'_id': doc['_id'], '_index': json.loads(header)['index'], '_score': 2.0 / (rank + 1),
+                     '_source': {'title': doc['title'], 'text': doc['text']}}
+                    for rank, doc in enumerate(d for d in DOCUMENTS if set(query.split()) & set(d['text'].split()))
+                ]
+                responses.append({'hits': {'total': {'value': len(hits)}, 'max_score': 2.0 if hits else None,
+                                           'hits': hits}})
+            payload = json.dumps({'responses': responses}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, requests_seen
+
+
+def test_elasticsearch_connector_batches_queries(monkeypatch):
+    httpd, requests_seen = start_msearch_server()
+    try:
+        monkeypatch.setenv('ELASTICSEARCH_URL', f"http://127.0.0.1:{httpd.server_address[1]}")
+        connector = ElasticsearchConnector(batch_size=100)
+        queries = ['dual sim', 'top up', 'fail', 'nothing'] * 60
+        responses = connector.fetch_responses(queries, collection_ids=[], max_in_flight=2)
+
+        # 240 queries in batches of 100 is 3 _msearch requests.
+        assert requests_seen == ['/_msearch'] * 3
+        assert len(responses) == len(queries)
+        connector.load_response(responses[0])
+        assert connector.get_title(top_k=3) == ['How do I set up a Dual SIM phone?']
+        assert connector.get_result_confidence(top_k=1) == [1.0]
+        assert isinstance(responses[2], Exception)
+        assert responses[3]['results'] == []
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_elasticsearch_connector_does_not_need_the_watson_sdk():
+    completed = subprocess.run([sys.executable, '-c', (
+        "import sys, connectors.elasticsearch_connector, connectors.search_service\n"
+        "print([module for module in ['ibm_watson', 'ibm_cloud_sdk_core'] if module in sys.modules])"
+    )], capture_output=True, text=True, check=True)
+    assert completed.stdout.strip() == '[]'
+
+
+def test_watson_connector_still_importable_from_old_module():
+    from connectors.elasticsearch_connector import ResponseCache, WatsonDiscoveryV2Connector
+    import connectors.watson_discovery_connector as watson_discovery_connector
+    assert WatsonDiscoveryV2Connector is watson_discovery_connector.WatsonDiscoveryV2Connector
+    assert ResponseCache is watson_discovery_connector.ResponseCache
@@ -0,0 +1,34 @@
+import numpy as np
+import utils.embedding_funcs as embedding_funcs
+from utils.embedding_funcs import EmbeddingFunctions
+
+
+class CountingModel:
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, documents, batch_size=32, convert_to_numpy=True, show_progress_bar=False):
+        self.encoded.append(list(documents))
+        return np.array([[len(document), document.count(' ')] for document in documents], dtype=np.float64)
+
+
+def test_create_embedding_encodes_each_uncached_document_once(tmp_path, monkeypatch):
+    model = CountingModel()
+    monkeypatch.setattr(embedding_funcs, 'get_embedding_model', lambda embedding_model: model)
+    embedding_functions = EmbeddingFunctions(embedding_cache_path=str(tmp_path / 'embeddings.sqlite'))
+
+    # a document already in the cache is not encoded.
+    embedding_functions.create_embedding(['What is eSIM?'])
+    assert model.encoded == [['What is eSIM?']]
+
+    documents = ['How do I top up?', 'What is eSIM?', 'How do I top up?', 'Can I roam in Spain?']
+    embeddings = embedding_functions.create_embedding(documents)
+    assert model.encoded[1] == ['How do I top up?', 'Can I roam in Spain?']
+    assert embeddings.dtype == np.float32 and embeddings.shape == (4, 2)
+    assert np.array_equal(embeddings[0], embeddings[2])
+    assert np.array_equal(embeddings[1], [13, 2])
+
+    # everything is cached now, the model is not called again.
+    assert np.array_equal(embedding_functions.create_embedding(documents), embeddings)
+    assert len(model.encoded) == 2
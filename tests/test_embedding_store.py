@@ -0,0 +1,24 @@
+from utils.embedding_store import EmbeddingStore, EmbeddingStoreWriter
+import numpy as np
+
+
+def test_embedding_store(tmp_path):
+    rng = np.random.default_rng(0)
+    embeddings = rng.random((25, 8), dtype=np.float32)
+    ids = [f'doc{i}' for i in range(0, 25)]
+
+    with EmbeddingStoreWriter(str(tmp_path / 'store'), dim=8, embedding_model='all-MiniLM-L6-v2') as writer:
+        for start in range(0, 25, 10):
+            metadata = [{'source': 'faq.pdf', 'page': i} for i in range(start, min(start + 10, 25))]
+            writer.append(embeddings[start:start + 10], ids=ids[start:start + 10], metadata=metadata)
+
+    store = EmbeddingStore(str(tmp_path / 'store'))
+    assert len(store) == 25 and store.embedding_model == 'all-MiniLM-L6-v2'
+    assert isinstance(store.vectors, np.memmap)
+    assert np.array_equal(store.vectors, embeddings)
+    assert np.array_equal(store.get_embeddings(ids=['doc3', 'doc21']), embeddings[[3, 21]])
+    assert store.get_metadata(21) == {'source': 'faq.pdf', 'page': 21}
+
+    half_store = EmbeddingStore.create(str(tmp_path / 'half_store'), embeddings, ids=ids, dtype='float16')
+    assert half_store.vectors.dtype == np.float16
+    assert np.allclose(half_store.get_embeddings(rows=[0, 1]), embeddings[:2], atol=1e-3)
@@ -0,0 +1,26 @@
+from modules.faq_match_index import FAQMatchIndex, NO_MATCH
+from scripts.run_vodafone_discovery_test import custom_preprocess
+
+
+CATALOG = ['How do I manage my dual-SIM phone?', 'How do I set up a Dual SIM phone?', 'How do I top up?']
+
+
+def test_exact_matches_agree_with_custom_preprocess():
+    index = FAQMatchIndex(CATALOG)
+    returned = ['How do I set up a  Dual SIM phone? | Vodafone UK', 'how do i top up?', 'Roaming charges', None]
+    ids = index.get_ids(returned)
+    assert ids == [1, 2, NO_MATCH, NO_MATCH]
+    for title, faq_id in zip(returned[:3], ids):
+        in_catalog = [custom_preprocess(title) == custom_preprocess(faq) for faq in CATALOG]
+        assert (faq_id != NO_MATCH) == any(in_catalog)
+    assert index.resolve('How do I top up? | Vodafone UK') == (2, 'How do I top up? ')
+    assert index.resolve(None) == (NO_MATCH, '')
+
+
+def test_fuzzy_fallback():
+    exact = FAQMatchIndex(CATALOG)
+    fuzzy = FAQMatchIndex(CATALOG, fuzzy_threshold=0.7)
+    near_miss = 'How can I set up a Dual SIM phone? | Vodafone UK'
+    assert exact.get_id(near_miss) == NO_MATCH
+    assert fuzzy.get_id(near_miss) == 1
+    assert fuzzy.get_id('Roaming charges in Europe') == NO_MATCH
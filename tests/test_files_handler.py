@@ -0,0 +1,88 @@
+from utils.files_handler import FileHandler
+import pandas as pd
+
+
+def test_append_df_to_csv_and_checkpoint(tmp_path):
+    file_handler = FileHandler()
+    file_handler.checkpoints_folder_path = str(tmp_path) + '/checkpoints/'
+    output_file_path = str(tmp_path / 'output.csv')
+
+    first_size = file_handler.append_df_to_csv(pd.DataFrame({'User Input': ['a', 'b']}), output_file_path)
+    file_handler.save_checkpoint({'rows_completed': 2, 'output_bytes': first_size}, 'run')
+    file_handler.append_df_to_csv(pd.DataFrame({'User Input': ['c']}), output_file_path)
+
+    # the header is only written once.
+    assert pd.read_csv(output_file_path)['User Input'].to_list() == ['a', 'b', 'c']
+    assert file_handler.load_checkpoint('run') == {'rows_completed': 2, 'output_bytes': first_size}
+    assert file_handler.load_checkpoint('missing_run') is None
+
+
+def test_get_df_from_file_encoding_detection(tmp_path):
+    file_handler = FileHandler()
+    file_handler.data_input_folder_path = str(tmp_path) + '/'
+    file_handler.encoding_cache_path = str(tmp_path / 'file_encodings.json')
+    file_handler.encoding_sample_bytes = 1024
+
+    # an ascii start longer than the sample, followed by cp1252 only characters.
+    rows = ['User Input'] + ['How do I manage my dual SIM phone'] * 100 + ['Café ‘roaming’ charges €5']
+    (tmp_path / 'test_cases.csv').write_bytes('\n'.join(rows).encode('cp1252'))
+
+    df = file_handler.get_df_from_file('test_cases.csv')
+    assert df['User Input'].iloc[-1] == 'Café ‘roaming’ charges €5'
+
+    # the detected encoding is cached, so a second load does not run detection.
+    file_handler._FileHandler__detect_encoding = None
+    df = file_handler.get_df_from_file('test_cases.csv')
+    assert len(df) == 101
+
+
+def test_early_detection_below_threshold_scans_whole_file(tmp_path, monkeypatch):
+    import chardet
+    scans = []
+
+    class EarlyDetector:
+        # done after its first block, like chardet on a confident looking start, but not confident enough.
+        def __init__(self):
+            self.done = False
+            self.fed = 0
+
+        def feed(self, block):
+            self.fed += len(block)
+            self.done = True
+
+        def close(self):
+            scans.append(self.fed)
+            return {'encoding': 'ISO-8859-1', 'confidence': 0.5}
+
+    monkeypatch.setattr(chardet, 'UniversalDetector', EarlyDetector)
+    file_handler = FileHandler()
+    file_handler.encoding_cache_path = str(tmp_path / 'file_encodings.json')
+    (tmp_path / 'large.csv').write_bytes(b'User Input\n' + b'roaming charges\n' * 10000)
+
+    file_handler._FileHandler__get_file_encoding(str(tmp_path / 'large.csv'))
+    # the sample result is not confident enough, so the whole file is scanned.
+    assert len(scans) == 2
+
+
+def test_encoding_cache_saves_from_many_threads(tmp_path):
+    import os
+    import threading
+    file_handlers = []
+    for i in range(0, 8):
+        file_handler = FileHandler()
+        file_handler.encoding_cache_path = str(tmp_path / 'cache' / 'file_encodings.json')
+        (tmp_path / f'file_{i}.csv').write_bytes(b'User Input\nroaming\n')
+        file_handlers.append(file_handler)
+
+    threads = [
+        threading.Thread(target=file_handler._FileHandler__get_file_encoding, args=(str(tmp_path / f'file_{i}.csv'),))
+        for i, file_handler in enumerate(file_handlers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # every save swapped in a whole file and left no temporary file behind.
+    assert os.listdir(tmp_path / 'cache') == ['file_encodings.json']
+    assert file_handlers[0]._FileHandler__load_encoding_cache() != {}
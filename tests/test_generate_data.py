@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from scripts.generate_data import generate_ranking_synthetic_data, iter_ranking_chunks
+
+
+def test_iter_ranking_chunks():
+    chunks = list(iter_ranking_chunks(num_queries=25, docs_per_query=4, chunk_queries=10))
+    assert [len(chunk) for chunk in chunks] == [40, 40, 20]
+    first = chunks[0]
+    assert first['Query'].iloc[0] == 'Query1' and chunks[-1]['Query'].iloc[-1] == 'Query25'
+    assert first['Retrieval Order'].tolist()[:4] == [1, 2, 3, 4]
+    # each query retrieves every one of its documents once.
+    assert sorted(first['Document ID'].tolist()[:4]) == ['doc1_1', 'doc1_2', 'doc1_3', 'doc1_4']
+
+
+def test_relevance_distributions():
+    uniform = pd.concat(iter_ranking_chunks(20000, 10, relevant_probability=0.3, seed=1))
+    assert abs(uniform['Is Relevant'].mean() - 0.3) < 0.01
+
+    decay = pd.concat(iter_ranking_chunks(20000, 10, relevant_probability=0.8, seed=1,
+                                          relevance_distribution='rank_decay', decay=0.5))
+    by_rank = decay.groupby('Retrieval Order')['Is Relevant'].mean()
+    assert abs(by_rank[1] - 0.8) < 0.02 and abs(by_rank[3] - 0.2) < 0.02
+
+    beta = pd.concat(iter_ranking_chunks(20000, 10, relevant_probability=0.3, seed=1,
+                                         relevance_distribution='query_beta', beta_concentration=1.0))
+    per_query = beta.groupby('Query')['Is Relevant'].mean()
+    assert abs(per_query.mean() - 0.3) < 0.02
+    # queries differ in difficulty far more than with a uniform chance.
+    assert per_query.std() > uniform.groupby('Query')['Is Relevant'].mean().std() * 1.5
+
+
+def test_graded_relevance_and_seed():
+    df = pd.concat(iter_ranking_chunks(1000, 10, max_grade=3, grade_weights=[3, 2, 1], seed=7))
+    grades = df.loc[df['Is Relevant'] == 1, 'Relevance Grade']
+    assert set(grades.unique()) == {1, 2, 3}
+    assert (df.loc[df['Is Relevant'] == 0, 'Relevance Grade'] == 0).all()
+    assert (grades == 1).mean() > (grades == 3).mean()
+
+    again = pd.concat(iter_ranking_chunks(1000, 10, max_grade=3, grade_weights=[3, 2, 1], seed=7))
+    assert df.equals(again)
+
+
+def test_generate_ranking_data_files(tmp_path):
+    csv_path = str(tmp_path / 'ranking.csv')
+    parquet_path = str(tmp_path / 'ranking.parquet')
+    assert generate_ranking_synthetic_data(250, 8, file_path=csv_path, chunk_queries=100) == 2000
+    assert generate_ranking_synthetic_data(250, 8, file_path=parquet_path, chunk_queries=100) == 2000
+
+    from_csv = pd.read_csv(csv_path)
+    parquet_file = pq.ParquetFile(parquet_path)
+    assert parquet_file.metadata.num_row_groups == 3
+    from_parquet = parquet_file.read().to_pandas()
+    assert len(from_csv) == len(from_parquet) == 2000
+    assert from_csv['Document ID'].tolist() == from_parquet['Document ID'].tolist()
+    assert np.array_equal(from_csv['Is Relevant'].to_numpy(), from_parquet['Is Relevant'].to_numpy())
@@ -42,3 +42,75 @@ def test_ir_metrics():
 #     avg_precision = metrics.average_precision()
 #     precision_at_k = metrics.precision_at_k(k=3)
 #     recall_at_k = metrics.recall_at_k(k=3)
+
+
+def test_batch_ir_metrics():
+    import numpy as np
+    from modules.information_retrieval_metrics import BatchInformationRetrievalMetrics
+
+    rng = np.random.default_rng(0)
+    relevance = (rng.random((50, 10)) < 0.3).astype(int)
+    n_relevant = relevance.sum(axis=1) + rng.integers(0, 3, size=50)
+    batch_metrics = BatchInformationRetrievalMetrics(relevance, n_relevant=n_relevant)
+    all_metrics = batch_metrics.all_metrics(ks=(3,))
+
+    for q in range(0, len(relevance)):
+        retrieved = [f'doc{i}' for i in range(0, 10)]
+        relevant = [f'doc{i}' for i in range(0, 10) if relevance[q, i]]
+        relevant += [f'missed{i}' for i in range(0, n_relevant[q] - len(relevant))]
+        metrics = InformationRetrievalMetrics(retrieved=retrieved, relevant=relevant)
+
+        assert np.isclose(all_metrics['precision'][q], metrics.precision())
+        assert np.isclose(all_metrics['recall'][q], metrics.recall())
+        assert np.isclose(all_metrics['f1_score'][q], metrics.f1_score())
+        assert np.isclose(all_metrics['reciprocal_rank'][q], metrics.mean_reciprocal_rank())
+        assert np.isclose(all_metrics['ndcg'][q], metrics.ndcg())
+        assert np.isclose(all_metrics['average_precision'][q], metrics.average_precision())
+        assert np.isclose(all_metrics['precision@3'][q], metrics.precision_at_k(3))
+        assert np.isclose(all_metrics['recall@3'][q], metrics.recall_at_k(3))
+
+
+def test_batch_ir_metrics_at_cutoffs():
+    import numpy as np
+    from modules.information_retrieval_metrics import BatchInformationRetrievalMetrics
+
+    rng = np.random.default_rng(1)
+    relevance = rng.integers(0, 4, size=(30, 20))
+    batch_metrics = BatchInformationRetrievalMetrics(relevance)
+    ks = [1, 3, 5, 10, 20]
+    metrics_at_cutoffs = batch_metrics.metrics_at_cutoffs(ks)
+
+    for i, k in enumerate(ks):
+        # the truncated ranking scored on its own, with the relevant counts of the full ranking.
+        truncated = BatchInformationRetrievalMetrics(relevance[:, :k], n_relevant=batch_metrics.n_relevant)
+        assert np.allclose(metrics_at_cutoffs['precision'][:, i], truncated.precision())
+        assert np.allclose(metrics_at_cutoffs['recall'][:, i], truncated.recall())
+        assert np.allclose(metrics_at_cutoffs['ndcg'][:, i], batch_metrics.ndcg_at_k(k))
+
+    table = batch_metrics.cutoff_table(ks)
+    assert list(table.columns) == ['@1', '@3', '@5', '@10', '@20']
+    assert np.isclose(table.loc['recall', '@20'], 1.0)
+
+
+def test_batch_average_precision_at_last_rank():
+    import numpy as np
+    from modules.information_retrieval_metrics import BatchInformationRetrievalMetrics
+
+    rng = np.random.default_rng(2)
+    relevance = (rng.random((40, 10)) < 0.3).astype(int)
+    batch_metrics = BatchInformationRetrievalMetrics(relevance, n_relevant=relevance.sum(axis=1) + 1)
+    all_metrics = batch_metrics.all_metrics(ks=(batch_metrics.n_ranks,))
+    assert np.allclose(all_metrics[f'average_precision@{batch_metrics.n_ranks}'], batch_metrics.average_precision())
+    assert np.allclose(batch_metrics.average_precision_at_k(batch_metrics.n_ranks), batch_metrics.average_precision())
+
+    for k in [0, -1]:
+        try:
+            batch_metrics.precision_at_k(k)
+            assert False, "a cutoff below 1 should be rejected."
+        except ValueError:
+            pass
+    try:
+        batch_metrics.metrics_at_cutoffs([1, 0])
+        assert False, "a cutoff below 1 should be rejected."
+    except ValueError:
+        pass
@@ -0,0 +1,14 @@
+from scripts.run_vodafone_discovery_test import group_queries
+
+
+def test_group_queries():
+    user_inputs = [
+        'Using a dual sim card device',
+        'using a  dual sim card device ',
+        'Managing my dual sim phone',
+        'Using a dual sim card device'
+    ]
+    unique_queries, query_to_unique = group_queries(user_inputs)
+
+    assert unique_queries == ['Using a dual sim card device', 'Managing my dual sim phone']
+    assert query_to_unique == [0, 0, 1, 0]
@@ -0,0 +1,20 @@
+from connectors.elasticsearch_connector import QueryResults
+import math
+
+
+def test_query_results_view():
+    response = {'results': [
+        {'document_id': 'd1', 'title': 'How do I set up a Dual SIM phone? | Vodafone UK',
+         'result_metadata': {'confidence': 0.4}, 'text': ['Dual SIM']},
+        {'document_id': 'd2', 'result_metadata': {}},
+        {'title': 'How do I find my SIM number or EID?', 'result_metadata': {'confidence': 0.2}}
+    ]}
+    results = QueryResults(response)
+
+    assert len(results) == 3
+    assert results.titles == ['How do I set up a Dual SIM phone? | Vodafone UK', None, 'How do I find my SIM number or EID?']
+    assert results.document_ids[:2] == ['d1', 'd2']
+    assert results.present['title'].tolist() == [True, False, True]
+    assert results.present['confidence'].tolist() == [True, False, True]
+    assert results.confidences[0] == 0.4 and math.isnan(results.confidences[1])
+    assert results.get_column('text', top_k=2) == [['Dual SIM'], None]
@@ -0,0 +1,118 @@
+import math
+import time
+from connectors.base_connector import SearchConnector
+from connectors.fusion_connector import FusionConnector
+from modules.rank_fusion import fuse_responses, normalize_scores
+
+
+def make_response(*documents):
+    return {'results': [
+        {'document_id': document_id, 'title': f"{document_id} | Vodafone UK",
+         'result_metadata': {'confidence': confidence, 'collection_id': 'c'}}
+        for document_id, confidence in documents
+    ]}
+
+
+def test_reciprocal_rank_fusion():
+    fused = fuse_responses([
+        make_response(('a', 0.9), ('b', 0.8), ('c', 0.1)),
+        make_response(('b', 50.0), ('c', 40.0), ('d', 30.0)),
+    ], method='rrf', k=60)
+
+    # b is second and first, a is only first in one list.
+    document_ids = [result['document_id'] for result in fused['results']]
+    assert document_ids == ['b', 'c', 'a', 'd']
+    confidence = fused['results'][0]['result_metadata']['confidence']
+    assert math.isclose(confidence, (1 / 62 + 1 / 61) * 61 / 2)
+    assert fused['matching_results'] == 4
+
+
+def test_score_normalization():
+    scores = [0.9, 0.5, 0.1, 50.0, float('nan'), 30.0]
+    list_ids = [0, 0, 0, 1, 1, 1]
+    normalized = normalize_scores(scores, list_ids, n_lists=2, method='min_max')
+    assert normalized.tolist() == [1.0, 0.5, 0.0, 1.0, 0.0, 0.0]
+
+    normalized = normalize_scores(scores, list_ids, n_lists=2, method='z_score')
+    assert math.isclose(normalized[:3].mean(), 0, abs_tol=1e-12)
+    assert normalized[4] < normalized[5]
+
+    # the raw scale of the second list does not drown the first one.
+    fused = fuse_responses([
+        make_response(('a', 0.9), ('b', 0.1)),
+        make_response(('b', 50.0), ('a', 49.0)),
+    ], method='min_max')
+    assert [result['document_id'] for result in fused['results']] == ['a', 'b']
+
+
+class SlowConnector(SearchConnector):
+
+    def __init__(self, responses, latency=0.2):
+        super().__init__()
+        self.responses = responses
+        self.latency = latency
+
+    def fetch_response(self, query, collection_ids):
+        time.sleep(self.latency)
+        response = self.responses[collection_ids[0]]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_fusion_connector_fans_out_concurrently():
+    connector = SlowConnector({
+        'faq': make_response(('a', 0.9), ('b', 0.5)),
+        'help': make_response(('b', 0.8), ('c', 0.7)),
+        'broken': RuntimeError("collection unavailable"),
+    })
+    fusion_connector = FusionConnector([connector], per_collection=True, method='rrf', rrf_k=60, count=10)
+
+    start = time.perf_counter()
+    fusion_connector.query_response('dual sim', collection_ids=['faq', 'help', 'broken'])
+    assert time.perf_counter() - start < 0.5
+    assert fusion_connector.get_document_ids() == ['b', 'a', 'c']
+    assert fusion_connector.get_title(top_k=1) == ['b | Vodafone UK']
+    assert fusion_connector.response['fusion']['failed_lists'] == 1
+
+    responses = fusion_connector.fetch_responses(['q1', 'q2'], collection_ids=['faq', 'help'], max_in_flight=2)
+    assert [response['results'][0]['document_id'] for response in responses] == ['b', 'b']
+
+    # the query only fails when every source failed.
+    responses = fusion_connector.fetch_responses(['q1'], collection_ids=['broken'])
+    assert isinstance(responses[0], RuntimeError)
+
+
+class FixedConnector(SearchConnector):
+
+    def __init__(self, response):
+        super().__init__()
+        self.response_packet = response
+
+    def fetch_response(self, query, collection_ids):
+        return self.response_packet
+
+
+def test_fusion_across_backends_matches_titles():
+    # the local backend numbers its rows, the remote one has its own ids: only the titles are shared.
+    discovery = FixedConnector({'results': [
+        {'document_id': 'f3a9', 'title': 'How do I set up a Dual SIM phone? | Vodafone UK'},
+        {'document_id': '77c1', 'title': 'Roaming charges | Vodafone UK'},
+    ]})
+    bm25 = FixedConnector({'results': [
+        {'document_id': '0', 'title': 'How do I set up a  dual SIM phone?'},
+        {'document_id': '1', 'title': 'eSIM setup'},
+    ]})
+    other_bm25 = FixedConnector({'results': [
+        {'document_id': '1', 'title': 'Unrelated FAQ'},
+    ]})
+
+    fusion_connector = FusionConnector([discovery, bm25, other_bm25], method='rrf', rrf_k=60, count=10)
+    assert fusion_connector.match_on == 'title'
+    fusion_connector.query_response('dual sim', collection_ids=['faq'])
+
+    titles = fusion_connector.get_title()
+    # the FAQ both backends returned gets the agreement boost, and the colliding row ids are not merged.
+    assert titles[0] == 'How do I set up a Dual SIM phone? | Vodafone UK'
+    assert len(titles) == 4
+    assert 'eSIM setup' in titles and 'Unrelated FAQ' in titles
@@ -0,0 +1,102 @@
+import threading
+import time
+from ibm_cloud_sdk_core import ApiException
+import connectors.discovery_client as discovery_client
+from connectors.discovery_client import clear_clients
+from connectors.watson_discovery_connector import WatsonDiscoveryV2Connector
+from connectors.request_policy import AdaptiveTokenBucket, HedgePolicy, RequestPolicy, RetryPolicy, \
+    get_hedge_executor, shutdown_hedge_executors
+from scripts.discovery_stand_in import DiscoveryStandInServer
+
+
+def test_retries_and_rate_adapts_to_throttling():
+    outcomes = iter([ApiException(429), ApiException(503), 'ok'])
+
+    def request():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    rate_limiter = AdaptiveTokenBucket(rate=100, min_rate=10)
+    policy = RequestPolicy(rate_limiter=rate_limiter, retry_policy=RetryPolicy(max_retries=2, base_delay=0.01))
+    assert policy.call(request) == 'ok'
+    assert policy.stats['retries'] == 2 and policy.stats['throttled'] == 1
+    # halved once on the 429, then raised again a little by the success.
+    assert 50 < rate_limiter.rate < 51
+
+    # errors that are not worth retrying are raised straight away.
+    def not_found():
+        raise ApiException(404)
+
+    try:
+        policy.call(not_found)
+        assert False, "the 404 should be raised."
+    except ApiException as e:
+        assert e.status_code == 404
+    assert policy.stats['retries'] == 2
+
+
+def test_token_bucket_paces_requests():
+    rate_limiter = AdaptiveTokenBucket(rate=50, burst=1)
+    start = time.perf_counter()
+    for _ in range(6):
+        rate_limiter.acquire()
+    # the first token is in the bucket, the next five come at 50 per second.
+    assert time.perf_counter() - start >= 0.09
+
+
+def test_hedged_request_cuts_slow_request():
+    calls = []
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            calls.append(None)
+            n = len(calls)
+        # the 21st request stalls, its duplicate answers quickly.
+        time.sleep(2 if n == 21 else 0.001)
+        return n
+
+    policy = RequestPolicy(hedge_policy=HedgePolicy(percentile=95, min_samples=20, min_delay=0.05))
+    # policies share the hedged request threads instead of starting their own.
+    assert get_hedge_executor(16) is get_hedge_executor(16)
+    try:
+        for _ in range(20):
+            policy.call(request)
+        start = time.perf_counter()
+        assert policy.call(request) == 22
+        assert time.perf_counter() - start < 1
+        assert policy.stats['hedges'] == 1 and policy.stats['hedge_wins'] == 1
+    finally:
+        shutdown_hedge_executors()
+
+
+def test_discovery_connector_retries_stand_in_errors(tmp_path, monkeypatch):
+    stand_in = DiscoveryStandInServer(throttle_rate=0.3, error_rate=0.2, seed=0).start()
+    try:
+        # keep the IAM token cache out of the working tree.
+        get_client_config = discovery_client.get_client_config
+        monkeypatch.setattr(discovery_client, 'get_client_config', lambda: dict(
+            get_client_config(), token_cache_path=str(tmp_path / 'iam_tokens.json')))
+        monkeypatch.setenv('WATSON_DISCOVERY_APIKEY', 'stand-in')
+        monkeypatch.setenv('WATSON_DISCOVERY_VERSION', '2023-03-31')
+        monkeypatch.setenv('WATSON_DISCOVERY_PROJECT_ID', 'stand-in-project')
+        monkeypatch.setenv('WATSON_DISCOVERY_URL', stand_in.url)
+        monkeypatch.setenv('WATSON_DISCOVERY_IAM_URL', stand_in.url)
+
+        discovery_instance = WatsonDiscoveryV2Connector(cache_mode='disabled')
+        discovery_instance.request_policy = RequestPolicy(
+            rate_limiter=AdaptiveTokenBucket(rate=200),
+            retry_policy=RetryPolicy(max_retries=10, base_delay=0.01, max_delay=0.05)
+        )
+        queries = [f"How do I manage my dual-SIM phone {i}?" for i in range(20)]
+        responses = discovery_instance.fetch_responses(queries, collection_ids=['stand-in-collection'],
+                                                       max_in_flight=4)
+
+        assert not any(isinstance(response, Exception) for response in responses)
+        assert discovery_instance.request_policy.stats['retries'] > 0
+        assert discovery_instance.request_policy.stats['throttled'] > 0
+    finally:
+        clear_clients()
+        stand_in.stop()
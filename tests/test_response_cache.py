@@ -0,0 +1,57 @@
+import utils.files_handler as files_handler
+from connectors.watson_discovery_connector import ResponseCache, ResponseCacheMiss, \
+    WatsonDiscoveryV2Connector
+from utils.disk_cache import DiskCache
+import time
+
+
+def test_disk_cache_eviction_and_ttl(tmp_path):
+    cache = DiskCache(path=str(tmp_path / 'cache.sqlite'), max_size_bytes=25, ttl_seconds=0.05)
+    cache.set('a', b'0123456789')
+    cache.set('b', b'0123456789')
+    cache.get('a')  # 'b' is now the least recently used entry.
+    cache.set('c', b'0123456789')
+
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.size_bytes() <= 25
+
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert cache.get('c', ignore_ttl=True) == b'0123456789'
+
+
+def test_response_cache_key():
+    passages = {'enabled': True, 'characters': 200}
+    response_cache = ResponseCache(path=':memory:', passages_config=passages)
+    response = {'results': [{'title': 'How do I manage my dual-SIM phone?'}]}
+    response_cache.set('dual sim', ['collection_1', 'collection_2'], response)
+
+    # collection order does not matter, but the query text and the passages settings do.
+    assert response_cache.get('dual sim', ['collection_2', 'collection_1']) == response
+    assert response_cache.get('dual sim phone', ['collection_1', 'collection_2']) is None
+    other_passages_cache = ResponseCache(path=':memory:', passages_config={'enabled': False})
+    assert other_passages_cache.get_key('dual sim', ['collection_1']) != response_cache.get_key('dual sim', ['collection_1'])
+
+
+def test_replay_connector_needs_no_credentials(tmp_path, monkeypatch):
+    # record the responses in tmp_path rather than in the working tree.
+    read_config_file = files_handler.read_config_file
+
+    def read_test_config(config_path):
+        config = read_config_file(config_path)
+        config['RESPONSE_CACHE']['path'] = str(tmp_path / 'discovery_responses.sqlite')
+        return config
+
+    monkeypatch.setattr(files_handler, 'read_config_file', read_test_config)
+    monkeypatch.delenv('WATSON_DISCOVERY_PROJECT_ID', raising=False)
+    discovery_instance = WatsonDiscoveryV2Connector(cache_mode='replay')
+    assert discovery_instance.discovery_instance is None and discovery_instance.authenticator is None
+    assert discovery_instance.project_id is None and discovery_instance.query_timeout is None
+
+    # a query that was never recorded cannot be replayed.
+    try:
+        discovery_instance.fetch_response('dual sim', ['collection_1'])
+        assert False, "the replay miss should be raised."
+    except ResponseCacheMiss:
+        pass
+    assert (tmp_path / 'discovery_responses.sqlite').exists()
@@ -0,0 +1,47 @@
+from utils.run_history import RunHistoryStore, discovery_output_to_table, top_3_to_records
+import pandas as pd
+import pyarrow.dataset as ds
+
+
+def make_output(in_top_3):
+    return pd.DataFrame({
+        'User Input': ['Using a dual sim card device', 'Managing my dual sim phone'],
+        'Correct FAQ': ['How do I manage my dual-SIM phone?'] * 2,
+        'Actual FAQ returned (Top result)': ['How do I set up a Dual SIM phone? ', 'ERROR: timeout'],
+        'Correct FAQ in top 3': [in_top_3, 'ERROR: timeout'],
+        'Top 3 returned FAQ with Confidence Scores': [
+            "{'How do I set up a Dual SIM phone? ': 0.035, 'How do I manage my dual-SIM phone? ': 0.03}",
+            'ERROR: timeout'
+        ],
+        'Associated URL': ['https://support.vodafone.co.uk/'] * 2
+    })
+
+
+def test_discovery_output_to_table():
+    table = discovery_output_to_table(make_output('Y'))
+    top_3 = table.column('Top 3 returned FAQ with Confidence Scores').to_pylist()
+
+    assert top_3[0] == [{'title': 'How do I set up a Dual SIM phone? ', 'confidence': 0.035},
+                        {'title': 'How do I manage my dual-SIM phone? ', 'confidence': 0.03}]
+    assert top_3[1] is None
+
+
+def test_run_history_store(tmp_path):
+    run_history = RunHistoryStore(str(tmp_path / 'run_history'))
+    run_history.append_run(make_output('N'), run_stamp='2024-05-02-17-15-05-047762', run_name='output')
+    run_history.append_run(make_output('Y'), run_stamp='2024-06-01-09-00-00-000000', run_name='output')
+
+    assert run_history.list_runs() == ['2024-05-02-17-15-05-047762', '2024-06-01-09-00-00-000000']
+    df = run_history.load(filter=ds.field('Correct FAQ in top 3') == 'Y', since='2024-06')
+    assert df['run_stamp'].to_list() == ['2024-06-01-09-00-00-000000']
+
+    trend = run_history.get_accuracy_trend()
+    assert trend['top_3_accuracy'].to_list() == [0.0, 0.5]
+    assert trend['errors'].to_list() == [1, 1]
+
+
+def test_top_3_with_missing_confidence():
+    # outputs written before missing confidences were saved as None hold a bare nan.
+    records = top_3_to_records(str({'a': 0.9, 'b': float('nan')}))
+    assert records == [{'title': 'a', 'confidence': 0.9}, {'title': 'b', 'confidence': None}]
+    assert top_3_to_records(str({'nan title': None})) == [{'title': 'nan title', 'confidence': None}]
@@ -0,0 +1,66 @@
+import json
+import os
+import numpy as np
+from utils.timestamps import log_time
+from utils.tracing import LatencyHistogram, Tracer, tracer
+
+
+def test_histogram_percentiles():
+    latencies = np.random.default_rng(0).lognormal(mean=-3, sigma=1, size=20000)
+    histogram = LatencyHistogram()
+    for latency in latencies:
+        histogram.record(latency)
+    for percentile in [50, 95, 99]:
+        expected = np.percentile(latencies, percentile)
+        # buckets are at most 1/64 of their value wide.
+        assert abs(histogram.percentile(percentile) - expected) / expected < 0.02
+    assert histogram.count == len(latencies)
+    assert histogram.percentile(100) == int(latencies.max() * 1e6) / 1e6
+
+
+def test_tracer_summary_and_export(tmp_path):
+    test_tracer = Tracer(keep_spans=True)
+    for i in range(0, 10):
+        with test_tracer.span('query', index=i) as span:
+            span.add_bytes(100)
+    try:
+        with test_tracer.span('query'):
+            raise ValueError('failed')
+    except ValueError:
+        pass
+
+    summary = test_tracer.summary()['query']
+    assert summary['count'] == 11
+    assert summary['errors'] == 1
+    assert summary['total_bytes'] == 1000
+    assert summary['p50_ms'] <= summary['p99_ms'] <= summary['max_ms']
+
+    path = str(tmp_path / 'traces' / 'run.jsonl')
+    test_tracer.export_jsonl(path)
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert [record['type'] for record in records] == ['span'] * 11 + ['summary']
+    assert records[0]['attributes'] == {'index': 0}
+    assert records[10]['error'] == 'ValueError'
+
+
+def test_tracer_only_keeps_spans_for_export():
+    test_tracer = Tracer()
+    for _ in range(0, 100):
+        with test_tracer.span('query'):
+            pass
+    assert test_tracer.spans == []
+    assert test_tracer.summary()['query']['count'] == 100
+
+
+def test_log_time_creates_logs_folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tracer.reset()
+
+    @log_time
+    def stage():
+        return 1
+
+    assert stage() == 1
+    assert os.path.exists(tmp_path / 'logs' / 'logs.txt')
+    assert tracer.summary()['stage']['count'] == 1
@@ -0,0 +1,74 @@
+import numpy as np
+from connectors.vector_search_connector import ExactIndex, IVFIndex, LocalVectorSearchConnector
+
+
+def make_clustered_vectors(n_documents=2000, dim=32, n_clusters=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    labels = rng.integers(0, n_clusters, size=n_documents)
+    return (centers[labels] + 0.3 * rng.normal(size=(n_documents, dim))).astype(np.float32), centers
+
+
+def test_exact_index_matches_brute_force():
+    documents, centers = make_clustered_vectors(n_documents=500)
+    queries = centers[:10]
+    scores, indices = ExactIndex(documents, block_size=3).search(queries, top_k=5)
+
+    normalized = documents / np.linalg.norm(documents, axis=1, keepdims=True)
+    expected = np.argsort(-(queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T, axis=1)[:, :5]
+    assert (indices == expected).all()
+    assert (np.diff(scores, axis=1) <= 0).all()
+
+
+def test_exact_index_merges_document_blocks():
+    documents, centers = make_clustered_vectors(n_documents=500)
+    queries = centers[:10] + 0.1
+    mask = np.arange(0, len(documents)) % 3 != 0
+    scores, indices = ExactIndex(documents, block_size=4, document_block_size=64).search(queries, top_k=7, mask=mask)
+    expected_scores, expected = ExactIndex(documents, document_block_size=len(documents)).search(
+        queries, top_k=7, mask=mask)
+    assert (indices == expected).all() and np.allclose(scores, expected_scores)
+    assert mask[indices].all()
+
+    # fewer allowed documents than top_k leave empty slots.
+    _, indices = ExactIndex(documents, document_block_size=64).search(queries, top_k=3, mask=np.arange(500) == 70)
+    assert (indices[:, 0] == 70).all() and (indices[:, 1:] == -1).all()
+
+
+def test_ivf_index_recall():
+    documents, centers = make_clustered_vectors()
+    queries = centers + 0.1
+    _, exact = ExactIndex(documents).search(queries, top_k=10)
+
+    index = IVFIndex(documents, n_probe=1)
+    recall_low = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(exact, index.search(queries, top_k=10)[1])])
+    _, all_lists = index.search(queries, top_k=10, n_probe=len(index.centroids))
+    # probing every list is an exact search.
+    assert all(set(a) == set(b) for a, b in zip(exact, all_lists))
+    _, probed = index.search(queries, top_k=10, n_probe=8)
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(exact, probed)])
+    assert recall >= recall_low
+    assert recall >= 0.9
+
+
+def test_search_vectors_responses():
+    documents, centers = make_clustered_vectors(n_documents=200)
+    collections = ['a' if i % 2 == 0 else 'b' for i in range(0, len(documents))]
+    connector = LocalVectorSearchConnector(
+        embeddings=documents,
+        titles=[f"doc {i}" for i in range(0, len(documents))],
+        collection_ids=collections,
+        index_type='ivf',
+        count=3,
+        embedding_functions=object()
+    )
+    responses = connector.search_vectors(centers[:4], collection_ids=['b'])
+    assert len(responses) == 4
+    for response in responses:
+        assert len(response['results']) == 3
+        assert all(result['result_metadata']['collection_id'] == 'b' for result in response['results'])
+
+    connector.load_response(responses[0])
+    assert len(connector.get_title(top_k=3)) == 3
+    confidences = connector.get_result_confidence(top_k=3)
+    assert confidences == sorted(confidences, reverse=True)
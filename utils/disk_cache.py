@@ -0,0 +1,167 @@
+"""
+Docstring
+---------
+A small disk-backed key-value cache built on sqlite, with an optional time to live (TTL) per entry and size-based
+eviction of the least recently used entries. It is safe to share between threads and between processes.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class DiskCache:
+
+    def __init__(self, path, max_size_bytes=None, ttl_seconds=None):
+        """
+        Disk cache class.
+        :param path: the path of the sqlite file holding the cache. Its folder is created if it does not exist.
+        :param max_size_bytes: the maximum total size of the stored values. The least recently used entries are evicted
+        once it is exceeded. No limit if None.
+        :param ttl_seconds: the number of seconds an entry stays valid after it was written. No expiry if None.
+        """
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.ttl_seconds = ttl_seconds
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.__lock:
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self.__connection.commit()
+
+    def get(self, key: str, ignore_ttl=False):
+        """
+        Get a value from the cache.
+        :param key: the key of the entry.
+        :param ignore_ttl: return the entry even if it is older than the TTL.
+        :return: the stored bytes, or None if the key is missing or expired.
+        """
+        now = time.time()
+        with self.__lock:
+            row = self.__connection.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if not ignore_ttl and self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self.__connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.__connection.commit()
+                return None
+
+            self.__connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.__connection.commit()
+        return value
+
+    def get_many(self, keys):
+        """
+        Get many values from the cache in a few queries. Entries older than the TTL are treated as missing.
+        :param keys: the keys of the entries.
+        :return: dict of key to stored bytes, for the keys that are in the cache.
+        """
+        keys = list(keys)
+        now = time.time()
+        found = {}
+        with self.__lock:
+            # sqlite limits the number of parameters of a query, so look the keys up in batches.
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self.__connection.execute(
+                    f"SELECT key, value, created_at FROM cache WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if self.ttl_seconds is None or now - created_at <= self.ttl_seconds:
+                        found[key] = value
+            self.__connection.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", [(now, key) for key in found]
+            )
+            self.__connection.commit()
+        return found
+
+    def set_many(self, items: dict):
+        """
+        Store many values in the cache in one transaction.
+        :param items: dict of key to bytes.
+        """
+        now = time.time()
+        with self.__lock:
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, value, len(value), now, now) for key, value in items.items()]
+            )
+            if self.max_size_bytes is not None:
+                self.__evict()
+            self.__connection.commit()
+
+    def set(self, key: str, value: bytes):
+        """
+        Store a value in the cache, evicting the least recently used entries if the size limit is exceeded.
+        :param key: the key of the entry.
+        :param value: the bytes to store.
+        """
+        now = time.time()
+        with self.__lock:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now)
+            )
+            if self.max_size_bytes is not None:
+                self.__evict()
+            self.__connection.commit()
+
+    def __evict(self):
+        """
+        Remove the least recently used entries until the total size is within max_size_bytes. Expects the lock to be
+        held by the caller.
+        """
+        total_size = self.__connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        rows = self.__connection.execute("SELECT key, size FROM cache ORDER BY accessed_at ASC")
+        evict_keys = []
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            evict_keys.append((key,))
+            total_size -= size
+        self.__connection.executemany("DELETE FROM cache WHERE key = ?", evict_keys)
+
+    def size_bytes(self):
+        """
+        :return: the total size of the stored values.
+        """
+        with self.__lock:
+            return self.__connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self.__lock:
+            self.__connection.execute("DELETE FROM cache")
+            self.__connection.commit()
+
+    def __contains__(self, key):
+        with self.__lock:
+            row = self.__connection.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
@@ -0,0 +1,48 @@
+"""
+Docstring
+---------
+Helpers to send many independent requests (e.g. search queries) concurrently, with a bound on how many are in
+flight at once, while handing the outputs back in the same order as the inputs.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, List
+from tqdm import tqdm
+
+
+def dispatch_ordered(func: Callable, items: Iterable, max_in_flight: int = 8, desc: str = None) -> List:
+    """
+    Apply func to every item using at most max_in_flight worker threads. Exceptions raised by func are captured and
+    returned in place of the output for that item, so one failed request does not stop the rest of the run.
+    :param func: callable taking a single item, for instance a query string.
+    :param items: the inputs, in the order the outputs should be returned in.
+    :param max_in_flight: the maximum number of calls running at the same time. 1 runs the calls sequentially.
+    :param desc: description for the progress bar. No progress bar is shown if None.
+    :return: List of outputs (or the exception raised) ordered as the inputs.
+    """
+    items = list(items)
+    outputs = [None] * len(items)
+    progress = tqdm(total=len(items), desc=desc) if desc is not None else None
+
+    def call(index):
+        try:
+            outputs[index] = func(items[index])
+        except Exception as e:
+            # keep the exception as the output so the caller can report it against the right row.
+            outputs[index] = e
+
+    if max_in_flight is None or max_in_flight <= 1:
+        for index in range(0, len(items)):
+            call(index)
+            if progress is not None:
+                progress.update(1)
+    else:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            futures = [executor.submit(call, index) for index in range(0, len(items))]
+            for _ in as_completed(futures):
+                if progress is not None:
+                    progress.update(1)
+
+    if progress is not None:
+        progress.close()
+
+    return outputs
@@ -3,18 +3,151 @@ Docstring
 ---------
 Functions to create embeddings. Needs to be updated to have more models incorporated and also part of the BaseModel
 and Model Connector classes (with config for models). Currently only uses the SentenceTransformer class.
+langchain and sentence_transformers are slow to import, so they are imported by the functions that use them.
 """
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import CharacterTextSplitter, RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader, PyPDFLoader, CSVLoader
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
+import hashlib
+import numpy as np
+import os
 import re
+import threading
+from utils.disk_cache import DiskCache
+from utils.embedding_store import EmbeddingStoreWriter
 
 
+# process-wide cache of loaded embedding models, so the model weights are only loaded once per process.
+_embedding_models = {}
+_embedding_models_lock = threading.Lock()
+
+
+def get_embedding_model(embedding_model='all-MiniLM-L6-v2'):
+    """
+    Get a sentence transformer model from the process-wide model cache, loading it on first use.
+    :param embedding_model: the name of the sentence transformer model.
+    :return: the SentenceTransformer model.
+    """
+    with _embedding_models_lock:
+        if embedding_model not in _embedding_models:
+            from sentence_transformers import SentenceTransformer
+            _embedding_models[embedding_model] = SentenceTransformer(embedding_model)
+            print(f"Instantiated Sentence Transformer Model: {_embedding_models[embedding_model]}.")
+        return _embedding_models[embedding_model]
+
+
+def get_text_splitter(splitter='character', chunk_size=500, chunk_overlap=50):
+    """
+    Create the langchain text splitter used to chunk documents.
+    :param splitter: 'character' or 'recursive'.
+    :return: the text splitter.
+    """
+    from langchain.text_splitter import CharacterTextSplitter, RecursiveCharacterTextSplitter
+
+    if splitter == 'character':
+        return CharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            separator="\ufeff"
+        )
+    elif splitter == 'recursive':
+        return RecursiveCharacterTextSplitter(
+            separators=[r'\n \n\d.'],
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            is_separator_regex=True
+        )
+    return None
+
+
+def get_file_type(file_path):
+    """The file type of a file from its extension, e.g. 'pdf'."""
+    return os.path.splitext(file_path)[1].lower().lstrip('.')
+
+
+def get_pdf_page_count(file_path):
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def lazy_load_collection(file_path, file_type=None, page_start=None, page_stop=None):
+    """
+    Load a file one page (pdf), row (csv) or file (txt) at a time, instead of the whole collection at once.
+    :param file_path: the path of the file.
+    :param file_type: one of 'txt', 'pdf' or 'csv'. Defaults to the file extension.
+    :param page_start: for pdfs, the first page to load.
+    :param page_stop: for pdfs, the page to stop before. Both None loads every page.
+    :return: generator of langchain Documents.
+    """
+    from langchain_community.document_loaders import TextLoader, PyPDFLoader, CSVLoader
+
+    if file_type is None:
+        file_type = get_file_type(file_path)
+    if file_type == 'pdf' and (page_start is not None or page_stop is not None):
+        # read only the requested pages, with the same metadata as PyPDFLoader.
+        from langchain_core.documents import Document
+        from pypdf import PdfReader
+        reader = PdfReader(file_path)
+        for page in range(page_start or 0, min(page_stop or len(reader.pages), len(reader.pages))):
+            yield Document(page_content=reader.pages[page].extract_text(), metadata={'source': file_path, 'page': page})
+        return
+
+    if file_type == 'txt':
+        loader = TextLoader(file_path, encoding="1252")
+    elif file_type == 'pdf':
+        loader = PyPDFLoader(file_path)
+    elif file_type == 'csv':
+        loader = CSVLoader(file_path)
+    else:
+        raise ValueError(f"Unsupported file type '{file_type}'.")
+    yield from loader.lazy_load()
+
+
+def iter_file_chunks(file_path, file_type=None, chunk_size=500, chunk_overlap=50, splitter='character',
+                     page_start=None, page_stop=None):
+    """
+    Load a file lazily and chunk it page by page, so only one page and its chunks are in memory at a time. Chunks do
+    not span pages.
+    :return: generator of (chunk text, metadata) tuples.
+    """
+    text_splitter = get_text_splitter(splitter, chunk_size, chunk_overlap)
+    for page in lazy_load_collection(file_path, file_type, page_start, page_stop):
+        for document in text_splitter.split_documents([page]):
+            yield document.page_content, document.metadata
+
+
+def _chunk_file_task(task):
+    # run in the worker processes of EmbeddingFunctions.iter_documents_parallel.
+    file_path, file_type, page_start, page_stop, chunk_size, chunk_overlap, splitter = task
+    documents_content = []
+    document_metadata = []
+    for content, metadata in iter_file_chunks(file_path, file_type, chunk_size, chunk_overlap, splitter,
+                                              page_start, page_stop):
+        documents_content.append(content)
+        document_metadata.append(metadata)
+    return {
+        'documents_content': documents_content,
+        'document_metadata': document_metadata
+    }
+
+
+def get_content_hash(text, embedding_model):
+    """
+    Key of a text in the embedding cache. The model name is part of the key as each model has its own embeddings.
+    """
+    return hashlib.sha256((embedding_model + '\0' + text).encode('utf-8')).hexdigest()
+
 
 class EmbeddingFunctions:
 
-    def __init__(self):
+    def __init__(self, batch_size=64, embedding_cache_path='data/cache/embeddings.sqlite'):
+        """
+        Embedding functions class.
+        :param batch_size: the number of documents encoded by the model at a time.
+        :param embedding_cache_path: the path of the cache of embeddings keyed by content hash. No cache if None.
+        """
         self.embedding_models = [
             'all-MiniLM-L6-v2'
             ]
@@ -22,11 +155,17 @@ class EmbeddingFunctions:
         self.FILE_TYPE_PDF = "pdf"
         self.FILE_TYPE_CSV = "csv"
 
+        self.batch_size = batch_size
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_cache = None  # opened on first use.
+
 
     def get_collection_from_file(self, file_path, file_type):
         """
         A function that takes in a file from local and creates a collection from it.
         """
+        from langchain_community.document_loaders import TextLoader, PyPDFLoader, CSVLoader
+
         collection = None
         # load the relevant file based on file type (currently supports pdfs and txt).
         if file_type == self.FILE_TYPE_TXT:
@@ -42,43 +181,30 @@ class EmbeddingFunctions:
         return collection
 
 
-    def create_documents(collection: list, 
-                        chunk_size=500, 
-                        chunk_overlap=50, 
-                        splitter='character', 
-                        custom_splitter=False):
+    def create_documents(self,
+                         collection: list,
+                         chunk_size=500,
+                         chunk_overlap=50,
+                         splitter='character',
+                         custom_splitter=False):
         """
         A function that takes in a whole file collection and chunks the text into separate documents.
         """
         if custom_splitter:
             if str(type(collection[0])) == "<class 'langchain_core.documents.base.Document'>":
-                collection_content = ""
-                for doc in collection:
-                    collection_content += doc.page_content
+                # join once, concatenating page by page copies the text collected so far for every page.
+                collection_content = "".join(doc.page_content for doc in collection)
                 documents_content = re.split(r'\n \n\d.|\n\d.', collection_content)
+                doc_metadata = [doc.metadata for doc in collection]
 
             else:
                 documents_content = [re.split(r'\n \n\d.|\n\d.', doc) for doc in collection]
-            doc_metadata = [doc.metadata for doc in collection]
+                # plain strings carry no metadata.
+                doc_metadata = [{} for _ in collection]
 
         else:
-            text_splitter = None
             print("""Creating documents from text collection.""")
-            if splitter == 'character':
-                text_splitter = CharacterTextSplitter(
-                    chunk_size=chunk_size,
-                    chunk_overlap=chunk_overlap,
-                    length_function=len,
-                    separator="\ufeff"
-                )
-            elif splitter == 'recursive':
-                text_splitter = RecursiveCharacterTextSplitter(
-                    separators=[r'\n \n\d.'],
-                    chunk_size=chunk_size,
-                    chunk_overlap=chunk_overlap,
-                    length_function=len,
-                    is_separator_regex=True
-                )
+            text_splitter = get_text_splitter(splitter, chunk_size, chunk_overlap)
             documents = text_splitter.split_documents(collection)
             documents_content = [doc.page_content for doc in documents]
             doc_metadata = [doc.metadata for doc in documents]
@@ -90,32 +216,194 @@ class EmbeddingFunctions:
             }
 
 
-    def create_embedding(documents: List, embedding_model='all-MiniLM-L6-v2'):
-        # instantiate the sentence transformer embeddings model.
-        model = SentenceTransformer(embedding_model)
-        print(f"Instantiated Sentence Transformer Model: {model}. Creating Embeddings.")
+    def iter_documents(self, file_path, file_type=None, chunk_size=500, chunk_overlap=50, splitter='character'):
+        """
+        Stream the chunks of a file, loading and splitting it one page at a time.
+        :return: generator of (chunk text, metadata) tuples.
+        """
+        return iter_file_chunks(file_path, file_type, chunk_size, chunk_overlap, splitter)
+
+    def iter_documents_parallel(self, paths, chunk_size=500, chunk_overlap=50, splitter='character',
+                                max_workers=None, pages_per_task=50, file_types=('pdf', 'txt', 'csv')):
+        """
+        Chunk many files in parallel in a process pool. Folders are expanded to the files in them, and large pdfs are
+        split into tasks of pages_per_task pages so a single big manual is also spread over the cores. At most two
+        tasks per worker are pending at a time, so memory stays bounded however many files there are.
+        :param paths: file or folder paths.
+        :param max_workers: the number of worker processes. Defaults to the number of cores.
+        :param pages_per_task: the number of pdf pages chunked per task. None chunks every pdf as a single task.
+        :param file_types: the file types picked up from folders.
+        :return: generator of {'documents_content', 'document_metadata'} dicts, one per task, in file and page order.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        file_paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                file_paths.extend(
+                    os.path.join(path, name) for name in sorted(os.listdir(path))
+                    if get_file_type(name) in file_types
+                )
+            else:
+                file_paths.append(path)
+
+        def iter_tasks():
+            for file_path in file_paths:
+                file_type = get_file_type(file_path)
+                if file_type == 'pdf' and pages_per_task is not None:
+                    n_pages = get_pdf_page_count(file_path)
+                    for page_start in range(0, n_pages, pages_per_task):
+                        yield (file_path, file_type, page_start, min(page_start + pages_per_task, n_pages),
+                               chunk_size, chunk_overlap, splitter)
+                else:
+                    yield file_path, file_type, None, None, chunk_size, chunk_overlap, splitter
+
+        max_workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            for task in iter_tasks():
+                pending.append(executor.submit(_chunk_file_task, task))
+                if len(pending) >= 2 * max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def create_documents_parallel(self, paths, **kwargs):
+        """
+        Chunk many files in parallel with iter_documents_parallel and collect every chunk.
+        :return: dict with the 'documents_content' and 'document_metadata' lists, as create_documents.
+        """
+        documents_content = []
+        document_metadata = []
+        for documents in self.iter_documents_parallel(paths, **kwargs):
+            documents_content.extend(documents['documents_content'])
+            document_metadata.extend(documents['document_metadata'])
+        print(f"Completed chunking {len(documents_content)} documents.")
+        return {
+            'documents_content': documents_content,
+            'document_metadata': document_metadata
+        }
+
+    def get_embedding_cache(self):
+        """
+        Open the disk cache of embeddings keyed by content hash.
+        :return: the DiskCache, or None if the cache is disabled.
+        """
+        if self.embedding_cache is None and self.embedding_cache_path is not None:
+            self.embedding_cache = DiskCache(path=self.embedding_cache_path)
+        return self.embedding_cache
+
+    def create_embedding(self, documents: List, embedding_model='all-MiniLM-L6-v2', batch_size=None, use_cache=True):
+        """
+        A function that creates the embeddings of a list of documents. Documents already in the embedding cache (or
+        repeated in the list) are not encoded again, the rest are encoded by the model in batches.
+        :param documents: List of document texts.
+        :param embedding_model: the name of the sentence transformer model.
+        :param batch_size: the number of documents encoded at a time. Defaults to the batch_size of the class.
+        :param use_cache: look up and store embeddings in the embedding cache.
+        :return: float32 numpy array with one row per document.
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+        embedding_cache = self.get_embedding_cache() if use_cache else None
+
+        keys = [get_content_hash(document, embedding_model) for document in documents]
+        unique_keys = list(dict.fromkeys(keys))
+        vectors = {}
+        if embedding_cache is not None:
+            for key, value in embedding_cache.get_many(unique_keys).items():
+                vectors[key] = np.frombuffer(value, dtype=np.float32)
+
+        # encode each document that is not cached once, in batches.
+        key_to_document = dict(zip(keys, documents))
+        missing_keys = [key for key in unique_keys if key not in vectors]
+        if missing_keys:
+            model = get_embedding_model(embedding_model)
+            print(f"Creating embeddings for {len(missing_keys)} of {len(documents)} documents "
+                  f"({len(unique_keys) - len(missing_keys)} unique documents found in the cache).")
+            encoded = model.encode(
+                [key_to_document[key] for key in missing_keys],
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            ).astype(np.float32)
+            new_vectors = dict(zip(missing_keys, encoded))
+            vectors.update(new_vectors)
+            if embedding_cache is not None:
+                embedding_cache.set_many({key: vector.tobytes() for key, vector in new_vectors.items()})
 
-        embeddings = []
-        for document in documents:
-            doc_vector = model.encode(document)
-            embeddings.append(doc_vector)
         print("Finished creating embeddings.")
-        return embeddings
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
 
+    def create_embedding_store(self, documents: List, store_path, metadata: List = None, ids: List = None,
+                               embedding_model='all-MiniLM-L6-v2', dtype='float32', block_size=10000):
+        """
+        A function that creates the embeddings of a list of documents straight into an on-disk EmbeddingStore, one
+        block of documents at a time, so the whole embedding matrix is never held in memory.
+        :param documents: List of document texts.
+        :param store_path: the folder of the store.
+        :param metadata: the metadata dict of each document. The document text is added to it.
+        :param ids: the id of each document. Defaults to the content hash of the document.
+        :param embedding_model: the name of the sentence transformer model.
+        :param dtype: 'float32' or 'float16'.
+        :param block_size: the number of documents embedded and written at a time.
+        :return: the opened EmbeddingStore.
+        """
+        if ids is None:
+            ids = [get_content_hash(document, embedding_model) for document in documents]
+        if metadata is None:
+            metadata = [{} for _ in documents]
 
-    def embeddings_from_file(file_path, file_type, return_dict=False):
-        collection = get_collection_from_file(
+        writer = None
+        for start in range(0, len(documents), block_size):
+            block_documents = documents[start:start + block_size]
+            block_embeddings = self.create_embedding(block_documents, embedding_model=embedding_model)
+            if writer is None:
+                writer = EmbeddingStoreWriter(
+                    store_path, dim=block_embeddings.shape[1], dtype=dtype, embedding_model=embedding_model
+                )
+            block_metadata = [
+                dict(metadata[start + i], text=document) for i, document in enumerate(block_documents)
+            ]
+            writer.append(block_embeddings, ids=ids[start:start + block_size], metadata=block_metadata)
+
+        assert writer is not None, "No documents to create an embedding store from."
+        return writer.close()
+
+    def embeddings_from_file(self, file_path, file_type, return_dict=False, store_path=None, store_dtype='float32'):
+        """
+        A function that loads a file, chunks it into documents and creates their embeddings.
+        :param file_path: the path of the file.
+        :param file_type: one of 'txt', 'pdf' or 'csv'.
+        :param return_dict: return a dict of document text to embedding instead of the embedding matrix.
+        :param store_path: write the embeddings to an on-disk EmbeddingStore in this folder and return it instead.
+        :param store_dtype: 'float32' or 'float16' for the store.
+        :return: the embeddings, the dict of document text to embedding, or the EmbeddingStore.
+        """
+        collection = self.get_collection_from_file(
             file_path=file_path,
             file_type=file_type
         )
-        documents, metadata = create_documents(collection=collection)
-        embeddings = create_embedding(documents)
+        documents = self.create_documents(collection=collection)
+        documents_content = documents['documents_content']
+
+        if store_path is not None:
+            return self.create_embedding_store(
+                documents_content,
+                store_path=store_path,
+                metadata=documents['document_metadata'],
+                dtype=store_dtype
+            )
+
+        embeddings = self.create_embedding(documents_content)
 
         if return_dict:
-            assert len(documents) == len(embeddings)
+            assert len(documents_content) == len(embeddings)
             output_dict = {}
             for i in range(0, len(embeddings)):
-                doc = documents[i]
+                doc = documents_content[i]
                 vector = embeddings[i]
                 output_dict[doc] = vector
             return output_dict
@@ -0,0 +1,182 @@
+"""
+Docstring
+---------
+An on-disk embedding store that evaluation workers can open without loading the embeddings into memory. A store is a
+folder with:
+    vectors.bin           the embedding matrix, rows of float32 (or float16) values, opened as a read-only memory map.
+    ids.npy               the id of each row, the row number is its offset in the matrix.
+    metadata.jsonl        one json line of metadata per row (e.g. the document text and its source).
+    metadata_offsets.npy  the byte offset of each metadata line, so single rows can be read without parsing the file.
+    store.json            the manifest with the dtype, dimension, number of rows and embedding model.
+Several processes opening the same store share the pages of the memory map, nothing is copied.
+"""
+import json
+import os
+import numpy as np
+
+
+VECTORS_FILE = 'vectors.bin'
+IDS_FILE = 'ids.npy'
+METADATA_FILE = 'metadata.jsonl'
+METADATA_OFFSETS_FILE = 'metadata_offsets.npy'
+MANIFEST_FILE = 'store.json'
+
+
+class EmbeddingStoreWriter:
+
+    def __init__(self, path, dim, dtype='float32', embedding_model=None):
+        """
+        Writer that appends embeddings to a new store in blocks, so the whole matrix never has to be in memory.
+        :param path: the folder of the store. It is created if it does not exist and any store in it is replaced.
+        :param dim: the dimension of the embeddings.
+        :param dtype: 'float32', or 'float16' to halve the size of the store.
+        :param embedding_model: the name of the model that created the embeddings, recorded in the manifest.
+        """
+        assert dtype in ['float32', 'float16'], f"Unsupported embedding store dtype '{dtype}'."
+        self.path = path
+        self.dim = dim
+        self.dtype = dtype
+        self.embedding_model = embedding_model
+        self.ids = []
+        self.metadata_offsets = []
+        self.count = 0
+
+        os.makedirs(path, exist_ok=True)
+        # the manifest is written last, so a store without one is known to be incomplete.
+        if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            os.remove(os.path.join(path, MANIFEST_FILE))
+        self.__vectors_file = open(os.path.join(path, VECTORS_FILE), 'wb')
+        self.__metadata_file = open(os.path.join(path, METADATA_FILE), 'wb')
+
+    def append(self, embeddings, ids: list, metadata: list = None):
+        """
+        Append a block of embeddings to the store.
+        :param embeddings: array of shape (n, dim).
+        :param ids: the id of each embedding.
+        :param metadata: the metadata dict of each embedding.
+        """
+        embeddings = np.asarray(embeddings)
+        assert embeddings.ndim == 2 and embeddings.shape[1] == self.dim, \
+            f"Expected embeddings of shape (n, {self.dim}), got {embeddings.shape}."
+        assert len(ids) == len(embeddings), "There must be one id per embedding."
+        if metadata is None:
+            metadata = [{}] * len(ids)
+
+        self.__vectors_file.write(np.ascontiguousarray(embeddings, dtype=self.dtype).tobytes())
+        for row_metadata in metadata:
+            self.metadata_offsets.append(self.__metadata_file.tell())
+            self.__metadata_file.write(json.dumps(row_metadata).encode('utf-8') + b'\n')
+        self.ids.extend(str(row_id) for row_id in ids)
+        self.count += len(ids)
+
+    def close(self):
+        """
+        Finish the store by writing the index and the manifest.
+        :return: the EmbeddingStore opened on the finished store.
+        """
+        self.__vectors_file.close()
+        self.__metadata_file.close()
+        np.save(os.path.join(self.path, IDS_FILE), np.array(self.ids, dtype=str))
+        np.save(os.path.join(self.path, METADATA_OFFSETS_FILE), np.array(self.metadata_offsets, dtype=np.int64))
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w') as f:
+            json.dump({
+                'count': self.count,
+                'dim': self.dim,
+                'dtype': self.dtype,
+                'embedding_model': self.embedding_model
+            }, f, indent=4)
+        return EmbeddingStore(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.__vectors_file.close()
+            self.__metadata_file.close()
+
+
+class EmbeddingStore:
+
+    def __init__(self, path):
+        """
+        Open an embedding store read-only. The embeddings are memory mapped, not loaded.
+        :param path: the folder of the store.
+        """
+        self.path = path
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        assert os.path.exists(manifest_path), f"No finished embedding store at {path}."
+        with open(manifest_path, 'r') as f:
+            self.manifest = json.load(f)
+
+        self.count = self.manifest['count']
+        self.dim = self.manifest['dim']
+        self.dtype = self.manifest['dtype']
+        self.embedding_model = self.manifest['embedding_model']
+
+        if self.count > 0:
+            self.vectors = np.memmap(
+                os.path.join(path, VECTORS_FILE), dtype=self.dtype, mode='r', shape=(self.count, self.dim)
+            )
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=self.dtype)
+        self.ids = np.load(os.path.join(path, IDS_FILE), mmap_mode='r')
+        self.metadata_offsets = np.load(os.path.join(path, METADATA_OFFSETS_FILE), mmap_mode='r')
+        self.__id_to_row = None  # built on first lookup by id.
+
+    @classmethod
+    def create(cls, path, embeddings, ids: list, metadata: list = None, dtype='float32', embedding_model=None):
+        """
+        Write a new store from embeddings already in memory.
+        :return: the opened EmbeddingStore.
+        """
+        embeddings = np.asarray(embeddings)
+        with EmbeddingStoreWriter(path, dim=embeddings.shape[1], dtype=dtype,
+                                  embedding_model=embedding_model) as writer:
+            writer.append(embeddings, ids=ids, metadata=metadata)
+        return cls(path)
+
+    def __len__(self):
+        return self.count
+
+    def get_rows(self, ids):
+        """
+        :param ids: List of ids.
+        :return: numpy array with the row of each id.
+        """
+        if self.__id_to_row is None:
+            self.__id_to_row = {row_id: row for row, row_id in enumerate(self.ids.tolist())}
+        return np.array([self.__id_to_row[str(row_id)] for row_id in ids], dtype=np.int64)
+
+    def get_embeddings(self, ids=None, rows=None, dtype=np.float32):
+        """
+        Get embeddings by id or by row, as a copy in the requested dtype. Use the vectors attribute directly for
+        zero-copy access to the whole matrix.
+        :param ids: the ids of the embeddings.
+        :param rows: the rows of the embeddings, used if ids is None.
+        :param dtype: the dtype of the returned array.
+        :return: numpy array of shape (n, dim).
+        """
+        if ids is not None:
+            rows = self.get_rows(ids)
+        return np.asarray(self.vectors[rows], dtype=dtype)
+
+    def get_metadata(self, row):
+        """
+        Read the metadata of one row.
+        :param row: the row number.
+        :return: the metadata dict.
+        """
+        with open(os.path.join(self.path, METADATA_FILE), 'rb') as f:
+            f.seek(int(self.metadata_offsets[row]))
+            return json.loads(f.readline())
+
+    def iter_metadata(self):
+        """
+        Iterate over the metadata of every row in order.
+        """
+        with open(os.path.join(self.path, METADATA_FILE), 'rb') as f:
+            for line in f:
+                yield json.loads(line)
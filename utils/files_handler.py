@@ -1,11 +1,53 @@
 import pandas as pd
+import pyarrow.parquet as pq
 import chardet
 import yaml
 import os
 import json
+import copy
+import tempfile
+import threading
+from dotenv import load_dotenv
 from utils.timestamps import get_stamp
 
 
+# parsed config files by path, with the modification time and size they were parsed at, shared by every FileHandler
+# in the process so connectors and scripts do not parse the same yaml again.
+_config_cache = {}
+_config_cache_lock = threading.Lock()
+_environment_loaded = False
+
+
+def load_environment():
+    """
+    Load the .env file into the environment variables once per process. Later calls do nothing, so connectors can
+    call it on every instantiation.
+    """
+    global _environment_loaded
+    if not _environment_loaded:
+        load_dotenv()
+        _environment_loaded = True
+
+
+def read_config_file(config_path):
+    """
+    Parse a yaml config file, reusing the parsed config while the file is unchanged.
+    :param config_path: the path of the config file.
+    :return: a copy of the parsed config, safe for the caller to modify.
+    """
+    stat = os.stat(config_path)
+    cache_key = os.path.abspath(config_path)
+    with _config_cache_lock:
+        cached = _config_cache.get(cache_key)
+    if cached is None or cached['mtime_ns'] != stat.st_mtime_ns or cached['size'] != stat.st_size:
+        with open(config_path, 'r') as file:
+            config = yaml.safe_load(file)
+        cached = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'config': config}
+        with _config_cache_lock:
+            _config_cache[cache_key] = cached
+    return copy.deepcopy(cached['config'])
+
+
 class FileHandler:
     def __init__(self):
 
@@ -23,20 +65,98 @@ class FileHandler:
         self.data = pd.DataFrame()
         self.data_input_folder_path = 'data/input/'
         self.data_output_folder_path = 'data/output/'
+        self.checkpoints_folder_path = 'data/output/checkpoints/'
         self.config_folder_path = 'configs/'
+
+        # attributes for file encoding detection.
+        self.encoding_sample_bytes = 1024 * 1024
+        self.encoding_confidence_threshold = 0.9
+        self.encoding_cache_path = 'data/cache/file_encodings.json'
         self.elasticsearch_config_file_path = 'configs/elasticsearch_config.yaml'
 
-    @staticmethod
-    def __get_file_encoding(file_path):
+    def __get_file_encoding(self, file_path, full_scan=False):
         """
         Function to identify the encoding of the file so that it can be used to read the file for further processing.
+        The encoding is detected from a sample of the start of the file, falling back to a scan of the whole file if
+        the sample is not conclusive. Detected encodings are kept in a sidecar cache keyed by the file path, size and
+        modification time, so loading an unchanged file again skips detection.
         :param file_path: name of the file to be read. This by default should sit in the data/input folder.
+        :param full_scan: detect the encoding from the whole file, ignoring the cache.
         :return: the encoding scheme of the file
         """
+        stat = os.stat(file_path)
+        cache_key = os.path.abspath(file_path)
+        encoding_cache = self.__load_encoding_cache()
+        cached = encoding_cache.get(cache_key)
+        if not full_scan and cached is not None and cached['size'] == stat.st_size \
+                and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['encoding']
+
+        encoding = self.__detect_encoding(file_path, full_scan=full_scan)
 
+        encoding_cache[cache_key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'encoding': encoding}
+        self.__save_encoding_cache(encoding_cache)
+        return encoding
+
+    def __detect_encoding(self, file_path, full_scan=False):
+        """
+        Feed the file to the chardet detector in blocks, stopping after encoding_sample_bytes unless full_scan is set.
+        The sample result is only used if its confidence is at least encoding_confidence_threshold.
+        :param file_path: the path of the file.
+        :param full_scan: feed the whole file to the detector.
+        :return: the encoding scheme of the file
+        """
+        detector = chardet.UniversalDetector()
+        bytes_read = 0
+        # only a result over the whole file is used without checking its confidence.
+        reached_end = False
         with open(file_path, 'rb') as f:
-            result = chardet.detect(f.read())
+            for block in iter(lambda: f.read(64 * 1024), b''):
+                detector.feed(block)
+                bytes_read += len(block)
+                if detector.done:
+                    break
+                if not full_scan and bytes_read >= self.encoding_sample_bytes:
+                    reached_end = f.read(1) == b''
+                    break
+            else:
+                reached_end = True
+        result = detector.close()
+
+        if full_scan or reached_end:
+            return result['encoding']
+        if result['encoding'] == 'ascii':
+            # an ascii sample says nothing about the rest of the file, utf-8 reads ascii and most modern files.
+            return 'utf-8'
+        if result['encoding'] is not None and result['confidence'] >= self.encoding_confidence_threshold:
             return result['encoding']
+        return self.__detect_encoding(file_path, full_scan=True)
+
+    def __load_encoding_cache(self):
+        if not os.path.exists(self.encoding_cache_path):
+            return {}
+        try:
+            with open(self.encoding_cache_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # a damaged cache only costs a new detection.
+            return {}
+
+    def __save_encoding_cache(self, encoding_cache):
+        folder = os.path.dirname(self.encoding_cache_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # a uniquely named temporary file per write, so handlers saving at the same time never share one.
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.encoding_cache_path) + '.', suffix='.tmp',
+                                         dir=folder or '.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(encoding_cache, f, indent=4)
+            os.replace(temp_path, self.encoding_cache_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
 
     def get_prompt_from_file(self, file_name):
         """
@@ -86,19 +206,18 @@ class FileHandler:
         """
         assert '.csv' in file_name, ("The file is not of extension .csv. Please ensure it is, or include the extension"
                                      "in the argument.")
+        # set file path, looking in the output folder if the file is not an input.
+        file_path = self.data_input_folder_path + file_name
+        if not os.path.exists(file_path):
+            file_path = self.data_output_folder_path + file_name
+        # get the file encoding so it can read correctly.
+        file_encoding = self.__get_file_encoding(file_path)
         try:
-            # set file path
-            file_path = self.data_input_folder_path + file_name
-            # get the file encoding so it can read correctly.
-            file_encoding = self.__get_file_encoding(file_path)
             # read the file
             df = pd.read_csv(file_path, encoding=file_encoding)
-        except FileNotFoundError:
-            # set file path
-            file_path = self.data_output_folder_path + file_name
-            # get the file encoding so it can read correctly.
-            file_encoding = self.__get_file_encoding(file_path)
-            # read the file
+        except UnicodeDecodeError:
+            # the sampled encoding did not hold for the whole file, detect it again from all of it.
+            file_encoding = self.__get_file_encoding(file_path, full_scan=True)
             df = pd.read_csv(file_path, encoding=file_encoding)
 
         self.data = df
@@ -112,15 +231,103 @@ class FileHandler:
         :return: a pandas DataFrame of the tabular data.
         """
 
-        stamp = get_stamp()
-        # make sure the .csv extension is not being appended to.
-        if '.csv' in file_name:
-            file_name = file_name.replace('.csv', '')
+        file_path = self.get_output_file_path(file_name)
+        df.to_csv(file_path, encoding='UTF-8', index=False)
+
+    def get_output_file_path(self, file_name, extension='.csv', stamp=None):
+        """
+        Build the timestamped path of an output file in the designated data output folder.
+        :param file_name: the name of the output file.
+        :param extension: the extension of the output file.
+        :param stamp: the timestamp to use. Defaults to the current time.
+        :return: the output file path.
+        """
+        if stamp is None:
+            stamp = get_stamp()
+        # make sure the extension is not being appended to.
+        if extension in file_name:
+            file_name = file_name.replace(extension, '')
 
         file_name = file_name + '_' + stamp
-        file_name = file_name + '.csv'
-        file_path = self.data_output_folder_path + file_name
-        df.to_csv(file_path, encoding='UTF-8', index=False)
+        file_name = file_name + extension
+        return self.data_output_folder_path + file_name
+
+    @staticmethod
+    def append_df_to_csv(df, file_path):
+        """
+        Append the rows of a pandas DataFrame to a csv file, writing the header only if the file is new or empty. The
+        rows are flushed to disk before returning so that they survive a crash.
+        :param df: the pandas DataFrame to append.
+        :param file_path: the path of the csv file.
+        :return: the size of the file in bytes after the rows are appended.
+        """
+        write_header = not os.path.exists(file_path) or os.path.getsize(file_path) == 0
+        with open(file_path, 'a', encoding='UTF-8', newline='') as f:
+            df.to_csv(f, header=write_header, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        return os.path.getsize(file_path)
+
+    @staticmethod
+    def write_parquet_part(table, folder_path, part_index):
+        """
+        Write an Arrow table as the next part file of a parquet output folder. The part is written to a temporary file
+        and renamed into place, so a crash never leaves a partly written part.
+        :param table: the pyarrow Table to write.
+        :param folder_path: the parquet output folder.
+        :param part_index: the index of the part, used to order the parts.
+        :return: the path of the part file.
+        """
+        os.makedirs(folder_path, exist_ok=True)
+        part_path = os.path.join(folder_path, f'part-{part_index:05d}.parquet')
+        temp_path = part_path + '.tmp'
+        pq.write_table(table, temp_path)
+        os.replace(temp_path, part_path)
+        return part_path
+
+    @staticmethod
+    def remove_parquet_parts(folder_path, from_index):
+        """
+        Remove the part files of a parquet output folder from a part index onwards, for instance the parts written
+        after the last checkpoint of an interrupted run.
+        :param folder_path: the parquet output folder.
+        :param from_index: the first part index to remove.
+        """
+        if not os.path.exists(folder_path):
+            return
+        for name in os.listdir(folder_path):
+            if not name.startswith('part-'):
+                continue
+            if name.endswith('.tmp') or int(name[len('part-'):].split('.')[0]) >= from_index:
+                os.remove(os.path.join(folder_path, name))
+
+    def save_checkpoint(self, checkpoint: dict, checkpoint_name):
+        """
+        Save a checkpoint manifest as json in the checkpoints folder. The file is replaced atomically so a crash never
+        leaves a partly written manifest.
+        :param checkpoint: the checkpoint manifest.
+        :param checkpoint_name: the name of the checkpoint.
+        """
+        os.makedirs(self.checkpoints_folder_path, exist_ok=True)
+        checkpoint_path = self.checkpoints_folder_path + checkpoint_name + '.json'
+        temp_path = checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(checkpoint, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, checkpoint_path)
+
+    def load_checkpoint(self, checkpoint_name):
+        """
+        Load a checkpoint manifest from the checkpoints folder.
+        :param checkpoint_name: the name of the checkpoint.
+        :return: the checkpoint manifest, or None if there is no checkpoint with this name.
+        """
+        checkpoint_path = self.checkpoints_folder_path + checkpoint_name + '.json'
+        if not os.path.exists(checkpoint_path):
+            return None
+        with open(checkpoint_path, 'r') as f:
+            return json.load(f)
 
     def save_to_json(self, data: [str, dict], file_name):
         """
@@ -163,14 +370,12 @@ class FileHandler:
 
         try:
             # get the configs with relative to example_main.py script.
-            with open(config, 'r') as file:
-                self.config = yaml.safe_load(file)
+            self.config = read_config_file(config)
 
         except FileNotFoundError:
             # get file based on the path provided from .env file.
             config_path = os.environ['CONFIG_PATH']
-            with open(config_path, 'r') as file:
-                self.config = yaml.safe_load(file)
+            self.config = read_config_file(config_path)
 
     def write_config(self, config, config_file_name='models_config.yaml'):
         # get the correct file.
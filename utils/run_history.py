@@ -0,0 +1,162 @@
+"""
+Docstring
+---------
+Columnar (Parquet/Arrow) storage of discovery test outputs. The top 3 returned FAQs are kept as a typed nested column
+(a list of title/confidence structs) instead of a stringified dict, and every run can be appended to a run history
+dataset partitioned by run timestamp, so trends across runs can be queried with predicate pushdown instead of loading
+every output file.
+"""
+import ast
+import math
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+TOP_3_COLUMN = 'Top 3 returned FAQ with Confidence Scores'
+
+TOP_3_TYPE = pa.list_(pa.struct([('title', pa.string()), ('confidence', pa.float64())]))
+
+DISCOVERY_OUTPUT_SCHEMA = pa.schema([
+    ('User Input', pa.string()),
+    ('Correct FAQ', pa.string()),
+    ('Actual FAQ returned (Top result)', pa.string()),
+    ('Correct FAQ in top 3', pa.string()),
+    (TOP_3_COLUMN, TOP_3_TYPE),
+    ('Associated URL', pa.string())
+])
+
+RUN_PARTITIONING = ds.partitioning(pa.schema([('run_stamp', pa.string())]), flavor='hive')
+
+
+class NanToNone(ast.NodeTransformer):
+    """Replace the bare 'nan' names that str() writes for missing confidences by None, so literal_eval accepts them."""
+
+    def visit_Name(self, node):
+        if node.id == 'nan':
+            return ast.copy_location(ast.Constant(value=None), node)
+        return node
+
+
+def top_3_to_records(top_3):
+    """
+    Convert the top 3 titles with confidence scores of one row to a list of title/confidence records.
+    :param top_3: dict of title to confidence, its string form as saved in a csv output, or an error message.
+    :return: List of {'title', 'confidence'} dicts, or None for rows that errored.
+    """
+    if isinstance(top_3, str):
+        if not top_3.startswith('{'):
+            return None
+        try:
+            top_3 = ast.literal_eval(NanToNone().visit(ast.parse(top_3, mode='eval')))
+        except (ValueError, SyntaxError):
+            return None
+    if not isinstance(top_3, dict):
+        return None
+    # missing confidences are stored as nulls.
+    return [{'title': title, 'confidence': None if confidence is None or math.isnan(confidence) else confidence}
+            for title, confidence in top_3.items()]
+
+
+def discovery_output_to_table(df):
+    """
+    Convert a discovery test output DataFrame to an Arrow table with the typed output schema.
+    :param df: the output DataFrame, with the top 3 column as dicts (or their string form).
+    :return: pyarrow Table.
+    """
+    columns = {}
+    for field in DISCOVERY_OUTPUT_SCHEMA:
+        if field.name == TOP_3_COLUMN:
+            columns[field.name] = pa.array([top_3_to_records(top_3) for top_3 in df[field.name]], type=TOP_3_TYPE)
+        else:
+            # cast through object so that missing values become nulls and anything else a string.
+            values = [None if pd.isna(value) else str(value) for value in df[field.name]]
+            columns[field.name] = pa.array(values, type=pa.string())
+    return pa.table(columns, schema=DISCOVERY_OUTPUT_SCHEMA)
+
+
+class RunHistoryStore:
+
+    def __init__(self, root_path='data/run_history/'):
+        """
+        Run history store class. Runs are stored as Parquet files in a dataset partitioned by run timestamp:
+        <root_path>/run_stamp=<stamp>/<run_name>-0.parquet
+        :param root_path: the folder of the dataset.
+        """
+        self.root_path = root_path
+
+    def append_run(self, table, run_stamp, run_name):
+        """
+        Append the output of a run to the history.
+        :param table: the run output as a pyarrow Table (or a DataFrame with the discovery output columns).
+        :param run_stamp: the timestamp of the run, from utils.timestamps.get_stamp.
+        :param run_name: the name of the run, for instance the output file name.
+        """
+        if isinstance(table, pd.DataFrame):
+            table = discovery_output_to_table(table)
+        table = table.append_column('run_stamp', pa.array([run_stamp] * table.num_rows, type=pa.string()))
+        os.makedirs(self.root_path, exist_ok=True)
+        ds.write_dataset(
+            table,
+            self.root_path,
+            format='parquet',
+            partitioning=RUN_PARTITIONING,
+            basename_template=run_name + '-{i}.parquet',
+            existing_data_behavior='overwrite_or_ignore'
+        )
+
+    def get_dataset(self):
+        """
+        :return: the pyarrow Dataset over every run in the history.
+        """
+        return ds.dataset(self.root_path, format='parquet', partitioning=RUN_PARTITIONING)
+
+    def list_runs(self):
+        """
+        :return: sorted List of the run timestamps in the history.
+        """
+        if not os.path.exists(self.root_path):
+            return []
+        prefix = 'run_stamp='
+        return sorted(name[len(prefix):] for name in os.listdir(self.root_path) if name.startswith(prefix))
+
+    def load(self, columns=None, filter=None, since=None, until=None):
+        """
+        Load rows from the history. Only the partitions and row groups matching the filters are read.
+        :param columns: the columns to read. All columns if None.
+        :param filter: a pyarrow.dataset expression, for instance ds.field('Correct FAQ in top 3') == 'N'.
+        :param since: only load runs with a timestamp at or after this one.
+        :param until: only load runs with a timestamp at or before this one.
+        :return: pandas DataFrame.
+        """
+        expression = filter
+        for bound in [ds.field('run_stamp') >= since if since is not None else None,
+                      ds.field('run_stamp') <= until if until is not None else None]:
+            if bound is not None:
+                expression = bound if expression is None else expression & bound
+        return self.get_dataset().to_table(columns=columns, filter=expression).to_pandas()
+
+    def get_accuracy_trend(self, since=None, until=None):
+        """
+        The share of user inputs with the correct FAQ in the top 3 for each run.
+        :return: pandas DataFrame with a row per run.
+        """
+        df = self.load(columns=['run_stamp', 'Correct FAQ in top 3'], since=since, until=until)
+        df['correct'] = df['Correct FAQ in top 3'] == 'Y'
+        df['error'] = df['Correct FAQ in top 3'].str.startswith('ERROR')
+        return df.groupby('run_stamp').agg(
+            user_inputs=('correct', 'size'),
+            top_3_accuracy=('correct', 'mean'),
+            errors=('error', 'sum')
+        ).reset_index()
+
+
+def read_parquet_output(path):
+    """
+    Read a parquet discovery test output, either a single file or a folder of part files.
+    :param path: the path of the output.
+    :return: pyarrow Table.
+    """
+    return pq.read_table(path, schema=DISCOVERY_OUTPUT_SCHEMA)
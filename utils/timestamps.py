@@ -1,6 +1,8 @@
 from datetime import datetime
+import os
 import time
 from functools import wraps
+from utils.tracing import tracer
 
 def get_stamp():
     now = str(datetime.now())
@@ -9,16 +11,18 @@ def get_stamp():
 
 def log_time(func):
     """
-    A decorator that logs the time taken to execute a function.
+    A decorator that logs the time taken to execute a function. The call is also recorded as a span of the tracer.
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
         start_time = time.time()
-        result = func(*args, **kwargs)
+        with tracer.span(func.__name__):
+            result = func(*args, **kwargs)
         end_time = time.time()
         time_taken = (end_time - start_time)/60
         msg = f"{func.__name__} executed in {time_taken:.3f} minutes."
         print(msg)
+        os.makedirs('logs', exist_ok=True)
         with open(f'logs/logs.txt', 'a') as f:
             f.write('\n' + get_stamp() + ', ' + msg)
 
@@ -0,0 +1,285 @@
+"""
+Docstring
+---------
+Lightweight tracing of the test pipeline. Code is wrapped in named spans:
+    with tracer.span('discovery.query') as span:
+        response = ...
+        span.add_bytes(response_size)
+Every span name gets an HDR-style latency histogram (log-linear buckets with a bounded relative error, so p50/p95/p99
+stay accurate over microseconds to minutes at a fixed memory cost), a count, the throughput over the time the span was
+active, and the payload bytes recorded on it. Spans can be exported as JSON lines, followed by a summary line per span
+name, to compare where the time of a run goes (search service, json parsing, scoring or writing output).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+
+    # values below 2 ** SUB_BUCKET_BITS microseconds are counted exactly, larger values in buckets of at most 1/64
+    # of their value.
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        """
+        Latency histogram class. Latencies are recorded in microseconds into log-linear buckets.
+        """
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def get_bucket(cls, value):
+        """
+        :param value: a latency in whole microseconds.
+        :return: the bucket index of the value.
+        """
+        sub_buckets = 1 << cls.SUB_BUCKET_BITS
+        if value < sub_buckets:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        half = sub_buckets >> 1
+        return sub_buckets + (shift - 1) * half + (value >> shift) - half
+
+    @classmethod
+    def get_bucket_range(cls, bucket):
+        """
+        :param bucket: a bucket index.
+        :return: the lowest and highest microsecond values counted in the bucket.
+        """
+        sub_buckets = 1 << cls.SUB_BUCKET_BITS
+        if bucket < sub_buckets:
+            return bucket, bucket
+        half = sub_buckets >> 1
+        shift = (bucket - sub_buckets) // half + 1
+        lowest = ((bucket - sub_buckets) % half + half) << shift
+        return lowest, lowest + (1 << shift) - 1
+
+    def record(self, seconds):
+        """
+        Record a latency.
+        :param seconds: the latency in seconds.
+        """
+        value = max(0, int(seconds * 1e6))
+        bucket = self.get_bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram to this one.
+        """
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percentile):
+        """
+        :param percentile: the percentile, from 0 to 100.
+        :return: the latency in seconds at or below which the given percentage of the recorded latencies fall, or
+        None if nothing was recorded.
+        """
+        if self.count == 0:
+            return None
+        target = max(1, int(round(percentile / 100 * self.count)))
+        cumulative = 0
+        for bucket in sorted(self.counts):
+            cumulative += self.counts[bucket]
+            if cumulative >= target:
+                # report the highest value of the bucket, but never more than the largest value recorded.
+                return min(self.get_bucket_range(bucket)[1], self.max) / 1e6
+        return self.max / 1e6
+
+    def mean(self):
+        """
+        :return: the mean latency in seconds, or None if nothing was recorded.
+        """
+        return self.total / self.count / 1e6 if self.count else None
+
+
+class Span:
+
+    def __init__(self, name, attributes=None):
+        """
+        A timed section of code. Use Tracer.span rather than creating spans directly.
+        :param name: the name of the span, latencies are aggregated per name.
+        :param attributes: extra values exported with the span.
+        """
+        self.name = name
+        self.attributes = dict(attributes) if attributes else {}
+        self.bytes = None
+        self.start = None
+        self.duration = None
+        self.error = None
+
+    def add_bytes(self, n_bytes):
+        """Record the size of a payload handled in the span, for instance a response body."""
+        if n_bytes is not None:
+            self.bytes = (self.bytes or 0) + int(n_bytes)
+
+    def set(self, key, value):
+        """Set an attribute exported with the span."""
+        self.attributes[key] = value
+
+
+class SpanStats:
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.errors = 0
+        self.bytes = 0
+        self.spans_with_bytes = 0
+        self.first_start = None
+        self.last_end = None
+
+
+class Tracer:
+
+    def __init__(self, enabled=True, keep_spans=False):
+        """
+        Tracer class. It is safe to open spans from several threads at once.
+        :param enabled: record spans. A disabled tracer still runs the wrapped code, without timing it.
+        :param keep_spans: keep every finished span for export_jsonl, not only the aggregated statistics. Memory grows
+        with every span, so only keep them when the spans are exported.
+        """
+        self.enabled = enabled
+        self.keep_spans = keep_spans
+        self.stats = {}
+        self.spans = []
+        self.__lock = threading.Lock()
+
+    def reset(self):
+        """
+        Drop every recorded span and statistic, for instance at the start of a run.
+        """
+        with self.__lock:
+            self.stats = {}
+            self.spans = []
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Time the code in a with block.
+        :param name: the name of the span, e.g. 'discovery.query'.
+        :param attributes: extra values exported with the span.
+        :return: the Span, to record payload bytes or attributes on.
+        """
+        span = Span(name, attributes)
+        if not self.enabled:
+            yield span
+            return
+
+        span.start = time.time()
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self.__finish(span)
+
+    def __finish(self, span):
+        end = span.start + span.duration
+        with self.__lock:
+            stats = self.stats.get(span.name)
+            if stats is None:
+                stats = self.stats[span.name] = SpanStats()
+            stats.histogram.record(span.duration)
+            if span.error is not None:
+                stats.errors += 1
+            if span.bytes is not None:
+                stats.bytes += span.bytes
+                stats.spans_with_bytes += 1
+            stats.first_start = span.start if stats.first_start is None else min(stats.first_start, span.start)
+            stats.last_end = end if stats.last_end is None else max(stats.last_end, end)
+            if self.keep_spans:
+                self.spans.append(span)
+
+    def summary(self):
+        """
+        :return: dict of span name to its statistics: count, errors, mean/p50/p95/p99/max latency in milliseconds,
+        throughput in spans per second over the time the span was active, and payload bytes.
+        """
+        def milliseconds(seconds):
+            return None if seconds is None else round(seconds * 1000, 3)
+
+        summary = {}
+        with self.__lock:
+            for name, stats in self.stats.items():
+                histogram = stats.histogram
+                active_seconds = stats.last_end - stats.first_start
+                summary[name] = {
+                    'count': histogram.count,
+                    'errors': stats.errors,
+                    'mean_ms': milliseconds(histogram.mean()),
+                    'p50_ms': milliseconds(histogram.percentile(50)),
+                    'p95_ms': milliseconds(histogram.percentile(95)),
+                    'p99_ms': milliseconds(histogram.percentile(99)),
+                    'max_ms': milliseconds(histogram.max / 1e6),
+                    'throughput_per_s': round(histogram.count / active_seconds, 3) if active_seconds > 0 else None,
+                    'total_bytes': stats.bytes if stats.spans_with_bytes else None,
+                    'mean_bytes': round(stats.bytes / stats.spans_with_bytes, 1) if stats.spans_with_bytes else None
+                }
+        return summary
+
+    def print_summary(self):
+        """
+        Print a table of the span statistics, slowest total time first.
+        """
+        summary = self.summary()
+        if not summary:
+            return
+        header = f"{'span':<28}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}" \
+                 f"{'per s':>10}{'mean bytes':>12}"
+        print(header)
+        for name, stats in sorted(summary.items(), key=lambda item: -item[1]['mean_ms'] * item[1]['count']):
+            mean_bytes = '' if stats['mean_bytes'] is None else f"{stats['mean_bytes']:.0f}"
+            throughput = '' if stats['throughput_per_s'] is None else f"{stats['throughput_per_s']:.1f}"
+            print(f"{name:<28}{stats['count']:>8}{stats['errors']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+                  f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}{throughput:>10}{mean_bytes:>12}")
+
+    def export_jsonl(self, path):
+        """
+        Write every kept span as a json line, followed by a summary line per span name.
+        :param path: the path of the file. Its folder is created if it does not exist.
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self.__lock:
+            spans = list(self.spans)
+        with open(path, 'w', encoding='utf-8') as f:
+            for span in spans:
+                record = {
+                    'type': 'span',
+                    'name': span.name,
+                    'start': span.start,
+                    'duration_ms': round(span.duration * 1000, 3),
+                }
+                if span.bytes is not None:
+                    record['bytes'] = span.bytes
+                if span.error is not None:
+                    record['error'] = span.error
+                if span.attributes:
+                    record['attributes'] = span.attributes
+                f.write(json.dumps(record, default=str) + '\n')
+            for name, stats in self.summary().items():
+                f.write(json.dumps({'type': 'summary', 'name': name, **stats}) + '\n')
+
+
+# the process-wide tracer used by the connectors and the test scripts.
+tracer = Tracer()